@@ -0,0 +1,120 @@
+"""Measure command latency through the daemon against cold ``main.py`` invocations.
+
+Usage: python benchmarks/bench_daemon.py [--requests 2000] [--cold-runs 10]
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from player import db  # noqa: E402
+from player.daemon import (  # noqa: E402
+    LATENCY_TARGET_P50_MS,
+    LATENCY_TARGET_P99_MS,
+    DaemonClient,
+    socket_path_for,
+)
+from player.library import add_audio_file, create_audiobook  # noqa: E402
+from player.models import PlaybackState  # noqa: E402
+from player.playback import PlaybackRepository  # noqa: E402
+
+MAIN = str(ROOT / "main.py")
+
+
+def prepare(path: Path, files: int) -> None:
+    connection = db.initialize_db(path)
+    book = create_audiobook(connection, "Benchmark")
+    audio_files = [
+        add_audio_file(connection, book.id, f"/bench/{index:03d}.mp3", 1800.0, index)
+        for index in range(files)
+    ]
+    PlaybackRepository(connection).upsert_state(
+        PlaybackState(book.id, audio_files[files // 2].id, 600.0)
+    )
+    connection.close()
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def time_processes(argv: list[str], runs: int) -> list[float]:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, MAIN, *argv], check=True, stdout=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def time_round_trips(client: DaemonClient, argv: list[str], requests: int) -> list[float]:
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = client.run(argv)
+        samples.append((time.perf_counter() - started) * 1000)
+        if response.exit_code:
+            raise RuntimeError(response.stderr)
+    return samples
+
+
+def report(name: str, samples: list[float]) -> None:
+    print(
+        f"{name:<34} {statistics.median(samples):>8.2f} {percentile(samples, 0.99):>8.2f}"
+        f" {len(samples):>6}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000, help="Socket round trips")
+    parser.add_argument("--cold-runs", type=int, default=10, help="Process launches per mode")
+    parser.add_argument("--files", type=int, default=40, help="Audio files in the test book")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = Path(directory, "bench.sqlite3")
+        prepare(database, args.files)
+        common = ["--db", str(database)]
+        resume = [*common, "resume", "1"]
+        global_position = [*common, "global-position", "1", str(args.files // 2 + 1), "600"]
+
+        print(f"{'mode':<34} {'p50 ms':>8} {'p99 ms':>8} {'runs':>6}")
+        report("cold process, resume", time_processes(["--no-daemon", *resume], args.cold_runs))
+
+        daemon = subprocess.Popen(
+            [sys.executable, MAIN, *common, "serve"], stdout=subprocess.PIPE, text=True
+        )
+        try:
+            daemon.stdout.readline()  # "Serving ..." once the socket is listening
+            report("process routed via daemon, resume", time_processes(resume, args.cold_runs))
+            with DaemonClient(socket_path_for(database)) as client:
+                resume_samples = time_round_trips(client, resume, args.requests)
+                global_samples = time_round_trips(client, global_position, args.requests)
+                client.shutdown()
+            report("socket round trip, resume", resume_samples)
+            report("socket round trip, global-position", global_samples)
+        finally:
+            daemon.wait(timeout=10)
+
+    samples = resume_samples + global_samples
+    p50, p99 = statistics.median(samples), percentile(samples, 0.99)
+    met = p50 <= LATENCY_TARGET_P50_MS and p99 <= LATENCY_TARGET_P99_MS
+    print(
+        f"target p50 <= {LATENCY_TARGET_P50_MS} ms, p99 <= {LATENCY_TARGET_P99_MS} ms:"
+        f" {'met' if met else 'MISSED'}"
+    )
+    raise SystemExit(0 if met else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Time core library, playback and transcript operations on a synthetic library.
+
+Usage:
+    python benchmarks/bench_suite.py [--profile small] [--output results.json]
+    python benchmarks/bench_suite.py --compare baseline.json [--tolerance 0.25]
+    python benchmarks/bench_suite.py --results new.json --compare baseline.json
+
+Results are JSON: run metadata plus one entry per metric with its value, unit and
+whether higher or lower is better. ``--compare`` exits with status 1 when any
+metric in the baseline is worse by more than ``--tolerance`` (a fraction of the
+baseline value). Baselines are machine specific, so record one on the machine
+that runs the comparison: run once with ``--output`` and keep that file.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.synthetic import PROFILES, LibrarySpec, cached_library  # noqa: E402
+from player import db  # noqa: E402
+from player.library import library_overview, list_audio_files, list_audiobooks  # noqa: E402
+from player.models import PlaybackState  # noqa: E402
+from player.playback import (  # noqa: E402
+    PlaybackRepository,
+    advance_position,
+    compute_global_position,
+)
+from player.transcript import find_segment_at_time  # noqa: E402
+
+RESULTS_VERSION = 1
+DEFAULT_TOLERANCE = 0.25
+MAIN = str(ROOT / "main.py")
+
+
+def metric(value: float, unit: str, higher_is_better: bool = False) -> dict:
+    return {"value": round(value, 4), "unit": unit, "higher_is_better": higher_is_better}
+
+
+def per_op_us(operation: Callable[[int], object], operations: int, repeats: int) -> float:
+    """Median over ``repeats`` runs of the mean microseconds per call of ``operation(i)``."""
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for index in range(operations):
+            operation(index)
+        samples.append((time.perf_counter() - started) / operations * 1e6)
+    return statistics.median(samples)
+
+
+def run_suite(path: Path, spec: LibrarySpec, operations: int, repeats: int, cold_runs: int):
+    rng = random.Random(spec.seed)
+    connection = db.connect(path)
+    metrics: dict[str, dict] = {}
+    try:
+        books = list_audiobooks(connection)
+        book_ids = [rng.choice(books).id for _ in range(operations)]
+        metrics["list_audiobooks_ms"] = metric(
+            per_op_us(lambda _: list_audiobooks(connection), 1, max(repeats, 5)) / 1000, "ms"
+        )
+        metrics["library_overview_page_ms"] = metric(
+            per_op_us(lambda _: library_overview(connection, 50), 1, max(repeats, 5)) / 1000, "ms"
+        )
+        metrics["list_audio_files_us"] = metric(
+            per_op_us(lambda i: list_audio_files(connection, book_ids[i]), operations, repeats),
+            "us",
+        )
+
+        # Book-sized inputs are loaded up front so these time the computation alone.
+        sampled = [list_audio_files(connection, book_id) for book_id in book_ids[:500]]
+        cases = []
+        for _ in range(operations):
+            files = rng.choice(sampled)
+            current = rng.choice(files)
+            position = rng.uniform(0, current.duration_seconds)
+            cases.append((files, current.id, position, rng.uniform(0, 3600)))
+        metrics["compute_global_position_us"] = metric(
+            per_op_us(
+                lambda i: compute_global_position(cases[i][0], cases[i][1], cases[i][2]),
+                operations,
+                repeats,
+            ),
+            "us",
+        )
+        metrics["advance_position_us"] = metric(
+            per_op_us(lambda i: advance_position(*cases[i]), operations, repeats), "us"
+        )
+
+        transcribed = [
+            (row["audio_file_id"], row["duration"])
+            for row in connection.execute(
+                """
+                SELECT audio_file_id, MAX(end_seconds) AS duration
+                FROM transcript_segments
+                GROUP BY audio_file_id
+                """
+            )
+        ]
+        lookups = []
+        for _ in range(operations):
+            audio_file_id, duration = rng.choice(transcribed)
+            lookups.append((audio_file_id, rng.uniform(0, duration)))
+        metrics["find_segment_at_time_us"] = metric(
+            per_op_us(lambda i: find_segment_at_time(connection, *lookups[i]), operations, repeats),
+            "us",
+        )
+        states = [
+            PlaybackState(book_ids[i], cases[i][1], cases[i][2]) for i in range(operations)
+        ]
+    finally:
+        connection.close()
+
+    # Writes go to a copy so the cached library stays as generated.
+    with tempfile.TemporaryDirectory() as directory:
+        copy = Path(directory, "writes.sqlite3")
+        shutil.copyfile(path, copy)
+        connection = db.connect(copy)
+        try:
+            repository = PlaybackRepository(connection)
+            seconds_per_op = per_op_us(
+                lambda i: repository.upsert_state(states[i]), operations, repeats
+            ) / 1e6
+        finally:
+            connection.close()
+    metrics["upsert_state_per_s"] = metric(1 / seconds_per_op, "ops/s", higher_is_better=True)
+
+    samples = []
+    for _ in range(cold_runs):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, MAIN, "--no-daemon", "--db", str(path), "resume", "1"],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        samples.append((time.perf_counter() - started) * 1000)
+    metrics["cli_cold_start_ms"] = metric(statistics.median(samples), "ms")
+    return metrics
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print each metric against the baseline and return the names that regressed."""
+    if results["profile"] != baseline["profile"]:
+        raise ValueError(
+            f"Baseline is for profile {baseline['profile']!r}, results for {results['profile']!r}"
+        )
+    regressions = []
+    print(f"{'metric':<28} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, expected in baseline["metrics"].items():
+        current = results["metrics"].get(name)
+        if current is None:
+            print(f"{name:<28} {expected['value']:>12.2f} {'missing':>12}")
+            regressions.append(name)
+            continue
+        change = current["value"] / expected["value"] - 1
+        worse = -change if expected["higher_is_better"] else change
+        flag = "  REGRESSED" if worse > tolerance else ""
+        print(
+            f"{name:<28} {expected['value']:>12.2f} {current['value']:>12.2f}"
+            f" {change:>+8.1%}{flag}"
+        )
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--seed", type=int, help="Override the profile's generator seed")
+    parser.add_argument("--cache-dir", help="Where generated libraries are kept between runs")
+    parser.add_argument("--operations", type=int, default=2000, help="Calls per timed run")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per metric")
+    parser.add_argument("--cold-runs", type=int, default=5, help="CLI launches to time")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--results", help="Compare an existing results file instead of running")
+    parser.add_argument("--compare", metavar="BASELINE", help="Fail on regressions against this")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.results:
+        results = json.loads(Path(args.results).read_text(encoding="utf-8"))
+    else:
+        spec = PROFILES[args.profile]
+        if args.seed is not None:
+            spec = LibrarySpec(**{**asdict(spec), "seed": args.seed})
+        started = time.perf_counter()
+        path = cached_library(spec, args.cache_dir)
+        print(f"Library {path} ready in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        results = {
+            "version": RESULTS_VERSION,
+            "profile": args.profile,
+            "spec": asdict(spec),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.platform(),
+            "metrics": run_suite(path, spec, args.operations, args.repeats, args.cold_runs),
+        }
+        if args.output:
+            Path(args.output).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+
+    if not args.compare:
+        json.dump(results["metrics"], sys.stdout, indent=2)
+        print()
+        return
+    baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        raise SystemExit(1)
+    print(f"No metric regressed beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
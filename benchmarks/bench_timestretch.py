@@ -0,0 +1,62 @@
+"""Benchmark the WSOLA time-stretcher against real time on a single core.
+
+Usage: python benchmarks/bench_timestretch.py [--seconds 60] [--speeds 0.5 1.5 2.5 3.0]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from player.timestretch import WsolaStretcher  # noqa: E402
+
+
+def synthetic_speech_like(seconds: float, sample_rate: int, seed: int = 0) -> bytes:
+    """Stereo harmonics with a syllable-rate envelope and a little noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2
+    mono = voice * envelope + 0.02 * rng.standard_normal(len(t))
+    stereo = np.stack((mono, 0.9 * mono), axis=1)
+    return (stereo / np.abs(stereo).max() * 12000).astype("<i2").tobytes()
+
+
+def run(seconds: float, speeds: list[float], sample_rate: int, block_seconds: float) -> int:
+    pcm = synthetic_speech_like(seconds, sample_rate)
+    block_bytes = int(sample_rate * block_seconds) * 4
+    print(f"{seconds:.0f}s of stereo PCM at {sample_rate} Hz, {block_seconds * 1000:.0f} ms blocks")
+    print(f"{'speed':>6} {'output s':>9} {'cpu s':>7} {'x realtime':>11}")
+    for speed in speeds:
+        stretcher = WsolaStretcher(sample_rate, 2, speed=speed)
+        output_bytes = 0
+        started = time.process_time()
+        for offset in range(0, len(pcm), block_bytes):
+            output_bytes += len(stretcher.process(pcm[offset : offset + block_bytes]))
+        output_bytes += len(stretcher.flush())
+        elapsed = time.process_time() - started
+        output_seconds = output_bytes / 4 / sample_rate
+        factor = seconds / elapsed if elapsed else float("inf")
+        print(f"{speed:>6.2f} {output_seconds:>9.2f} {elapsed:>7.3f} {factor:>11.1f}")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=60.0, help="Length of input audio")
+    parser.add_argument("--speeds", type=float, nargs="+", default=[0.5, 1.5, 2.5, 3.0])
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--block-seconds", type=float, default=0.05)
+    args = parser.parse_args()
+    raise SystemExit(run(args.seconds, args.speeds, args.sample_rate, args.block_seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Compare playhead transcript lookups: a SQL query per tick, index bisects and a cursor.
+
+Usage: python benchmarks/bench_transcript_lookup.py [--hours 2] [--ticks-per-second 20]
+
+Playback is simulated as status ticks through the whole transcript, with a random
+seek every ``--seek-every`` seconds. All three lookups must return the same
+segment for every tick; the script exits with status 1 when they do not.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from player import db  # noqa: E402
+from player.library import add_audio_file, create_audiobook  # noqa: E402
+from player.models import TranscriptSegment  # noqa: E402
+from player.transcript import TranscriptIndex, add_segments, find_segment_at_time  # noqa: E402
+
+VOCABULARY = ("the", "river", "morning", "letter", "window", "silence", "said", "night")
+
+
+def build(path: Path, seconds: float, segment_seconds: float, seed: int) -> tuple[int, int]:
+    """One file of segments with jittered lengths, small gaps and some overlaps."""
+    rng = random.Random(seed)
+    connection = db.initialize_db(path)
+    book = create_audiobook(connection, "Benchmark")
+    audio_file = add_audio_file(connection, book.id, "/bench.mp3", seconds, 0)
+    segments = []
+    start = 0.0
+    while start < seconds:
+        length = segment_seconds * rng.uniform(0.5, 1.5)
+        words = " ".join(rng.choice(VOCABULARY) for _ in range(int(length * 2.5) + 1))
+        segments.append(
+            TranscriptSegment(
+                audio_file_id=audio_file.id,
+                start_seconds=start,
+                end_seconds=start + length,
+                text=words,
+            )
+        )
+        start += length + rng.uniform(-0.3, 0.5)
+    add_segments(connection, segments)
+    connection.close()
+    return audio_file.id, len(segments)
+
+
+def playback_ticks(seconds: float, ticks_per_second: float, seek_every: float, seed: int):
+    rng = random.Random(seed)
+    step = 1 / ticks_per_second
+    position = 0.0
+    next_seek = seek_every
+    ticks = []
+    while position < seconds:
+        ticks.append(position)
+        position += step
+        if position >= next_seek:
+            next_seek = position + seek_every
+            position = rng.uniform(0, seconds)
+    return ticks
+
+
+def timed(lookup, ticks: list[float]) -> tuple[float, list]:
+    found = []
+    started = time.perf_counter()
+    for position in ticks:
+        found.append(lookup(position))
+    return time.perf_counter() - started, found
+
+
+def key(segment: TranscriptSegment | None) -> tuple[float, float] | None:
+    return None if segment is None else (segment.start_seconds, segment.end_seconds)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=float, default=2.0, help="Transcript length")
+    parser.add_argument("--segment-seconds", type=float, default=6.0)
+    parser.add_argument("--ticks-per-second", type=float, default=20.0)
+    parser.add_argument("--seek-every", type=float, default=600.0, help="Seconds between seeks")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    seconds = args.hours * 3600
+    ticks = playback_ticks(seconds, args.ticks_per_second, args.seek_every, args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory, "transcript.sqlite3")
+        audio_file_id, count = build(path, seconds, args.segment_seconds, args.seed)
+        connection = db.connect(path)
+        try:
+            started = time.perf_counter()
+            index = TranscriptIndex.load(connection, audio_file_id)
+            load_seconds = time.perf_counter() - started
+            cursor = index.cursor()
+            query = partial(find_segment_at_time, connection, audio_file_id)
+            results = [
+                ("sql per tick", *timed(query, ticks)),
+                ("index bisect", *timed(index.segment_at, ticks)),
+                ("cursor", *timed(cursor.update, ticks)),
+            ]
+        finally:
+            connection.close()
+    print(f"{args.hours:g} h transcript, {count} segments, {len(ticks)} ticks")
+    print(f"index load: {load_seconds * 1000:.1f} ms")
+    print(f"{'lookup':<14} {'total ms':>9} {'per tick us':>12}")
+    for name, elapsed, _ in results:
+        print(f"{name:<14} {elapsed * 1000:>9.1f} {elapsed / len(ticks) * 1e6:>12.2f}")
+    expected = [key(segment) for segment in results[0][2]]
+    mismatches = {
+        name: sum(key(segment) != want for segment, want in zip(found, expected))
+        for name, _, found in results[1:]
+    }
+    if any(mismatches.values()):
+        print(f"Lookups disagree with SQL: {mismatches}")
+        raise SystemExit(1)
+    print("All lookups agree.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Check TranscriptWindowCache against a full TranscriptIndex and simulate playback.
+
+Usage: python benchmarks/bench_transcript_windows.py [--hours 10] [--minutes 50] [--speedup 600]
+
+The transcript has a long segment every ``--long-every`` segments so that lookups
+must reach back across window boundaries. Random positions and every playback
+tick must give the same segment as the full index; the script exits with
+status 1 when they do not. Playback runs ``--speedup`` times faster than real
+time, so the prefetch thread has proportionally less time to load ahead.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from player import db  # noqa: E402
+from player.library import add_audio_file, create_audiobook  # noqa: E402
+from player.models import TranscriptSegment  # noqa: E402
+from player.transcript import TranscriptIndex, add_segments  # noqa: E402
+from player.transcript_windows import TranscriptWindowCache  # noqa: E402
+
+VOCABULARY = ("the", "river", "morning", "letter", "window", "silence", "said", "night")
+
+
+def build(path: Path, seconds: float, long_every: int, seed: int) -> tuple[int, int]:
+    rng = random.Random(seed)
+    connection = db.initialize_db(path)
+    book = create_audiobook(connection, "Benchmark")
+    audio_file = add_audio_file(connection, book.id, "/bench.mp3", seconds, 0)
+    segments = []
+    start = 0.0
+    while start < seconds:
+        length = rng.uniform(2.0, 9.0)
+        if long_every and len(segments) % long_every == long_every - 1:
+            length = rng.uniform(100.0, 300.0)
+        words = " ".join(rng.choice(VOCABULARY) for _ in range(int(length * 2.5) + 1))
+        segments.append(
+            TranscriptSegment(
+                audio_file_id=audio_file.id,
+                start_seconds=start,
+                end_seconds=start + length,
+                text=words,
+            )
+        )
+        start += rng.uniform(2.0, 9.0)
+    add_segments(connection, segments)
+    connection.close()
+    return audio_file.id, len(segments)
+
+
+def key(segment: TranscriptSegment | None) -> tuple[float, float] | None:
+    return None if segment is None else (segment.start_seconds, segment.end_seconds)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=float, default=10.0, help="Transcript length")
+    parser.add_argument("--long-every", type=int, default=400)
+    parser.add_argument("--positions", type=int, default=3000, help="Random lookups to check")
+    parser.add_argument("--minutes", type=float, default=50.0, help="Playback to simulate")
+    parser.add_argument("--ticks-per-second", type=float, default=20.0)
+    parser.add_argument("--speedup", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    seconds = args.hours * 3600
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory, "transcript.sqlite3")
+        audio_file_id, count = build(path, seconds, args.long_every, args.seed)
+        connection = db.connect(path)
+        try:
+            index = TranscriptIndex.load(connection, audio_file_id)
+
+            cache = TranscriptWindowCache(connection, prefetch=False)
+            positions = [rng.uniform(0, seconds) for _ in range(args.positions)]
+            started = time.perf_counter()
+            found = [cache.segment_at(audio_file_id, position) for position in positions]
+            random_seconds = time.perf_counter() - started
+            random_mismatches = sum(
+                key(segment) != key(index.segment_at(position))
+                for segment, position in zip(found, positions)
+            )
+            random_stats = cache.stats
+
+            cache = TranscriptWindowCache(connection)
+            step = 1 / args.ticks_per_second
+            position = rng.uniform(0, max(seconds - args.minutes * 60, 0))
+            ticks = int(args.minutes * 60 * args.ticks_per_second)
+            playback_mismatches = 0
+            lookup_seconds = 0.0
+            try:
+                for tick in range(ticks):
+                    started = time.perf_counter()
+                    segment = cache.update(audio_file_id, position)
+                    lookup_seconds += time.perf_counter() - started
+                    playback_mismatches += key(segment) != key(index.segment_at(position))
+                    position += step
+                    if tick % args.ticks_per_second == 0:
+                        time.sleep(1 / args.speedup)
+            finally:
+                cache.close()
+            playback_stats = cache.stats
+        finally:
+            connection.close()
+
+    print(f"{args.hours:g} h transcript, {count} segments")
+    print(
+        f"random lookups: {args.positions}, {random_seconds / args.positions * 1e6:.1f} us each,"
+        f" {random_stats.misses} window loads, {random_stats.evicted} evicted,"
+        f" {random_mismatches} mismatches"
+    )
+    print(
+        f"playback: {args.minutes:g} min at {args.ticks_per_second:g} Hz ({ticks} ticks),"
+        f" {lookup_seconds / ticks * 1e6:.2f} us per tick"
+    )
+    print(
+        f"  hits {playback_stats.hits}, misses {playback_stats.misses},"
+        f" prefetched {playback_stats.prefetched}, evicted {playback_stats.evicted},"
+        f" {playback_mismatches} mismatches"
+    )
+    failures = random_mismatches + playback_mismatches
+    if failures:
+        print("The window cache disagrees with the full index.")
+        raise SystemExit(1)
+    print("The window cache agrees with the full index.")
+
+
+if __name__ == "__main__":
+    main()
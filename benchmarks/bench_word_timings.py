@@ -0,0 +1,185 @@
+"""Compare packed word-timing blobs against a row-per-word table.
+
+Usage: python benchmarks/bench_word_timings.py [--hours 10] [--segment-seconds 6]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from bisect import bisect_right
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from player import db  # noqa: E402
+from player.library import add_audio_file, create_audiobook  # noqa: E402
+from player.models import TranscriptSegment  # noqa: E402
+from player.transcript import TranscriptIndex, add_segments  # noqa: E402
+from player.word_timings import pack_word_timings  # noqa: E402
+
+VOCABULARY = (
+    "the", "of", "and", "to", "a", "in", "was", "he", "that", "it", "his", "her",
+    "with", "had", "as", "for", "she", "you", "not", "be", "river", "morning",
+    "window", "carriage", "letter", "silence", "remembered", "afterwards",
+)
+
+ROW_PER_WORD_STATEMENTS = (
+    """
+    CREATE TABLE transcript_words (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        segment_id INTEGER NOT NULL,
+        word TEXT NOT NULL,
+        start_seconds REAL NOT NULL,
+        end_seconds REAL NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        FOREIGN KEY (segment_id) REFERENCES transcript_segments (id)
+    )
+    """,
+    "CREATE INDEX idx_transcript_words_segment ON transcript_words (segment_id, start_seconds)",
+)
+
+
+def generate(seconds: float, segment_seconds: float, seed: int):
+    """Yield (start, end, text, [(word, start, end, char_start)]) per segment."""
+    rng = random.Random(seed)
+    start = 0.0
+    while start < seconds:
+        end = start + segment_seconds
+        words = [rng.choice(VOCABULARY) for _ in range(int(segment_seconds * 2.5))]
+        step = segment_seconds / len(words)
+        timed = []
+        char_start = 0
+        for index, word in enumerate(words):
+            timed.append((word, start + index * step, start + (index + 1) * step, char_start))
+            char_start += len(word) + 1
+        yield start, end, " ".join(words), timed
+        start = end
+
+
+def pack(start: float, timed: list[tuple[str, float, float, int]]) -> bytes:
+    return pack_word_timings(
+        start, [(begin, end, char, char + len(word)) for word, begin, end, char in timed]
+    )
+
+
+def database_size(path: Path) -> int:
+    return sum(
+        os.path.getsize(candidate)
+        for candidate in (path, Path(f"{path}-wal"))
+        if os.path.exists(candidate)
+    )
+
+
+def build(path: Path, packed: bool, seconds: float, segment_seconds: float) -> int:
+    connection = db.initialize_db(path)
+    if not packed:
+        for statement in ROW_PER_WORD_STATEMENTS:
+            connection.execute(statement)
+    book = create_audiobook(connection, "Benchmark")
+    audio_file = add_audio_file(connection, book.id, "/bench.mp3", seconds, 0)
+    segments = list(generate(seconds, segment_seconds, seed=1))
+    add_segments(
+        connection,
+        (
+            TranscriptSegment(
+                audio_file_id=audio_file.id,
+                start_seconds=start,
+                end_seconds=end,
+                text=text,
+                word_timings=pack(start, timed) if packed else None,
+            )
+            for start, end, text, timed in segments
+        ),
+    )
+    if not packed:
+        rows = []
+        for segment_id, (_, _, _, timed) in enumerate(segments, start=1):
+            rows.extend((segment_id, word, w_start, w_end) for word, w_start, w_end, _ in timed)
+        db.bulk_insert(
+            connection,
+            """
+            INSERT INTO transcript_words (segment_id, word, start_seconds, end_seconds)
+            VALUES (?, ?, ?, ?)
+            """,
+            rows,
+        )
+    words = sum(len(timed) for *_, timed in segments)
+    connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    connection.execute("VACUUM")
+    connection.close()
+    return words
+
+
+def load_packed(path: Path, seconds: float) -> tuple[float, float]:
+    connection = db.connect(path)
+    started = time.perf_counter()
+    index = TranscriptIndex.load(connection, 1)
+    loaded = time.perf_counter() - started
+    started = time.perf_counter()
+    for step in range(int(seconds * 4)):
+        index.word_at(step / 4)
+    lookups = time.perf_counter() - started
+    connection.close()
+    return loaded, lookups
+
+
+def load_rows(path: Path, seconds: float) -> tuple[float, float]:
+    connection = db.connect(path)
+    started = time.perf_counter()
+    rows = connection.execute(
+        """
+        SELECT w.word, w.start_seconds, w.end_seconds
+        FROM transcript_words w
+        JOIN transcript_segments s ON s.id = w.segment_id
+        WHERE s.audio_file_id = ?
+        ORDER BY w.start_seconds
+        """,
+        (1,),
+    ).fetchall()
+    starts = [row["start_seconds"] for row in rows]
+    loaded = time.perf_counter() - started
+    started = time.perf_counter()
+    for step in range(int(seconds * 4)):
+        position = step / 4
+        index = bisect_right(starts, position) - 1
+        if index >= 0 and position <= rows[index]["end_seconds"]:
+            rows[index]["word"]
+    lookups = time.perf_counter() - started
+    connection.close()
+    return loaded, lookups
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=float, default=10.0, help="Transcript length")
+    parser.add_argument("--segment-seconds", type=float, default=6.0)
+    args = parser.parse_args()
+    seconds = args.hours * 3600
+    with tempfile.TemporaryDirectory() as directory:
+        packed_path = Path(directory, "packed.sqlite3")
+        rows_path = Path(directory, "rows.sqlite3")
+        words = build(packed_path, True, seconds, args.segment_seconds)
+        build(rows_path, False, seconds, args.segment_seconds)
+        packed_load, packed_lookups = load_packed(packed_path, seconds)
+        rows_load, rows_lookups = load_rows(rows_path, seconds)
+        packed_size = database_size(packed_path)
+        rows_size = database_size(rows_path)
+    lookups = int(seconds * 4)
+    print(f"{args.hours:g} h transcript, {words} words")
+    print(f"{'layout':<14} {'db MiB':>8} {'load ms':>9} {'lookup us':>10}")
+    for name, size, load, lookup in (
+        ("packed blob", packed_size, packed_load, packed_lookups),
+        ("row per word", rows_size, rows_load, rows_lookups),
+    ):
+        print(
+            f"{name:<14} {size / 1024 / 1024:>8.2f} {load * 1000:>9.1f}"
+            f" {lookup / lookups * 1e6:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
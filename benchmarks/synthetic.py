@@ -0,0 +1,135 @@
+"""Seeded generator for synthetic audiobook libraries used by the benchmarks."""
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import sys
+import tempfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from player import db  # noqa: E402
+from player.library import INSERT_AUDIO_FILE  # noqa: E402
+from player.playback import UPSERT_STATE  # noqa: E402
+from player.transcript import INSERT_SEGMENT  # noqa: E402
+
+VOCABULARY = (
+    "the", "of", "and", "to", "a", "in", "was", "he", "that", "it", "his", "her",
+    "with", "had", "as", "for", "she", "you", "not", "be", "river", "morning",
+    "window", "carriage", "letter", "silence", "remembered", "afterwards", "harbour",
+    "lantern", "orchard", "quietly", "promised", "northern", "evening", "stranger",
+)
+
+
+@dataclass(frozen=True)
+class LibrarySpec:
+    """Shape of a synthetic library. The same spec and seed always give the same rows."""
+
+    books: int
+    min_files: int
+    max_files: int
+    min_file_seconds: float
+    max_file_seconds: float
+    segments: int
+    segment_seconds: float = 6.0
+    # Share of books with a stored playback position.
+    started_fraction: float = 0.3
+    seed: int = 1
+
+    def key(self) -> str:
+        # The schema version is part of the key, so a migration added after a library
+        # was cached makes the suite generate a new one rather than open the old.
+        fields = {**asdict(self), "schema_version": len(db.MIGRATIONS)}
+        encoded = json.dumps(fields, sort_keys=True).encode()
+        return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+PROFILES: dict[str, LibrarySpec] = {
+    "smoke": LibrarySpec(200, 1, 20, 300.0, 3600.0, 20_000),
+    "small": LibrarySpec(1_000, 1, 30, 300.0, 5400.0, 200_000),
+    "full": LibrarySpec(10_000, 1, 40, 300.0, 5400.0, 2_000_000),
+}
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def generate_library(path: str | Path, spec: LibrarySpec) -> None:
+    """Write a library matching ``spec`` to a new database at ``path``.
+
+    Transcripts are added to randomly chosen files, each covered end to end with
+    back-to-back segments, until ``spec.segments`` segments exist.
+    """
+    rng = random.Random(spec.seed)
+    connection = db.initialize_db(path)
+    try:
+        connection.executemany(
+            "INSERT INTO audiobooks (title, created_at) VALUES (?, datetime('2020-01-01', ?))",
+            (
+                (f"{_sentence(rng, rng.randint(1, 4)).title()} {index}", f"+{index} minutes")
+                for index in range(spec.books)
+            ),
+        )
+        rows = []
+        for audiobook_id in range(1, spec.books + 1):
+            for order_index in range(rng.randint(spec.min_files, spec.max_files)):
+                duration = round(rng.uniform(spec.min_file_seconds, spec.max_file_seconds), 3)
+                rows.append(
+                    (
+                        audiobook_id,
+                        f"/library/{audiobook_id:05d}/{order_index:03d}.mp3",
+                        duration,
+                        order_index,
+                        None,
+                        None,
+                    )
+                )
+        file_ids = db.bulk_insert(connection, INSERT_AUDIO_FILE, rows)
+        # (audio file id, audiobook id, duration)
+        files = [(file_id, row[0], row[2]) for file_id, row in zip(file_ids, rows)]
+
+        states = []
+        by_book: dict[int, list[tuple[int, float]]] = {}
+        for file_id, audiobook_id, duration in files:
+            by_book.setdefault(audiobook_id, []).append((file_id, duration))
+        for audiobook_id, book_files in by_book.items():
+            if rng.random() < spec.started_fraction:
+                file_id, duration = rng.choice(book_files)
+                states.append((audiobook_id, file_id, round(rng.uniform(0, duration), 3)))
+        db.execute_many(connection, UPSERT_STATE, states)
+
+        def segments():
+            remaining = spec.segments
+            for file_id, _, duration in rng.sample(files, len(files)):
+                start = 0.0
+                while start < duration and remaining:
+                    end = min(start + spec.segment_seconds, duration)
+                    yield (file_id, start, end, _sentence(rng, rng.randint(8, 20)), None)
+                    start = end
+                    remaining -= 1
+                if not remaining:
+                    return
+
+        db.bulk_insert(connection, INSERT_SEGMENT, segments(), chunk_size=10_000)
+        connection.execute("PRAGMA optimize")
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        connection.close()
+
+
+def cached_library(spec: LibrarySpec, cache_dir: str | Path | None = None) -> Path:
+    """Path to a generated library for ``spec``, generating it on first use."""
+    directory = Path(cache_dir or Path(tempfile.gettempdir(), "audiobook-bench"))
+    path = directory / f"library-{spec.key()}.sqlite3"
+    if not path.exists():
+        directory.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(path.name + ".partial")
+        for leftover in directory.glob(partial.name + "*"):
+            leftover.unlink()
+        generate_library(partial, spec)
+        partial.replace(path)
+    return path
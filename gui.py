@@ -1,39 +1,111 @@
-"""Simple GUI for audiobook playback speed control."""
+"""Simple GUI for audiobook playback with speed control, progress and autosave."""
 from __future__ import annotations
 
+import argparse
 import tkinter as tk
 from pathlib import Path
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 
-from player.audio_engine import PlaybackCommand, build_ffplay_command, start_ffplay
+from player.controller import (
+    BOOKS,
+    CLOSED,
+    ERROR,
+    STATUS,
+    FrameMonitor,
+    PlayerController,
+    PlayerStatus,
+)
+from player.daemon import DEFAULT_DB_PATH
+
+# One tick per 60 Hz frame: drain controller events and refresh the display.
+TICK_MS = 16
+
+
+def format_time(seconds: float) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
+def make_engine_factory(db_path: Path):
+    def factory():
+        # Imported on the controller thread so the window appears before NumPy loads.
+        from player.audio_cache import AudioCache, cache_dir_for
+        from player.streaming import FfplaySink, StreamingAudioEngine
+
+        return StreamingAudioEngine(FfplaySink(), audio_cache=AudioCache(cache_dir_for(db_path)))
+
+    return factory
 
 
 class AudiobookPlayerGUI:
-    def __init__(self, root: tk.Tk) -> None:
+    """Tk front end. Every player and database call goes through ``PlayerController``.
+
+    Callbacks on the Tk thread only queue commands; ``_tick`` drains the
+    controller's events every ``TICK_MS`` and updates the widgets, so the window
+    keeps redrawing while files load, decoders start or autosave commits.
+    """
+
+    def __init__(self, root: tk.Tk, db_path: Path) -> None:
         self.root = root
         self.root.title("Audiobook Player")
-        self.audio_path: Path | None = None
-        self.process = None
-        self.command_label_var = tk.StringVar(value="")
+        self.monitor = FrameMonitor()
+        self.controller = PlayerController(db_path, make_engine_factory(db_path))
+        self.books: list = []
+        self.status: PlayerStatus | None = None
+        self.book_var = tk.StringVar(value="")
+        self.title_var = tk.StringVar(value="Nothing loaded")
+        self.position_var = tk.StringVar(value="0:00 / 0:00")
+        self.transcript_var = tk.StringVar(value="")
+        self.frame_var = tk.StringVar(value="")
+        self.closed = False
 
         self._build_ui()
+        self.controller.start()
+        self.controller.load_books()
+        self.root.after(TICK_MS, self._tick)
 
     def _build_ui(self) -> None:
+        timed = self.monitor.callback
         container = tk.Frame(self.root, padx=12, pady=12)
         container.pack(fill=tk.BOTH, expand=True)
 
         title = tk.Label(container, text="Audiobook Player", font=("Arial", 16, "bold"))
         title.pack(anchor=tk.W)
 
-        file_row = tk.Frame(container)
-        file_row.pack(fill=tk.X, pady=(12, 6))
+        book_row = tk.Frame(container)
+        book_row.pack(fill=tk.X, pady=(12, 6))
 
-        self.file_label = tk.Label(file_row, text="No file selected")
-        self.file_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        tk.Label(book_row, text="Audiobook:").pack(side=tk.LEFT)
+        self.book_box = ttk.Combobox(book_row, textvariable=self.book_var, state="readonly")
+        self.book_box.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(8, 8))
+        self.book_box.bind("<<ComboboxSelected>>", timed(lambda _: self.open_book()))
 
-        select_button = tk.Button(file_row, text="Choose File", command=self.select_file)
+        select_button = tk.Button(book_row, text="Choose File", command=timed(self.select_file))
         select_button.pack(side=tk.RIGHT)
 
+        self.file_label = tk.Label(container, textvariable=self.title_var, anchor=tk.W)
+        self.file_label.pack(fill=tk.X)
+
+        progress_row = tk.Frame(container)
+        progress_row.pack(fill=tk.X, pady=(6, 6))
+
+        self.progress = ttk.Progressbar(progress_row, maximum=1000)
+        self.progress.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.progress.bind("<Button-1>", timed(self.seek_to_click))
+
+        position_label = tk.Label(progress_row, textvariable=self.position_var, width=18)
+        position_label.pack(side=tk.RIGHT, padx=(8, 0))
+
+        transcript_label = tk.Label(
+            container,
+            textvariable=self.transcript_var,
+            anchor=tk.W,
+            justify=tk.LEFT,
+            wraplength=520,
+        )
+        transcript_label.pack(fill=tk.X, pady=(0, 6))
+
         speed_row = tk.Frame(container)
         speed_row.pack(fill=tk.X, pady=(6, 6))
 
@@ -48,30 +120,39 @@ class AudiobookPlayerGUI:
             resolution=0.1,
             orient=tk.HORIZONTAL,
             variable=self.speed_var,
-            command=lambda _: self.update_command_preview(),
+            command=timed(lambda _: self.change_speed()),
         )
         speed_slider.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(8, 0))
 
         controls_row = tk.Frame(container)
         controls_row.pack(fill=tk.X, pady=(12, 6))
 
-        play_button = tk.Button(controls_row, text="Play", command=self.play)
+        play_button = tk.Button(controls_row, text="Play", command=timed(self.play))
         play_button.pack(side=tk.LEFT)
 
-        stop_button = tk.Button(controls_row, text="Stop", command=self.stop)
+        pause_button = tk.Button(controls_row, text="Pause", command=timed(self.pause))
+        pause_button.pack(side=tk.LEFT, padx=(8, 0))
+
+        stop_button = tk.Button(controls_row, text="Stop", command=timed(self.stop))
         stop_button.pack(side=tk.LEFT, padx=(8, 0))
 
-        command_label = tk.Label(
+        frame_label = tk.Label(
             container,
-            textvariable=self.command_label_var,
+            textvariable=self.frame_var,
             font=("Arial", 9),
-            wraplength=520,
             justify=tk.LEFT,
             fg="#555",
         )
-        command_label.pack(fill=tk.X, pady=(8, 0))
+        frame_label.pack(fill=tk.X, pady=(8, 0))
 
-        self.update_command_preview()
+    def open_book(self) -> None:
+        index = self.book_box.current()
+        if index < 0:
+            return
+        book = self.books[index]
+        self.title_var.set(f"Loading {book.title}...")
+        self.controller.set_speed(self.speed_var.get())
+        self.controller.open_book(book.audiobook_id, book.title)
 
     def select_file(self) -> None:
         path = filedialog.askopenfilename(
@@ -80,35 +161,81 @@ class AudiobookPlayerGUI:
         )
         if not path:
             return
-        self.audio_path = Path(path)
-        self.file_label.config(text=str(self.audio_path))
-        self.update_command_preview()
-
-    def update_command_preview(self) -> None:
-        if not self.audio_path:
-            self.command_label_var.set("Select a file to preview playback command.")
+        self.book_var.set("")
+        self.title_var.set(f"Loading {Path(path).name}...")
+        self.controller.set_speed(self.speed_var.get())
+        self.controller.open_file(path)
+
+    def seek_to_click(self, event: tk.Event) -> None:
+        status = self.status
+        if status is None or status.duration_seconds <= 0:
             return
-        command = build_ffplay_command(self.audio_path, self.speed_var.get())
-        self.command_label_var.set(f"Playback command: {command.display()}")
+        fraction = min(max(event.x / max(self.progress.winfo_width(), 1), 0.0), 1.0)
+        self.controller.seek(fraction * status.duration_seconds)
+
+    def change_speed(self) -> None:
+        self.controller.set_speed(self.speed_var.get())
 
     def play(self) -> None:
-        if not self.audio_path:
-            messagebox.showwarning("No file", "Please select an audio file first.")
+        if self.status is None:
+            messagebox.showwarning("Nothing loaded", "Choose an audiobook or a file first.")
             return
-        self.stop()
-        self.process = start_ffplay(self.audio_path, self.speed_var.get())
+        self.controller.play()
+
+    def pause(self) -> None:
+        self.controller.pause()
 
     def stop(self) -> None:
-        if self.process and self.process.poll() is None:
-            self.process.terminate()
-            self.process.wait(timeout=2)
-        self.process = None
+        self.controller.stop()
+
+    def close(self) -> None:
+        """Save and shut the player down in the background; the window closes after."""
+        self.title_var.set("Saving position...")
+        self.controller.close()
+
+    def _tick(self) -> None:
+        self.monitor.frame(TICK_MS / 1000)
+        self.monitor.callback(self._handle_events)()
+        if not self.closed:
+            self.root.after(TICK_MS, self._tick)
+
+    def _handle_events(self) -> None:
+        for kind, payload in self.controller.poll():
+            if kind == STATUS:
+                self._show_status(payload)
+            elif kind == BOOKS:
+                self.books = list(payload)
+                self.book_box["values"] = [book.title for book in self.books]
+            elif kind == ERROR:
+                self.title_var.set(f"Error: {payload}")
+            elif kind == CLOSED:
+                self.closed = True
+                self.root.destroy()
+                return
+        stats = self.monitor.stats
+        self.frame_var.set(
+            f"UI thread: max callback {stats.max_callback_seconds * 1000:.1f} ms,"
+            f" max frame lag {stats.max_lag_seconds * 1000:.1f} ms,"
+            f" {stats.late_frames} late of {stats.frames} frames"
+        )
+
+    def _show_status(self, status: PlayerStatus) -> None:
+        self.status = status
+        self.title_var.set(f"{status.title} ({status.state}, {status.speed:g}x)")
+        self.position_var.set(
+            f"{format_time(status.position_seconds)} / {format_time(status.duration_seconds)}"
+        )
+        self.progress["value"] = status.fraction * 1000
+        self.transcript_var.set(status.transcript)
 
 
-def main() -> None:
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Audiobook player window")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to sqlite database")
+    args = parser.parse_args(argv)
     root = tk.Tk()
-    app = AudiobookPlayerGUI(root)
-    root.protocol("WM_DELETE_WINDOW", lambda: (app.stop(), root.destroy()))
+    app = AudiobookPlayerGUI(root, Path(args.db))
+    root.protocol("WM_DELETE_WINDOW", app.close)
     root.mainloop()
 
 
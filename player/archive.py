@@ -0,0 +1,411 @@
+"""Streaming export and import of the library, listening progress and transcripts.
+
+An archive is gzip-compressed JSON lines. The first line is a header and the
+last a footer with row counts, so a truncated archive is detected instead of
+half-imported. Every line in between is one chunk of rows from one table:
+
+    {"table": "audio_files", "columns": ["id", "audiobook_id", ...], "rows": [[...], ...]}
+
+Tables are written in dependency order (``ARCHIVE_TABLES``) and read back one
+chunk at a time, so neither side ever holds more than a chunk of rows plus the
+id maps for books and files. Blob columns are base64 text.
+
+Importing merges rather than appends. An archived file is the same as a local
+one when their fingerprints match, failing that their full hashes, and for
+files with neither, their paths. A book is the same as the local book holding
+its matched files. Playback positions keep whichever side has the newer
+``updated_at``. Segments are only added to files that have no transcript yet.
+Importing the same archive twice therefore changes nothing the second time.
+The whole import is one transaction, with transcript search indexing deferred
+to a single pass at its end.
+"""
+from __future__ import annotations
+
+import base64
+import gzip
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from player import db
+from player.library import INSERT_AUDIO_FILE
+from player.transcript import INSERT_SEGMENT, deferred_search_index
+
+ARCHIVE_FORMAT = "audiobook-player-archive"
+ARCHIVE_VERSION = 1
+DEFAULT_COMPRESS_LEVEL = 6
+
+# Exported in this order, so that every row's references precede it.
+ARCHIVE_TABLES: dict[str, str] = {
+    "audiobooks": "SELECT id, title, created_at FROM audiobooks ORDER BY id",
+    "audio_files": """
+        SELECT id, audiobook_id, path, duration_seconds, order_index, file_hash, fingerprint
+        FROM audio_files ORDER BY id
+    """,
+    "playback_state": """
+        SELECT audiobook_id, audio_file_id, position_seconds, updated_at
+        FROM playback_state ORDER BY audiobook_id
+    """,
+    "transcript_segments": """
+        SELECT id, audio_file_id, start_seconds, end_seconds, text, word_timings
+        FROM transcript_segments ORDER BY id
+    """,
+}
+BLOB_COLUMNS = frozenset({"word_timings"})
+
+# Only replaces a local position that is older than the archived one.
+MERGE_STATE = """
+INSERT INTO playback_state (audiobook_id, audio_file_id, position_seconds, updated_at)
+VALUES (?, ?, ?, ?)
+ON CONFLICT(audiobook_id) DO UPDATE SET
+    audio_file_id = excluded.audio_file_id,
+    position_seconds = excluded.position_seconds,
+    updated_at = excluded.updated_at
+WHERE excluded.updated_at > playback_state.updated_at
+""".strip()
+
+
+@dataclass
+class ImportResult:
+    books_created: int = 0
+    books_merged: int = 0
+    files_created: int = 0
+    files_merged: int = 0
+    # Created files whose archived path does not exist on this machine.
+    files_missing: int = 0
+    positions_updated: int = 0
+    positions_kept: int = 0
+    segments_added: int = 0
+    segments_skipped: int = 0
+
+
+def _encode(columns: list[str], row: tuple) -> list:
+    return [
+        base64.b64encode(value).decode("ascii")
+        if name in BLOB_COLUMNS and value is not None
+        else value
+        for name, value in zip(columns, row)
+    ]
+
+
+def iter_archive_lines(
+    connection: sqlite3.Connection,
+    counts: dict[str, int],
+    chunk_size: int = db.DEFAULT_CHUNK_SIZE,
+) -> Iterator[dict]:
+    """Yield the archive's header, one record per chunk of rows, then the footer.
+
+    Rows are pulled with ``fetchmany``; ``counts`` is filled in as tables are read.
+    """
+    yield {
+        "format": ARCHIVE_FORMAT,
+        "version": ARCHIVE_VERSION,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        "tables": list(ARCHIVE_TABLES),
+    }
+    for table, query in ARCHIVE_TABLES.items():
+        cursor = connection.execute(query)
+        columns = [description[0] for description in cursor.description]
+        counts[table] = 0
+        while rows := cursor.fetchmany(chunk_size):
+            counts[table] += len(rows)
+            yield {
+                "table": table,
+                "columns": columns,
+                "rows": [_encode(columns, row) for row in rows],
+            }
+    yield {"end": True, "counts": counts}
+
+
+def export_library(
+    connection: sqlite3.Connection,
+    path: str | Path,
+    chunk_size: int = db.DEFAULT_CHUNK_SIZE,
+    compress_level: int = DEFAULT_COMPRESS_LEVEL,
+) -> dict[str, int]:
+    """Write the archive to ``path`` and return the rows exported per table.
+
+    All tables are read in one read transaction, so the archive is a consistent
+    snapshot even while playback keeps saving positions. The file is written
+    under a temporary name and renamed into place when complete.
+    """
+    target = Path(path)
+    partial = target.with_name(target.name + ".partial")
+    counts: dict[str, int] = {}
+    snapshot = not connection.in_transaction
+    if snapshot:
+        connection.execute("BEGIN")
+    try:
+        with gzip.open(partial, "wt", encoding="utf-8", compresslevel=compress_level) as handle:
+            for record in iter_archive_lines(connection, counts, chunk_size):
+                handle.write(json.dumps(record, separators=(",", ":")))
+                handle.write("\n")
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    finally:
+        if snapshot:
+            connection.rollback()
+    partial.replace(target)
+    return counts
+
+
+def _lines(handle: Iterable[str], path: str | Path) -> Iterator[str]:
+    try:
+        yield from handle
+    except EOFError:
+        raise ValueError(f"{path} is truncated: the compressed stream ends early") from None
+
+
+def read_archive(path: str | Path) -> Iterator[tuple[str, list[dict]]]:
+    """Yield ``(table, rows)`` per chunk, with rows as dicts and blobs decoded.
+
+    Raises ValueError for files that are not archives, newer archive versions and
+    archives that end before their footer.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        try:
+            header = json.loads(handle.readline() or "null")
+        except (gzip.BadGzipFile, UnicodeDecodeError, json.JSONDecodeError):
+            header = None
+        if not isinstance(header, dict) or header.get("format") != ARCHIVE_FORMAT:
+            raise ValueError(f"{path} is not an audiobook player archive")
+        if header.get("version", 0) > ARCHIVE_VERSION:
+            raise ValueError(
+                f"{path} has archive version {header['version']}; upgrade the player to import it"
+            )
+        for line in _lines(handle, path):
+            record = json.loads(line)
+            if record.get("end"):
+                return
+            columns = record["columns"]
+            blobs = [name for name in columns if name in BLOB_COLUMNS]
+            rows = [dict(zip(columns, values)) for values in record["rows"]]
+            for row in rows:
+                for name in blobs:
+                    if row[name] is not None:
+                        row[name] = base64.b64decode(row[name])
+            yield record["table"], rows
+    raise ValueError(f"{path} is truncated: the archive ends before its footer")
+
+
+def _placeholders(values: Iterable[object]) -> str:
+    return ", ".join("?" for _ in values)
+
+
+@dataclass
+class _Importer:
+    connection: sqlite3.Connection
+    result: ImportResult
+    # Archived book id -> (title, created_at) until the book is mapped to a local one.
+    pending_books: dict[int, tuple[str, str]] = field(default_factory=dict)
+    book_ids: dict[int, int] = field(default_factory=dict)
+    file_ids: dict[int, int] = field(default_factory=dict)
+    # Local files claimed by an archived file in this import.
+    claimed: set[int] = field(default_factory=set)
+    # Local files that already had a transcript; their archived segments are skipped.
+    transcribed: set[int] = field(default_factory=set)
+
+    def add(self, table: str, rows: list[dict]) -> None:
+        if table == "audiobooks":
+            for row in rows:
+                self.pending_books[row["id"]] = (row["title"], row["created_at"])
+        elif table == "audio_files":
+            self._add_files(rows)
+        elif table == "playback_state":
+            self.finish_books()
+            self._add_states(rows)
+        elif table == "transcript_segments":
+            self.finish_books()
+            self._add_segments(rows)
+
+    def _local_book(self, archived_id: int) -> int:
+        local_id = self.book_ids.get(archived_id)
+        if local_id is None:
+            title, created_at = self.pending_books.pop(
+                archived_id, (f"Audiobook {archived_id}", None)
+            )
+            local_id = self.connection.execute(
+                """
+                INSERT INTO audiobooks (title, created_at)
+                VALUES (?, COALESCE(?, datetime('now')))
+                """,
+                (title, created_at),
+            ).lastrowid
+            self.book_ids[archived_id] = local_id
+            self.result.books_created += 1
+        return local_id
+
+    def _lookup(self, column: str, values: list[str]) -> dict[str, list[tuple[int, int]]]:
+        """Local (file id, book id) pairs per value of ``column``, oldest file first."""
+        found: dict[str, list[tuple[int, int]]] = {}
+        if not values:
+            return found
+        rows = self.connection.execute(
+            f"""
+            SELECT id, audiobook_id, {column} AS value FROM audio_files
+            WHERE {column} IN ({_placeholders(values)})
+            ORDER BY id
+            """,
+            values,
+        )
+        for row in rows:
+            found.setdefault(row["value"], []).append((row["id"], row["audiobook_id"]))
+        return found
+
+    def _match(self, row: dict, candidates: list[tuple[int, int]]) -> tuple[int, int] | None:
+        mapped_book = self.book_ids.get(row["audiobook_id"])
+        unclaimed = [candidate for candidate in candidates if candidate[0] not in self.claimed]
+        for file_id, book_id in unclaimed:
+            if book_id == mapped_book:
+                return file_id, book_id
+        return unclaimed[0] if unclaimed else None
+
+    def _add_files(self, rows: list[dict]) -> None:
+        by_fingerprint = self._lookup(
+            "fingerprint", [row["fingerprint"] for row in rows if row["fingerprint"]]
+        )
+        by_hash = self._lookup("file_hash", [row["file_hash"] for row in rows if row["file_hash"]])
+        by_path = self._lookup(
+            "path", [row["path"] for row in rows if not row["fingerprint"] and not row["file_hash"]]
+        )
+        merged: list[tuple] = []
+        created: list[tuple[int, tuple]] = []
+        for row in rows:
+            match = None
+            for candidates, value in (
+                (by_fingerprint, row["fingerprint"]),
+                (by_hash, row["file_hash"]),
+                (by_path, row["path"]),
+            ):
+                if value and value in candidates:
+                    match = self._match(row, candidates[value])
+                    if match:
+                        break
+            if match:
+                file_id, book_id = match
+                self.claimed.add(file_id)
+                self.file_ids[row["id"]] = file_id
+                if row["audiobook_id"] not in self.book_ids:
+                    self.pending_books.pop(row["audiobook_id"], None)
+                    self.book_ids[row["audiobook_id"]] = book_id
+                    self.result.books_merged += 1
+                merged.append((row["fingerprint"], row["file_hash"], file_id))
+                continue
+            book_id = self._local_book(row["audiobook_id"])
+            created.append(
+                (
+                    row["id"],
+                    (
+                        book_id,
+                        row["path"],
+                        row["duration_seconds"],
+                        row["order_index"],
+                        row["file_hash"],
+                        row["fingerprint"],
+                    ),
+                )
+            )
+            if not os.path.exists(row["path"]):
+                self.result.files_missing += 1
+
+        self.connection.executemany(
+            """
+            UPDATE audio_files
+            SET fingerprint = COALESCE(fingerprint, ?), file_hash = COALESCE(file_hash, ?)
+            WHERE id = ?
+            """,
+            merged,
+        )
+        self.result.files_merged += len(merged)
+        merged_ids = [file_id for _, _, file_id in merged]
+        if merged_ids:
+            self.transcribed.update(
+                row[0]
+                for row in self.connection.execute(
+                    f"""
+                    SELECT DISTINCT audio_file_id FROM transcript_segments
+                    WHERE audio_file_id IN ({_placeholders(merged_ids)})
+                    """,
+                    merged_ids,
+                )
+            )
+        new_ids = [
+            file_id
+            for chunk_ids in db.insert_rows(
+                self.connection, INSERT_AUDIO_FILE, (values for _, values in created)
+            )
+            for file_id in chunk_ids
+        ]
+        for (archived_id, _), file_id in zip(created, new_ids):
+            self.file_ids[archived_id] = file_id
+        self.result.files_created += len(new_ids)
+
+    def finish_books(self) -> None:
+        """Map archived books without files: to a local book of the same title, or a new one."""
+        for archived_id in list(self.pending_books):
+            title, _ = self.pending_books[archived_id]
+            row = self.connection.execute(
+                "SELECT id FROM audiobooks WHERE title = ? ORDER BY id LIMIT 1", (title,)
+            ).fetchone()
+            if row is None:
+                self._local_book(archived_id)
+            else:
+                del self.pending_books[archived_id]
+                self.book_ids[archived_id] = row["id"]
+                self.result.books_merged += 1
+
+    def _add_states(self, rows: list[dict]) -> None:
+        states = [
+            (
+                self.book_ids[row["audiobook_id"]],
+                self.file_ids[row["audio_file_id"]],
+                row["position_seconds"],
+                row["updated_at"],
+            )
+            for row in rows
+            if row["audiobook_id"] in self.book_ids and row["audio_file_id"] in self.file_ids
+        ]
+        before = self.connection.total_changes
+        self.connection.executemany(MERGE_STATE, states)
+        updated = self.connection.total_changes - before
+        self.result.positions_updated += updated
+        self.result.positions_kept += len(states) - updated
+
+    def _add_segments(self, rows: list[dict]) -> None:
+        segments = []
+        for row in rows:
+            file_id = self.file_ids.get(row["audio_file_id"])
+            if file_id is None or file_id in self.transcribed:
+                self.result.segments_skipped += 1
+                continue
+            segments.append(
+                (
+                    file_id,
+                    row["start_seconds"],
+                    row["end_seconds"],
+                    row["text"],
+                    row["word_timings"],
+                )
+            )
+        self.connection.executemany(INSERT_SEGMENT, segments)
+        self.result.segments_added += len(segments)
+
+
+def import_library(connection: sqlite3.Connection, path: str | Path) -> ImportResult:
+    """Merge an archive into the library in a single transaction; see the module docs."""
+    importer = _Importer(connection, ImportResult())
+    try:
+        with deferred_search_index(connection):
+            for table, rows in read_archive(path):
+                importer.add(table, rows)
+            importer.finish_books()
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+    return importer.result
@@ -0,0 +1,275 @@
+"""Content-addressed on-disk cache of decoded PCM with LRU eviction."""
+from __future__ import annotations
+
+import mmap
+import os
+import sqlite3
+import subprocess
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator
+
+from player.audio_engine import build_ffmpeg_decode_command
+from player.models import AudioFile
+
+DEFAULT_MAX_BYTES = 2 * 1024**3
+SAMPLE_WIDTH = 2  # signed 16-bit PCM
+CACHE_SUFFIX = ".pcm"
+
+
+@dataclass(frozen=True)
+class PcmFormat:
+    sample_rate: int
+    channels: int
+
+    @property
+    def frame_bytes(self) -> int:
+        return self.channels * SAMPLE_WIDTH
+
+    @property
+    def tag(self) -> str:
+        return f"{self.sample_rate}hz{self.channels}ch"
+
+
+TRANSCRIPTION_FORMAT = PcmFormat(sample_rate=16000, channels=1)
+PLAYBACK_FORMAT = PcmFormat(sample_rate=44100, channels=2)
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    path: Path
+    size_bytes: int
+    last_used_ns: int
+
+
+def cache_dir_for(db_path: str | Path) -> Path:
+    path = Path(db_path)
+    return path.with_name(path.name + ".audio-cache")
+
+
+class CachedPcm:
+    """A memory-mapped cache entry; slices are zero-copy views of the mapping.
+
+    Views handed out by ``view`` and ``samples`` keep the mapping alive. ``close``
+    unmaps immediately when none are left; otherwise the mapping is released when
+    the last view is garbage collected.
+    """
+
+    def __init__(self, path: str | Path, pcm_format: PcmFormat) -> None:
+        self.path = Path(path)
+        self.format = pcm_format
+        with open(self.path, "rb") as handle:
+            size = os.fstat(handle.fileno()).st_size
+            # mmap cannot map an empty file; an empty entry is a silent file.
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.frames = size // pcm_format.frame_bytes
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.frames / self.format.sample_rate
+
+    def frame_range(
+        self, start_seconds: float = 0.0, end_seconds: float | None = None
+    ) -> tuple[int, int]:
+        rate = self.format.sample_rate
+        first = min(max(int(start_seconds * rate), 0), self.frames)
+        last = self.frames if end_seconds is None else int(end_seconds * rate)
+        return first, min(max(last, first), self.frames)
+
+    def view(self, start_seconds: float = 0.0, end_seconds: float | None = None) -> memoryview:
+        """Return the interleaved PCM bytes for a time range without copying."""
+        if self._mmap is None:
+            return memoryview(b"")
+        first, last = self.frame_range(start_seconds, end_seconds)
+        frame_bytes = self.format.frame_bytes
+        return memoryview(self._mmap)[first * frame_bytes : last * frame_bytes]
+
+    def samples(self, start_seconds: float = 0.0, end_seconds: float | None = None):
+        """Return a read-only ``(frames, channels)`` int16 array over the mapping."""
+        # Imported on first use: NumPy is optional, and most commands that open the
+        # cache never ask for an array.
+        try:
+            import numpy as np
+        except ImportError:
+            raise RuntimeError("NumPy is required for sample arrays; use view() instead") from None
+        data = np.frombuffer(self.view(start_seconds, end_seconds), dtype="<i2")
+        return data.reshape(-1, self.format.channels)
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap = None
+
+    def __enter__(self) -> CachedPcm:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+class AudioCache:
+    """Decoded PCM keyed by content hash and format, bounded by ``max_bytes``.
+
+    Entries are raw little-endian 16-bit PCM, written to a temporary file in the
+    same directory and renamed into place, so readers only ever see complete
+    entries. An entry's mtime records its last use; when the cache grows past its
+    budget, the least recently used entries are deleted first.
+    """
+
+    def __init__(self, root: str | Path, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def entry_path(self, file_hash: str, pcm_format: PcmFormat) -> Path:
+        return self.root / file_hash[:2] / f"{file_hash}.{pcm_format.tag}{CACHE_SUFFIX}"
+
+    def contains(self, file_hash: str, pcm_format: PcmFormat) -> bool:
+        return self.entry_path(file_hash, pcm_format).exists()
+
+    def get(self, file_hash: str, pcm_format: PcmFormat) -> CachedPcm | None:
+        """Open a cached entry and mark it as recently used, or return None on a miss."""
+        path = self.entry_path(file_hash, pcm_format)
+        try:
+            os.utime(path)
+            return CachedPcm(path, pcm_format)
+        except FileNotFoundError:
+            return None
+
+    def ensure(
+        self,
+        audio_path: str | Path,
+        file_hash: str,
+        pcm_format: PcmFormat,
+        timeout: float | None = None,
+    ) -> CachedPcm:
+        """Return the cached PCM for ``audio_path``, decoding it with ffmpeg on a miss."""
+        cached = self.get(file_hash, pcm_format)
+        if cached is not None:
+            return cached
+        command = build_ffmpeg_decode_command(
+            audio_path, sample_rate=pcm_format.sample_rate, channels=pcm_format.channels
+        )
+
+        def decode(handle) -> None:
+            result = subprocess.run(
+                command.args,
+                stdin=subprocess.DEVNULL,
+                stdout=handle,
+                stderr=subprocess.PIPE,
+                timeout=timeout,
+                check=False,
+            )
+            if result.returncode != 0:
+                message = result.stderr.decode(errors="replace").strip()
+                raise RuntimeError(message or f"ffmpeg failed to decode {audio_path}")
+
+        return self._store(file_hash, pcm_format, decode)
+
+    def ensure_file(
+        self,
+        connection: sqlite3.Connection,
+        audio_file: AudioFile,
+        pcm_format: PcmFormat = TRANSCRIPTION_FORMAT,
+    ) -> CachedPcm:
+        """Like ``ensure`` for a library file, hashing it first if the scan did not.
+
+        The hash is saved to ``audio_files`` so later lookups skip the full read.
+        """
+        file_hash = audio_file.file_hash
+        if file_hash is None:
+            from player.scanner import store_file_hash
+
+            file_hash = store_file_hash(connection, audio_file.id, audio_file.path)
+        return self.ensure(audio_file.path, file_hash, pcm_format)
+
+    def put(self, file_hash: str, pcm_format: PcmFormat, chunks: Iterator[bytes]) -> CachedPcm:
+        """Store already decoded PCM, replacing any existing entry atomically."""
+
+        def write(handle) -> None:
+            for chunk in chunks:
+                handle.write(chunk)
+
+        return self._store(file_hash, pcm_format, write)
+
+    def _store(
+        self, file_hash: str, pcm_format: PcmFormat, fill: Callable[[object], None]
+    ) -> CachedPcm:
+        path = self.entry_path(file_hash, pcm_format)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                fill(handle)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(temp_name, path)
+        except BaseException:
+            try:
+                os.unlink(temp_name)
+            except FileNotFoundError:
+                pass
+            raise
+        self.evict(keep=path)
+        return CachedPcm(path, pcm_format)
+
+    def entries(self) -> list[CacheEntry]:
+        """Every complete entry, least recently used first."""
+        entries = []
+        for shard in _scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in _scandir(shard.path):
+                if entry.name.endswith(CACHE_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append(CacheEntry(Path(entry.path), stat.st_size, stat.st_mtime_ns))
+        entries.sort(key=lambda entry: entry.last_used_ns)
+        return entries
+
+    def usage_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self.entries())
+
+    def evict(self, keep: Path | None = None) -> int:
+        """Delete least recently used entries until the cache fits its budget.
+
+        Returns the number of bytes freed. Open ``CachedPcm`` mappings of a deleted
+        entry stay readable on POSIX; entries that cannot be removed are skipped.
+        """
+        entries = self.entries()
+        usage = sum(entry.size_bytes for entry in entries)
+        freed = 0
+        for entry in entries:
+            if usage - freed <= self.max_bytes:
+                break
+            if entry.path == keep:
+                continue
+            try:
+                entry.path.unlink()
+            except OSError:
+                continue
+            freed += entry.size_bytes
+        return freed
+
+    def clear(self) -> int:
+        freed = 0
+        for entry in self.entries():
+            try:
+                entry.path.unlink()
+            except OSError:
+                continue
+            freed += entry.size_bytes
+        return freed
+
+
+def _scandir(path: str | Path) -> list[os.DirEntry]:
+    try:
+        return list(os.scandir(path))
+    except FileNotFoundError:
+        return []
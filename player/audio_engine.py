@@ -6,6 +6,8 @@ import subprocess
 from dataclasses import dataclass
 from pathlib import Path
 
+from player import metrics
+
 
 @dataclass(frozen=True)
 class PlaybackCommand:
@@ -47,6 +49,80 @@ def build_ffplay_command(audio_path: str | Path, speed: float) -> PlaybackComman
     )
 
 
+def spawn(command: PlaybackCommand, **popen_kwargs) -> subprocess.Popen:
+    """Start ``command``, recording how long process creation took."""
+    with metrics.timer("process_spawn_seconds", program=Path(command.args[0]).name):
+        return subprocess.Popen(command.args, **popen_kwargs)
+
+
 def start_ffplay(audio_path: str | Path, speed: float) -> subprocess.Popen:
     command = build_ffplay_command(audio_path, speed)
-    return subprocess.Popen(command.args)
+    return spawn(command)
+
+
+def build_ffprobe_command(audio_path: str | Path) -> PlaybackCommand:
+    return PlaybackCommand(
+        args=[
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_entries",
+            "format=duration",
+            "-of",
+            "default=noprint_wrappers=1:nokey=1",
+            str(audio_path),
+        ]
+    )
+
+
+def probe_duration(audio_path: str | Path, timeout: float = 30.0) -> float:
+    command = build_ffprobe_command(audio_path)
+    result = subprocess.run(
+        command.args, capture_output=True, text=True, timeout=timeout, check=False
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"ffprobe failed for {audio_path}")
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        raise RuntimeError(f"ffprobe reported no duration for {audio_path}") from None
+
+
+def build_ffmpeg_decode_command(
+    audio_path: str | Path,
+    start_seconds: float = 0.0,
+    speed: float = 1.0,
+    sample_rate: int = 44100,
+    channels: int = 2,
+) -> PlaybackCommand:
+    """Decode to interleaved signed 16-bit PCM on stdout, seeking before the input."""
+    args = ["ffmpeg", "-nostdin", "-v", "error"]
+    if start_seconds > 0:
+        args += ["-ss", f"{start_seconds:.3f}"]
+    args += ["-i", str(audio_path), "-vn"]
+    if speed != 1.0:
+        args += ["-af", build_atempo_filter(speed)]
+    args += ["-f", "s16le", "-acodec", "pcm_s16le"]
+    args += ["-ac", str(channels), "-ar", str(sample_rate), "-"]
+    return PlaybackCommand(args=args)
+
+
+def build_ffplay_pcm_command(sample_rate: int = 44100, channels: int = 2) -> PlaybackCommand:
+    """Play raw PCM from stdin, for use as a long-lived output device."""
+    return PlaybackCommand(
+        args=[
+            "ffplay",
+            "-nodisp",
+            "-autoexit",
+            "-loglevel",
+            "error",
+            "-f",
+            "s16le",
+            "-ar",
+            str(sample_rate),
+            "-ac",
+            str(channels),
+            "-i",
+            "-",
+        ]
+    )
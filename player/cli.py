@@ -0,0 +1,1197 @@
+"""Command implementations behind ``main.py``, shared by one-shot runs and the daemon."""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shlex
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, TextIO
+
+from player import db, metrics
+from player.archive import DEFAULT_COMPRESS_LEVEL, export_library, import_library
+from player.daemon import (
+    DEFAULT_DB_PATH,
+    DaemonClient,
+    DaemonServer,
+    capture_command,
+    socket_path_for,
+)
+from player.history import (
+    DEFAULT_KEEP_SESSIONS_DAYS,
+    compact_history,
+    listening_totals,
+    recent_sessions,
+)
+from player.journal import journal_path_for, replay_journal
+from player.library import (
+    OVERVIEW_SORTS,
+    add_audio_file,
+    create_audiobook,
+    library_overview,
+    library_totals,
+    list_audio_files,
+    list_audiobooks,
+)
+from player.models import PlaybackState, TranscriptSegment
+from player.playback import (
+    BookTimeline,
+    PlaybackRepository,
+    PlaybackSession,
+    compute_global_position,
+)
+from player.relink import HashUpgrader, relink_missing, upgrade_hashes
+from player.scanner import scan_library
+from player.transcript import (
+    TranscriptIndex,
+    add_segment,
+    add_segments,
+    find_segment_at_time,
+    search_transcripts,
+)
+from player.transcription import (
+    DEFAULT_CHUNK_SECONDS,
+    TranscriptionScheduler,
+    enqueue_audiobook,
+    load_backend,
+    transcription_progress,
+)
+from player.transcript_formats import TRANSCRIPT_FORMATS, detect_format, iter_transcript_file
+from player.waveform import DEFAULT_MIN_SILENCE_SECONDS, DEFAULT_SILENCE_THRESHOLD_DB
+
+if TYPE_CHECKING:
+    from player.streaming import StreamingAudioEngine
+
+# File arguments that commands run on the daemon open, resolved against the
+# client's working directory. add-file paths are stored as given, as in local runs.
+CLIENT_PATH_ARGUMENTS = {"import-transcript": ("path",), "stats": ("output",)}
+# Files whose transcript index the daemon keeps in memory.
+CACHED_TRANSCRIPTS = 8
+WAVEFORM_BARS = "\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588"
+
+# Output streams of the command ``parse_command`` is parsing, for help and errors.
+_parser_streams: ContextVar[tuple[TextIO, TextIO] | None] = ContextVar(
+    "parser_streams", default=None
+)
+
+
+class CommandParser(argparse.ArgumentParser):
+    """An ``ArgumentParser`` that writes help and errors to the command's own streams.
+
+    Inside ``parse_command`` usage, help and error messages go to the ``out`` and
+    ``err`` it was given rather than to ``sys.stdout`` and ``sys.stderr``, which
+    the daemon's player threads share with every client. Subcommand parsers are
+    created with the same class.
+    """
+
+    def _streams(self) -> tuple[TextIO, TextIO]:
+        return _parser_streams.get() or (sys.stdout, sys.stderr)
+
+    def print_usage(self, file: TextIO | None = None) -> None:
+        super().print_usage(file or self._streams()[0])
+
+    def print_help(self, file: TextIO | None = None) -> None:
+        super().print_help(file or self._streams()[0])
+
+    def exit(self, status: int = 0, message: str | None = None) -> None:
+        if message:
+            self._streams()[1].write(message)
+        raise SystemExit(status)
+
+    def error(self, message: str) -> None:
+        self.print_usage(self._streams()[1])
+        self.exit(2, f"{self.prog}: error: {message}\n")
+
+
+def parse_command(
+    parser: argparse.ArgumentParser, argv: list[str], out: TextIO, err: TextIO
+) -> argparse.Namespace:
+    token = _parser_streams.set((out, err))
+    try:
+        return parser.parse_args(argv)
+    finally:
+        _parser_streams.reset(token)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = CommandParser(description="Audiobook player plan implementation")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to sqlite database")
+    parser.add_argument(
+        "--no-daemon", action="store_true", help="Run here even if a daemon is serving the database"
+    )
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("init", help="Initialize the database")
+
+    serve = subparsers.add_parser(
+        "serve", help="Keep the database and player warm and answer commands over a local socket"
+    )
+    serve.add_argument("--stop", action="store_true", help="Shut down the running daemon")
+    serve.add_argument(
+        "--metrics", action="store_true", help="Record timings for the 'stats' command"
+    )
+
+    batch = subparsers.add_parser(
+        "batch", help="Run many commands from JSON or argv-style lines on one connection"
+    )
+    batch.add_argument("path", nargs="?", default="-", help="Command file, or - for stdin")
+    batch.add_argument(
+        "--transaction-size",
+        type=int,
+        default=1000,
+        help="Commands per transaction; 0 runs the whole batch in one transaction",
+    )
+    batch.add_argument("--stop-on-error", action="store_true")
+
+    add_book = subparsers.add_parser("add-book", help="Add a new audiobook")
+    add_book.add_argument("title")
+
+    list_books = subparsers.add_parser("list-books", help="List audiobooks")
+    list_books.set_defaults(command="list-books")
+
+    overview = subparsers.add_parser(
+        "overview", help="List audiobooks with file counts, durations and progress"
+    )
+    overview.add_argument("--sort", choices=OVERVIEW_SORTS, default="recent")
+    overview.add_argument("--limit", type=int, default=50, help="Books per page; 0 for all")
+    overview.add_argument("--offset", type=int, default=0)
+
+    add_file = subparsers.add_parser("add-file", help="Add audio file to an audiobook")
+    add_file.add_argument("audiobook_id", type=int)
+    add_file.add_argument("path")
+    add_file.add_argument("duration", type=float)
+    add_file.add_argument("order_index", type=int)
+    add_file.add_argument("--hash", dest="file_hash")
+
+    scan = subparsers.add_parser("scan", help="Scan a directory tree into audiobooks by folder")
+    scan.add_argument("root")
+    scan.add_argument("--probe-workers", type=int, help="Concurrent ffprobe processes")
+    scan.add_argument("--hash-workers", type=int, help="Processes used for content hashing")
+    scan.add_argument(
+        "--full-hash",
+        dest="hash_files",
+        action="store_true",
+        help="Also hash every changed file in full instead of leaving it to hash-files",
+    )
+    # Full hashing used to be the default; the old opt-out is still accepted.
+    scan.add_argument("--no-hash", dest="hash_files", action="store_false", help=argparse.SUPPRESS)
+
+    relink = subparsers.add_parser(
+        "relink", help="Find moved library files under directories by fingerprint"
+    )
+    relink.add_argument("roots", nargs="+", metavar="DIR")
+    relink.add_argument("--workers", type=int, help="Threads fingerprinting candidates")
+    relink.add_argument(
+        "--dry-run", action="store_true", help="Report matches without updating the library"
+    )
+
+    hash_files = subparsers.add_parser(
+        "hash-files", help="Compute full content hashes for files that only have a fingerprint"
+    )
+    hash_files.add_argument("--limit", type=int, help="Hash at most this many files")
+    hash_files.add_argument("--workers", type=int, help="Hashing processes")
+    hash_files.add_argument(
+        "--background",
+        action="store_true",
+        help="Hash in the daemon's background and return at once (see hash-files --status)",
+    )
+    hash_files.add_argument(
+        "--status", action="store_true", help="Report on the daemon's background hashing"
+    )
+
+    export = subparsers.add_parser(
+        "export", help="Write books, files, positions and transcripts to a compressed archive"
+    )
+    export.add_argument("path")
+    export.add_argument(
+        "--compress-level", type=int, choices=range(1, 10), default=DEFAULT_COMPRESS_LEVEL
+    )
+
+    import_archive = subparsers.add_parser(
+        "import", help="Merge an archive from export into the library"
+    )
+    import_archive.add_argument("path")
+
+    cache_audio = subparsers.add_parser(
+        "cache-audio", help="Decode an audiobook's files into the PCM cache"
+    )
+    cache_audio.add_argument("audiobook_id", type=int)
+    cache_audio.add_argument(
+        "--playback", action="store_true", help="Cache playback-rate PCM instead of 16 kHz mono"
+    )
+    cache_audio.add_argument("--max-mb", type=int, help="Cache size budget in MiB")
+
+    analyze_audio = subparsers.add_parser(
+        "analyze-audio", help="Compute waveform peaks and silence maps for an audiobook's files"
+    )
+    analyze_audio.add_argument("audiobook_id", type=int)
+    analyze_audio.add_argument("--force", action="store_true", help="Recompute stored analyses")
+    analyze_audio.add_argument(
+        "--threshold-db", type=float, default=DEFAULT_SILENCE_THRESHOLD_DB, help="Silence level"
+    )
+    analyze_audio.add_argument(
+        "--min-silence", type=float, default=DEFAULT_MIN_SILENCE_SECONDS, help="Shortest pause"
+    )
+
+    waveform = subparsers.add_parser("waveform", help="Draw a file's stored waveform as text")
+    waveform.add_argument("audio_file_id", type=int)
+    waveform.add_argument("--start", type=float, default=0.0)
+    waveform.add_argument("--end", type=float, help="Defaults to the end of the file")
+    waveform.add_argument("--width", type=int, default=80)
+
+    list_files = subparsers.add_parser("list-files", help="List audio files for an audiobook")
+    list_files.add_argument("audiobook_id", type=int)
+
+    update_pos = subparsers.add_parser("update-position", help="Update playback position")
+    update_pos.add_argument("audiobook_id", type=int)
+    update_pos.add_argument("audio_file_id", type=int)
+    update_pos.add_argument("position", type=float)
+
+    advance = subparsers.add_parser("advance", help="Advance playback position with auto-advance")
+    advance.add_argument("audiobook_id", type=int)
+    advance.add_argument("audio_file_id", type=int)
+    advance.add_argument("position", type=float)
+    advance.add_argument("delta", type=float)
+
+    resume = subparsers.add_parser("resume", help="Get stored playback state")
+    resume.add_argument("audiobook_id", type=int)
+
+    history = subparsers.add_parser("history", help="List an audiobook's listening sessions")
+    history.add_argument("audiobook_id", type=int)
+    history.add_argument("--limit", type=int, default=10)
+
+    jump_back = subparsers.add_parser(
+        "jump-back", help="Return to where an earlier listening session ended"
+    )
+    jump_back.add_argument("audiobook_id", type=int)
+    jump_back.add_argument(
+        "--steps", type=int, default=1, help="Sessions to go back; 1 is the one before the current"
+    )
+
+    listening_stats = subparsers.add_parser(
+        "listening-stats", help="Total listened time per audiobook"
+    )
+    listening_stats.add_argument("--book", dest="audiobook_id", type=int)
+    listening_stats.add_argument("--since", help="UTC date or datetime, e.g. 2024-01-31")
+
+    compact = subparsers.add_parser(
+        "compact-history", help="Roll old listening sessions into daily totals"
+    )
+    compact.add_argument("--keep-sessions-days", type=int, default=DEFAULT_KEEP_SESSIONS_DAYS)
+    compact.add_argument("--keep-days", type=int, help="Also delete daily totals older than this")
+
+    global_pos = subparsers.add_parser("global-position", help="Compute global position")
+    global_pos.add_argument("audiobook_id", type=int)
+    global_pos.add_argument("audio_file_id", type=int)
+    global_pos.add_argument("position", type=float)
+
+    add_segment_cmd = subparsers.add_parser("add-segment", help="Add transcript segment")
+    add_segment_cmd.add_argument("audio_file_id", type=int)
+    add_segment_cmd.add_argument("start", type=float)
+    add_segment_cmd.add_argument("end", type=float)
+    add_segment_cmd.add_argument("text")
+
+    import_transcript = subparsers.add_parser(
+        "import-transcript", help="Import transcript segments from an SRT, VTT or JSON file"
+    )
+    import_transcript.add_argument("audio_file_id", type=int)
+    import_transcript.add_argument("path")
+    import_transcript.add_argument("--format", dest="transcript_format", choices=TRANSCRIPT_FORMATS)
+    import_transcript.add_argument("--chunk-size", type=int, default=db.DEFAULT_CHUNK_SIZE)
+
+    transcribe = subparsers.add_parser(
+        "transcribe", help="Queue an audiobook for transcription and run the queue"
+    )
+    transcribe.add_argument(
+        "audiobook_id", type=int, nargs="?", help="Omit to resume the existing queue"
+    )
+    transcribe.add_argument(
+        "--backend", default="fake", help="'fake' or module:ClassName of a backend"
+    )
+    transcribe.add_argument("--workers", type=int, help="Transcription worker processes")
+    transcribe.add_argument("--chunk-seconds", type=float, default=DEFAULT_CHUNK_SECONDS)
+    transcribe.add_argument(
+        "--replace",
+        action="store_true",
+        help="Delete the transcripts and queued chunks of files that have them and redo them",
+    )
+    transcribe.add_argument(
+        "--no-cache", dest="use_cache", action="store_false", help="Skip the PCM cache"
+    )
+
+    find_segment_cmd = subparsers.add_parser("find-segment", help="Find transcript segment")
+    find_segment_cmd.add_argument("audio_file_id", type=int)
+    find_segment_cmd.add_argument("position", type=float)
+
+    search = subparsers.add_parser("search", help="Full-text search across transcripts")
+    search.add_argument("query")
+    search.add_argument("--book", dest="audiobook_id", type=int, help="Limit to one audiobook")
+    search.add_argument("--limit", type=int, default=20)
+
+    play = subparsers.add_parser("play", help="Play an audiobook from its saved position (daemon)")
+    play.add_argument("audiobook_id", type=int)
+    play.add_argument("--speed", type=float)
+    play.add_argument(
+        "--skip-silence",
+        action=argparse.BooleanOptionalAction,
+        help="Skip long pauses found by analyze-audio",
+    )
+    subparsers.add_parser("pause", help="Pause playback and save the position (daemon)")
+    subparsers.add_parser("stop", help="Stop playback and save the position (daemon)")
+    subparsers.add_parser("status", help="Show what the daemon is playing")
+
+    stats = subparsers.add_parser(
+        "stats", help="Dump recorded metrics (from the daemon when one is serving)"
+    )
+    stats.add_argument(
+        "--format", dest="metrics_format", choices=metrics.EXPORT_FORMATS, default="json"
+    )
+    stats.add_argument("--output", help="Write the snapshot to this file instead of stdout")
+    stats.add_argument("--reset", action="store_true", help="Clear metrics after dumping them")
+
+    return parser
+
+
+class CommandContext:
+    """Everything commands share within one process.
+
+    A one-shot run builds a context for a single command; the daemon keeps one for
+    its lifetime, so the connection, book timelines and the player stay warm.
+    """
+
+    def __init__(
+        self, connection: sqlite3.Connection, database_path: Path, serving: bool = False
+    ) -> None:
+        self.connection = connection
+        self.database_path = database_path
+        self.serving = serving
+        self.repository = PlaybackRepository(connection)
+        self.engine: StreamingAudioEngine | None = None
+        self.session: PlaybackSession | None = None
+        self.hash_upgrader: HashUpgrader | None = None
+        self._timelines: dict[int, BookTimeline] = {}
+        self._transcripts: OrderedDict[int, TranscriptIndex] = OrderedDict()
+        self._cache_version: tuple[int, int] | None = None
+
+    @classmethod
+    def open(cls, database_path: Path, serving: bool = False) -> CommandContext:
+        connection = db.initialize_db(database_path)
+        replay_journal(PlaybackRepository(connection), journal_path_for(database_path))
+        return cls(connection, database_path, serving)
+
+    def timeline(self, audiobook_id: int) -> BookTimeline:
+        """The book's timeline, rebuilt only after the database has changed."""
+        self._check_cache_version()
+        timeline = self._timelines.get(audiobook_id)
+        if timeline is None:
+            timeline = BookTimeline(list_audio_files(self.connection, audiobook_id))
+            self._timelines[audiobook_id] = timeline
+        return timeline
+
+    def transcript(self, audio_file_id: int) -> TranscriptIndex:
+        """The file's transcript index, for the ``CACHED_TRANSCRIPTS`` most recent files.
+
+        Like timelines, indexes are rebuilt only after the database has changed.
+        """
+        self._check_cache_version()
+        index = self._transcripts.get(audio_file_id)
+        if index is None:
+            index = TranscriptIndex.load(self.connection, audio_file_id)
+            self._transcripts[audio_file_id] = index
+            while len(self._transcripts) > CACHED_TRANSCRIPTS:
+                self._transcripts.popitem(last=False)
+        self._transcripts.move_to_end(audio_file_id)
+        return index
+
+    def _check_cache_version(self) -> None:
+        # data_version moves when another connection commits; total_changes when we do.
+        version = (
+            self.connection.execute("PRAGMA data_version").fetchone()[0],
+            self.connection.total_changes,
+        )
+        if version != self._cache_version:
+            self._timelines.clear()
+            self._transcripts.clear()
+            self._cache_version = version
+
+    def play(
+        self, audiobook_id: int, speed: float | None = None, skip_silence: bool | None = None
+    ) -> float:
+        """Start or resume a book and return the global position it plays from."""
+        if not self.serving:
+            raise ValueError("Playback needs a running daemon; start one with 'main.py serve'.")
+        if self.session is not None and self.session.audiobook_id != audiobook_id:
+            self.stop_playback()
+        if self.engine is None:
+            # Imported here so that commands which never play skip NumPy, which only
+            # streaming's time-stretcher loads, and ffplay setup.
+            from player.audio_cache import AudioCache, cache_dir_for
+            from player.streaming import FfplaySink, StreamingAudioEngine
+
+            self.engine = StreamingAudioEngine(
+                FfplaySink(), audio_cache=AudioCache(cache_dir_for(self.database_path))
+            )
+        if speed is not None:
+            self.engine.set_speed(speed)
+        if self.session is None:
+            timeline = self.timeline(audiobook_id)
+            state = self.repository.get_state(audiobook_id)
+            position = (
+                timeline.global_position(state.audio_file_id, state.position_seconds)
+                if state
+                else 0.0
+            )
+            self.engine.load_book(timeline, position)
+            self.session = PlaybackSession(self.repository, audiobook_id, timeline)
+            self.session.start_autosave(self._current_state)
+        if skip_silence:
+            from player.waveform import load_silence_maps
+
+            maps = load_silence_maps(self.connection, self.session.timeline)
+            self.engine.set_skip_silence(
+                {audio_file_id: silences.skippable() for audio_file_id, silences in maps.items()}
+            )
+        elif skip_silence is not None:
+            self.engine.set_skip_silence(None)
+        self.engine.play()
+        return self.engine.position_seconds
+
+    def pause(self) -> PlaybackState | None:
+        if self.session is None or self.engine is None:
+            return None
+        self.engine.pause()
+        state = self._current_state()
+        self.session.save_state(state)
+        return state
+
+    def stop_playback(self) -> PlaybackState | None:
+        state = self.pause()
+        if self.session is not None:
+            self.session.stop_autosave()
+            self.session = None
+        if self.engine is not None:
+            self.engine.stop()
+        return state
+
+    def _current_state(self) -> PlaybackState:
+        return self.session.state_at_global_position(self.engine.position_seconds)
+
+    def close(self) -> None:
+        self.stop_playback()
+        if self.hash_upgrader is not None:
+            self.hash_upgrader.stop()
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+        self.connection.close()
+
+
+class DeferredCommitConnection:
+    """Connection wrapper that leaves commits to the batch runner.
+
+    Handlers commit (and roll back on error) after every command. Inside a batch
+    both are no-ops, so the runner can group commands into larger transactions and
+    undo a failed command through its savepoint instead.
+    """
+
+    def __init__(self, connection: sqlite3.Connection) -> None:
+        self._connection = connection
+
+    def __getattr__(self, name: str):
+        return getattr(self._connection, name)
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+
+def parse_batch_line(line: str) -> list[str] | None:
+    """Return the argv of one batch line, or None for blank and comment lines.
+
+    A line is either JSON (an argv list, or an object with an ``argv`` list) or a
+    shell-quoted command line such as ``add-file 1 "Part 1.mp3" 3600 0``.
+    """
+    text = line.strip()
+    if not text or text.startswith("#"):
+        return None
+    if text[0] in "[{":
+        value = json.loads(text)
+        argv = value.get("argv") if isinstance(value, dict) else value
+        if not isinstance(argv, list):
+            raise ValueError("JSON batch lines must be an argv list or have an 'argv' list")
+        return [str(arg) for arg in argv]
+    return shlex.split(text)
+
+
+def run_batch(
+    lines: Iterable[str],
+    context: CommandContext,
+    parser: argparse.ArgumentParser,
+    output: TextIO,
+    transaction_size: int = 1000,
+    stop_on_error: bool = False,
+) -> tuple[int, int]:
+    """Run each line as a command and write one JSON result line per command.
+
+    Commands share one connection and are committed ``transaction_size`` at a time
+    (all at once for 0). Each runs in a savepoint, so a failing command is undone
+    while the rest of its transaction stands. Returns (commands run, failures).
+    """
+    if transaction_size < 0:
+        raise ValueError("Transaction size must not be negative")
+    connection = context.connection
+    batch_context = CommandContext(
+        DeferredCommitConnection(connection), context.database_path, context.serving
+    )
+
+    def execute(argv: list[str], out: TextIO, err: TextIO) -> int:
+        args = parse_command(parser, argv, out, err)
+        if args.command in ("serve", "batch"):
+            raise ValueError(f"'{args.command}' cannot run inside a batch.")
+        run_command(args, batch_context, out, err)
+        return 0
+
+    commands = failures = pending = 0
+    try:
+        for number, line in enumerate(lines, start=1):
+            try:
+                argv = parse_batch_line(line)
+            except ValueError as exc:
+                argv, error = [], f"Error: {exc}\n"
+            else:
+                if argv is None:
+                    continue
+                error = None
+            if pending == 0:
+                connection.execute("BEGIN")
+            connection.execute("SAVEPOINT batch_command")
+            started = time.perf_counter()
+            if error is None:
+                response = capture_command(execute, argv)
+                exit_code, stdout, stderr = response.exit_code, response.stdout, response.stderr
+            else:
+                exit_code, stdout, stderr = 2, "", error
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if exit_code:
+                connection.execute("ROLLBACK TO batch_command")
+                failures += 1
+            connection.execute("RELEASE batch_command")
+            commands += 1
+            pending += 1
+            if transaction_size and pending >= transaction_size:
+                connection.commit()
+                pending = 0
+            output.write(
+                json.dumps(
+                    {
+                        "line": number,
+                        "argv": argv,
+                        "exit_code": exit_code,
+                        "stdout": stdout,
+                        "stderr": stderr,
+                        "elapsed_ms": round(elapsed_ms, 3),
+                    }
+                )
+                + "\n"
+            )
+            if exit_code and stop_on_error:
+                break
+    except BaseException:
+        connection.rollback()
+        raise
+    if pending:
+        connection.commit()
+    output.flush()
+    return commands, failures
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    database_path = Path(args.db)
+    if args.command == "serve":
+        serve(database_path, args.stop, args.metrics)
+        return
+    context = CommandContext.open(database_path)
+    try:
+        if args.command == "batch":
+            started = time.perf_counter()
+            stream = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8")
+            with stream:
+                commands, failures = run_batch(
+                    stream,
+                    context,
+                    parser,
+                    sys.stdout,
+                    args.transaction_size,
+                    args.stop_on_error,
+                )
+            print(
+                f"Ran {commands} commands in {time.perf_counter() - started:.2f}s,"
+                f" {failures} failed",
+                file=sys.stderr,
+            )
+            if failures:
+                raise SystemExit(1)
+            return
+        run_command(args, context)
+    finally:
+        context.close()
+
+
+def serve(database_path: Path, stop: bool = False, record_metrics: bool = False) -> None:
+    socket_path = socket_path_for(database_path)
+    if stop:
+        try:
+            with DaemonClient(socket_path, timeout=5.0) as client:
+                client.shutdown()
+        except OSError:
+            print("No daemon is running.")
+            return
+        print("Daemon stopped.")
+        return
+    if record_metrics:
+        metrics.enable()
+    context = CommandContext.open(database_path, serving=True)
+    # Applies the default retention on every daemon start; a no-op when nothing is old.
+    compact_history(context.connection)
+    parser = build_parser()
+
+    def execute(argv: list[str], cwd: str, out: TextIO, err: TextIO) -> int:
+        args = parse_command(parser, argv, out, err)
+        if args.command in ("serve", "batch"):
+            raise ValueError(f"'{args.command}' cannot run inside the daemon.")
+        for name in CLIENT_PATH_ARGUMENTS.get(args.command, ()):
+            if getattr(args, name) is not None:
+                setattr(args, name, os.path.join(cwd, getattr(args, name)))
+        run_command(args, context, out, err)
+        return 0
+
+    def ready() -> None:
+        print(f"Serving {database_path} on {socket_path}", flush=True)
+
+    server = DaemonServer(socket_path, execute)
+    try:
+        server.serve(ready)
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as exc:
+        raise SystemExit(str(exc)) from None
+    finally:
+        context.close()
+
+
+def run_command(
+    args: argparse.Namespace,
+    context: CommandContext,
+    out: TextIO | None = None,
+    err: TextIO | None = None,
+) -> None:
+    """Run a parsed command, writing its output to ``out`` and ``err``.
+
+    They default to ``sys.stdout`` and ``sys.stderr``. The daemon and batches pass
+    a buffer per command instead, so that no other thread's output ends up in it.
+    """
+    with metrics.timer("command_seconds", command=args.command):
+        _run_command(args, context, out or sys.stdout, err or sys.stderr)
+
+
+def _run_command(
+    args: argparse.Namespace, context: CommandContext, out: TextIO, err: TextIO
+) -> None:
+    connection = context.connection
+    database_path = context.database_path
+
+    if args.command == "init":
+        print(f"Initialized database at {database_path}", file=out)
+        return
+
+    if args.command == "add-book":
+        book = create_audiobook(connection, args.title)
+        print(f"Created audiobook {book.id}: {book.title}", file=out)
+        return
+
+    if args.command == "list-books":
+        for book in list_audiobooks(connection):
+            print(f"{book.id}: {book.title}", file=out)
+        return
+
+    if args.command == "overview":
+        for book in library_overview(connection, args.limit or None, args.offset, args.sort):
+            print(
+                f"{book.audiobook_id}: {book.title} ({book.file_count} files)"
+                f" {book.global_position_seconds:.2f}s of {book.total_duration_seconds:.2f}s"
+                f" ({book.percent_complete:.1f}%)",
+                file=out,
+            )
+        totals = library_totals(connection)
+        print(
+            f"{totals.books} audiobooks, {totals.files} files,"
+            f" {totals.total_duration_seconds:.2f}s total;"
+            f" {totals.books_started} started, {totals.listened_seconds:.2f}s listened",
+            file=out,
+        )
+        return
+
+    if args.command == "add-file":
+        audio_file = add_audio_file(
+            connection,
+            args.audiobook_id,
+            args.path,
+            args.duration,
+            args.order_index,
+            args.file_hash,
+        )
+        print(f"Added audio file {audio_file.id} to audiobook {audio_file.audiobook_id}", file=out)
+        return
+
+    if args.command == "scan":
+        result = scan_library(
+            connection,
+            args.root,
+            probe_workers=args.probe_workers,
+            hash_workers=args.hash_workers,
+            hash_files=args.hash_files,
+        )
+        print(
+            f"Scanned {args.root}: {result.books_created} new audiobooks,"
+            f" {result.files_added} files added, {result.files_updated} updated,"
+            f" {result.files_unchanged} unchanged",
+            file=out,
+        )
+        for path, error in result.errors:
+            print(f"  failed {path}: {error}", file=out)
+        return
+
+    if args.command == "relink":
+        result = relink_missing(connection, args.roots, workers=args.workers, dry_run=args.dry_run)
+        verb = "Would relink" if args.dry_run else "Relinked"
+        print(
+            f"{verb} {len(result.relinked)} of {result.missing} missing files"
+            f" ({result.candidates} candidates checked)",
+            file=out,
+        )
+        for audio_file_id, old_path, new_path in result.relinked:
+            print(f"  {audio_file_id}: {old_path} -> {new_path}", file=out)
+        for path in result.ambiguous:
+            print(f"  several matches for {path}", file=out)
+        for path in result.unmatched:
+            print(f"  not found {path}", file=out)
+        return
+
+    if args.command == "hash-files":
+        upgrader = context.hash_upgrader
+        if args.status:
+            if upgrader is None:
+                print("No background hashing has run.", file=out)
+            elif upgrader.running:
+                print(f"Hashing in the background: {upgrader.hashed_so_far} files so far", file=out)
+            elif upgrader.error:
+                print(f"Background hashing failed: {upgrader.error}", file=out)
+            else:
+                print(
+                    f"Background hashing finished: {upgrader.result.hashed} files hashed",
+                    file=out,
+                )
+            return
+        if args.background:
+            if not context.serving:
+                raise ValueError(
+                    "Background hashing needs a running daemon; start one with 'main.py serve'."
+                )
+            if upgrader is not None and upgrader.running:
+                print("Background hashing is already running.", file=out)
+                return
+            context.hash_upgrader = HashUpgrader(
+                context.database_path, workers=args.workers or 1, limit=args.limit
+            )
+            context.hash_upgrader.start()
+            print("Started hashing in the background.", file=out)
+            return
+        result = upgrade_hashes(connection, limit=args.limit, workers=args.workers)
+        print(f"Hashed {result.hashed} files, {result.missing} missing", file=out)
+        for path, error in result.errors:
+            print(f"  failed {path}: {error}", file=out)
+        return
+
+    if args.command == "export":
+        counts = export_library(connection, args.path, compress_level=args.compress_level)
+        print(
+            f"Exported {counts['audiobooks']} audiobooks, {counts['audio_files']} files,"
+            f" {counts['playback_state']} positions and {counts['transcript_segments']}"
+            f" transcript segments to {args.path}",
+            file=out,
+        )
+        return
+
+    if args.command == "import":
+        result = import_library(connection, args.path)
+        print(
+            f"Imported {args.path}: {result.books_created} new audiobooks"
+            f" ({result.books_merged} merged), {result.files_created} new files"
+            f" ({result.files_merged} merged), {result.positions_updated} positions updated"
+            f" ({result.positions_kept} already as new here), {result.segments_added}"
+            f" transcript segments added ({result.segments_skipped} skipped)",
+            file=out,
+        )
+        if result.files_missing:
+            print(
+                f"  {result.files_missing} imported files are not at their archived paths;"
+                " use relink to find them",
+                file=out,
+            )
+        return
+
+    if args.command == "cache-audio":
+        from player.audio_cache import (
+            PLAYBACK_FORMAT,
+            TRANSCRIPTION_FORMAT,
+            AudioCache,
+            cache_dir_for,
+        )
+
+        cache = AudioCache(cache_dir_for(database_path))
+        if args.max_mb is not None:
+            cache.max_bytes = args.max_mb * 1024 * 1024
+        pcm_format = PLAYBACK_FORMAT if args.playback else TRANSCRIPTION_FORMAT
+        for audio_file in list_audio_files(connection, args.audiobook_id):
+            with cache.ensure_file(connection, audio_file, pcm_format) as cached:
+                print(
+                    f"{audio_file.id}: {cached.duration_seconds:.1f}s cached at {cached.path}",
+                    file=out,
+                )
+        cache.evict()
+        print(f"Cache usage: {cache.usage_bytes() / 1024 / 1024:.1f} MiB", file=out)
+        return
+
+    if args.command == "analyze-audio":
+        from player.audio_cache import AudioCache, cache_dir_for
+        from player.waveform import analyze_file
+
+        cache = AudioCache(cache_dir_for(database_path))
+        for audio_file in list_audio_files(connection, args.audiobook_id):
+            analysis = analyze_file(
+                connection,
+                cache,
+                audio_file,
+                force=args.force,
+                silence_threshold_db=args.threshold_db,
+                min_silence_seconds=args.min_silence,
+            )
+            print(
+                f"{audio_file.id}: {analysis.duration_seconds:.1f}s,"
+                f" {len(analysis.levels)} waveform levels, {len(analysis.silences)} pauses",
+                file=out,
+            )
+        cache.evict()
+        return
+
+    if args.command == "waveform":
+        from player.waveform import load_analysis
+
+        row = connection.execute(
+            "SELECT file_hash FROM audio_files WHERE id = ?", (args.audio_file_id,)
+        ).fetchone()
+        analysis = load_analysis(connection, row["file_hash"]) if row and row["file_hash"] else None
+        if analysis is None:
+            print("No analysis stored; run analyze-audio first.", file=out)
+            return
+        end = analysis.duration_seconds if args.end is None else args.end
+        peaks, _ = analysis.render(args.start, end, args.width)
+        # Scaled to the loudest column so quiet recordings stay readable.
+        scale = len(WAVEFORM_BARS) / (float(peaks.max()) or 1.0)
+        top = len(WAVEFORM_BARS) - 1
+        print("".join(WAVEFORM_BARS[min(int(peak * scale), top)] for peak in peaks), file=out)
+        pauses = sum(1 for start, _ in analysis.silences if args.start <= start < end)
+        print(f"{args.start:.2f}s-{end:.2f}s, {pauses} pauses", file=out)
+        return
+
+    if args.command == "list-files":
+        files = list_audio_files(connection, args.audiobook_id)
+        for audio_file in files:
+            print(
+                f"{audio_file.id}: {audio_file.path}"
+                f" (duration {audio_file.duration_seconds}s, order {audio_file.order_index})",
+                file=out,
+            )
+        return
+
+    repository = context.repository
+
+    if args.command == "update-position":
+        repository.upsert_state(
+            PlaybackState(
+                audiobook_id=args.audiobook_id,
+                audio_file_id=args.audio_file_id,
+                position_seconds=args.position,
+            )
+        )
+        print("Playback position saved.", file=out)
+        return
+
+    if args.command == "advance":
+        timeline = context.timeline(args.audiobook_id)
+        next_position = timeline.advance(
+            args.audio_file_id,
+            args.position,
+            args.delta,
+        )
+        repository.upsert_state(
+            PlaybackState(
+                audiobook_id=args.audiobook_id,
+                audio_file_id=next_position.audio_file.id,
+                position_seconds=next_position.position_seconds,
+            )
+        )
+        print(
+            f"Advanced to file {next_position.audio_file.id}"
+            f" at {next_position.position_seconds:.2f}s",
+            file=out,
+        )
+        return
+
+    if args.command == "resume":
+        state = repository.get_state(args.audiobook_id)
+        if not state:
+            print("No playback state saved.", file=out)
+        else:
+            print(
+                f"Resume audiobook {state.audiobook_id}"
+                f" at file {state.audio_file_id} position {state.position_seconds:.2f}s",
+                file=out,
+            )
+        return
+
+    if args.command == "history":
+        sessions = recent_sessions(connection, args.audiobook_id, args.limit)
+        if not sessions:
+            print("No listening history.", file=out)
+        for session in sessions:
+            print(
+                f"{session.id}: {session.started_at} to {session.ended_at},"
+                f" file {session.start_audio_file_id} {session.start_position_seconds:.2f}s"
+                f" to file {session.end_audio_file_id} {session.end_position_seconds:.2f}s"
+                f" ({session.listened_seconds:.0f}s listened)",
+                file=out,
+            )
+        return
+
+    if args.command == "jump-back":
+        if args.steps < 1:
+            raise ValueError("--steps must be at least 1")
+        sessions = recent_sessions(connection, args.audiobook_id, args.steps + 1)
+        if len(sessions) <= args.steps:
+            print("No earlier listening session to jump back to.", file=out)
+            return
+        target = sessions[args.steps]
+        state = PlaybackState(
+            audiobook_id=args.audiobook_id,
+            audio_file_id=target.end_audio_file_id,
+            position_seconds=target.end_position_seconds,
+        )
+        session = context.session
+        if session is not None and session.audiobook_id == args.audiobook_id:
+            # Playing in the daemon: move the player, which the autosave then records.
+            context.engine.seek(
+                session.timeline.global_position(state.audio_file_id, state.position_seconds)
+            )
+            session.save_state(state)
+        else:
+            repository.upsert_state(state)
+        print(
+            f"Jumped back to file {state.audio_file_id} position {state.position_seconds:.2f}s"
+            f" (session ended {target.ended_at})",
+            file=out,
+        )
+        return
+
+    if args.command == "listening-stats":
+        totals = listening_totals(connection, args.audiobook_id, args.since)
+        if not totals:
+            print("No listening history.", file=out)
+        for total in totals:
+            print(
+                f"Audiobook {total.audiobook_id}: {total.listened_seconds / 3600:.2f}h"
+                f" in {total.sessions} sessions, last {total.last_listened_at}",
+                file=out,
+            )
+        return
+
+    if args.command == "compact-history":
+        result = compact_history(connection, args.keep_sessions_days, args.keep_days)
+        print(
+            f"Compacted {result.sessions_compacted} sessions that ended before {result.cutoff}"
+            f" into daily totals; deleted {result.days_deleted} old daily totals",
+            file=out,
+        )
+        return
+
+    if args.command == "global-position":
+        timeline = context.timeline(args.audiobook_id)
+        global_position = compute_global_position(timeline, args.audio_file_id, args.position)
+        print(f"Global position: {global_position:.2f}s", file=out)
+        return
+
+    if args.command == "add-segment":
+        add_segment(
+            connection,
+            TranscriptSegment(
+                audio_file_id=args.audio_file_id,
+                start_seconds=args.start,
+                end_seconds=args.end,
+                text=args.text,
+            ),
+        )
+        print("Transcript segment added.", file=out)
+        return
+
+    if args.command == "import-transcript":
+        transcript_format = args.transcript_format or detect_format(args.path)
+        # Only a count and the first reason are kept, so the import stays streaming.
+        unaligned: dict[str, object] = {"count": 0}
+
+        def note_unaligned(segment: TranscriptSegment, reason: str) -> None:
+            if not unaligned["count"]:
+                unaligned["first"] = f"{segment.start_seconds:.2f}s: {reason}"
+            unaligned["count"] += 1
+
+        with open(args.path, encoding="utf-8-sig") as stream:
+            segment_ids = add_segments(
+                connection,
+                iter_transcript_file(
+                    stream, args.audio_file_id, transcript_format, note_unaligned
+                ),
+                args.chunk_size,
+            )
+        print(f"Imported {len(segment_ids)} transcript segments.", file=out)
+        if unaligned["count"]:
+            print(
+                f"{unaligned['count']} segments were stored without word timings because"
+                f" their words did not match the text; first at {unaligned['first']}",
+                file=out,
+            )
+        return
+
+    if args.command == "transcribe":
+        from player.audio_cache import AudioCache, cache_dir_for
+
+        if args.audiobook_id is not None:
+            queued = enqueue_audiobook(
+                connection, args.audiobook_id, args.chunk_seconds, args.replace
+            )
+            print(f"Queued {queued.chunks_queued} chunks", file=out)
+            if queued.files_replaced:
+                print(f"Replaced the transcripts of {queued.files_replaced} files", file=out)
+            if queued.files_skipped:
+                print(
+                    f"Skipped {queued.files_skipped} files that already have a transcript"
+                    " or queued chunks; use --replace to transcribe them again",
+                    file=out,
+                )
+        scheduler = TranscriptionScheduler(
+            connection,
+            load_backend(args.backend),
+            workers=args.workers,
+            audio_cache=AudioCache(cache_dir_for(database_path)) if args.use_cache else None,
+        )
+        stats = scheduler.run(
+            progress=lambda request, count: print(
+                f"  file {request.audio_file_id}"
+                f" {request.start_seconds:.0f}-{request.end_seconds:.0f}s: {count} segments",
+                file=out,
+            )
+        )
+        print(
+            f"Transcribed {stats.chunks_done} chunks ({stats.segments_written} segments)"
+            f" in {stats.elapsed_seconds:.1f}s; {stats.chunks_failed} failed",
+            file=out,
+        )
+        remaining = transcription_progress(connection, args.audiobook_id)
+        print(
+            ", ".join(f"{status}: {count}" for status, count in sorted(remaining.items())),
+            file=out,
+        )
+        return
+
+    if args.command == "find-segment":
+        if context.serving:
+            # Repeated lookups on the daemon are answered from memory.
+            segment = context.transcript(args.audio_file_id).segment_at(args.position)
+        else:
+            segment = find_segment_at_time(connection, args.audio_file_id, args.position)
+        if segment:
+            print(f"[{segment.start_seconds}-{segment.end_seconds}] {segment.text}", file=out)
+        else:
+            print("No segment found.", file=out)
+        return
+
+    if args.command == "search":
+        hits = search_transcripts(connection, args.query, args.audiobook_id, args.limit)
+        if not hits:
+            print("No matches found.", file=out)
+        for hit in hits:
+            print(
+                f"[book {hit.audiobook_id} @ {hit.global_position_seconds:.2f}s,"
+                f" file {hit.audio_file_id} {hit.start_seconds:.2f}s] {hit.snippet}",
+                file=out,
+            )
+        return
+
+    if args.command == "play":
+        position = context.play(args.audiobook_id, args.speed, args.skip_silence)
+        print(f"Playing audiobook {args.audiobook_id} from {position:.2f}s", file=out)
+        return
+
+    if args.command in ("pause", "stop"):
+        state = context.pause() if args.command == "pause" else context.stop_playback()
+        if state is None:
+            print("Nothing is playing.", file=out)
+        else:
+            print(
+                f"{'Paused' if args.command == 'pause' else 'Stopped'} audiobook"
+                f" {state.audiobook_id} at file {state.audio_file_id}"
+                f" position {state.position_seconds:.2f}s",
+                file=out,
+            )
+        return
+
+    if args.command == "status":
+        if context.session is None or context.engine is None:
+            print("Nothing is playing.", file=out)
+            return
+        timeline = context.session.timeline
+        position = context.engine.position_seconds
+        print(
+            f"{context.engine.state.capitalize()} audiobook {context.session.audiobook_id}"
+            f" at {position:.2f}s of {timeline.total_duration:.2f}s"
+            f" (speed {context.engine.speed:g}x)",
+            file=out,
+        )
+        state = context.session.state_at_global_position(position)
+        segment = context.transcript(state.audio_file_id).segment_at(state.position_seconds)
+        if segment:
+            print(f"  {segment.text}", file=out)
+        return
+
+    if args.command == "stats":
+        if not metrics.enabled():
+            print(
+                f"Metrics are disabled; run 'main.py serve --metrics' or set {metrics.ENV_VAR}=1.",
+                file=err,
+            )
+        if args.output:
+            metrics.write_snapshot(args.output, args.metrics_format)
+            print(f"Wrote {args.metrics_format} metrics to {args.output}", file=out)
+        else:
+            out.write(metrics.export(args.metrics_format))
+        if args.reset:
+            metrics.REGISTRY.reset()
+        return
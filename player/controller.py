@@ -0,0 +1,374 @@
+"""Player controller that keeps engine, database and autosave work off the UI thread.
+
+The UI calls the command methods (``open_book``, ``play``, ``seek`` ...), which only
+put work on a queue and return at once. One worker thread runs the commands in
+order. That thread owns the SQLite connection, the ``StreamingAudioEngine`` and the
+``PlaybackSession`` with its autosave writer. Results come back as events on a
+second queue, and the UI drains that queue with ``poll`` from a timer such as
+Tk's ``after``. Neither call ever waits on the player.
+
+While a file or book is loaded, the worker publishes a ``PlayerStatus`` every
+``status_interval_seconds`` (20 Hz by default) for position displays. For books
+it includes the transcript line at the playhead from a ``TranscriptWindowCache``:
+only a few minutes of transcript around the playhead are held, the next window
+is loaded in the background, and each tick is a short ``TranscriptCursor`` step.
+
+``FrameMonitor`` measures the UI side: how long each callback ran on the UI
+thread and how late each timer tick fired.
+"""
+from __future__ import annotations
+
+import queue
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+from player import db, metrics
+from player.audio_engine import probe_duration
+from player.library import library_overview, list_audio_files
+from player.models import PlaybackState
+from player.playback import BookTimeline, PlaybackRepository, PlaybackSession
+from player.transcript_windows import TranscriptWindowCache
+
+if TYPE_CHECKING:
+    from player.streaming import StreamingAudioEngine
+
+DEFAULT_STATUS_INTERVAL_SECONDS = 0.05
+FRAME_BUDGET_SECONDS = 0.016
+
+# Event kinds delivered by PlayerController.poll.
+BOOKS = "books"
+STATUS = "status"
+ERROR = "error"
+CLOSED = "closed"
+
+
+@dataclass(frozen=True)
+class PlayerStatus:
+    state: str
+    position_seconds: float
+    duration_seconds: float
+    speed: float
+    audiobook_id: int | None
+    title: str
+    # Transcript segment at the playhead, empty when there is none.
+    transcript: str = ""
+
+    @property
+    def fraction(self) -> float:
+        if self.duration_seconds <= 0:
+            return 0.0
+        return min(max(self.position_seconds / self.duration_seconds, 0.0), 1.0)
+
+
+class PlayerController:
+    """Runs every player command on one worker thread and reports back through events.
+
+    ``engine_factory`` builds the engine on the worker thread the first time
+    something is loaded. Events are ``(kind, payload)`` tuples: ``BOOKS`` with a
+    list of ``BookOverview``, ``STATUS`` with a ``PlayerStatus``, ``ERROR`` with a
+    message and ``CLOSED`` once ``close`` has finished.
+    """
+
+    def __init__(
+        self,
+        db_path: str | Path,
+        engine_factory: Callable[[], StreamingAudioEngine],
+        status_interval_seconds: float = DEFAULT_STATUS_INTERVAL_SECONDS,
+        autosave_interval_seconds: float = 2.5,
+    ) -> None:
+        self.db_path = Path(db_path)
+        self.engine_factory = engine_factory
+        self.status_interval_seconds = status_interval_seconds
+        self.autosave_interval_seconds = autosave_interval_seconds
+        self._commands: queue.Queue[Callable[[], None] | None] = queue.Queue()
+        self._events: queue.Queue[tuple[str, object]] = queue.Queue()
+        self._speed_lock = threading.Lock()
+        self._pending_speed: float | None = None
+        # Everything below is only touched on the worker thread.
+        self._connection = None
+        self._repository: PlaybackRepository | None = None
+        self._engine: StreamingAudioEngine | None = None
+        self._session: PlaybackSession | None = None
+        self._title = ""
+        self._duration = 0.0
+        self._transcripts: TranscriptWindowCache | None = None
+        self._thread = threading.Thread(target=self._run, name="player-controller", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    # Commands: each returns immediately.
+
+    def load_books(self, limit: int | None = None) -> None:
+        self._submit(lambda: self._emit(BOOKS, library_overview(self._connection, limit)))
+
+    def open_book(self, audiobook_id: int, title: str = "") -> None:
+        self._submit(lambda: self._open_book(audiobook_id, title))
+
+    def open_file(self, path: str | Path) -> None:
+        self._submit(lambda: self._open_file(Path(path)))
+
+    def play(self) -> None:
+        self._submit(self._play)
+
+    def pause(self) -> None:
+        self._submit(self._pause)
+
+    def stop(self) -> None:
+        self._submit(self._stop)
+
+    def seek(self, position_seconds: float) -> None:
+        self._submit(lambda: self._seek(position_seconds))
+
+    def set_speed(self, speed: float) -> None:
+        """Change speed; a burst of calls (a dragged slider) is applied once, last value wins."""
+        with self._speed_lock:
+            queued = self._pending_speed is not None
+            self._pending_speed = speed
+        if not queued:
+            self._submit(self._apply_speed)
+
+    def close(self) -> None:
+        """Save the position and shut down in the background; ``CLOSED`` follows."""
+        self._commands.put(None)
+
+    def poll(self, max_events: int = 100) -> list[tuple[str, object]]:
+        """Events produced since the last poll, oldest first, without waiting."""
+        events = []
+        while len(events) < max_events:
+            try:
+                events.append(self._events.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    # Worker thread.
+
+    def _submit(self, command: Callable[[], None]) -> None:
+        self._commands.put(command)
+
+    def _emit(self, kind: str, payload: object = None) -> None:
+        self._events.put((kind, payload))
+
+    def _run(self) -> None:
+        try:
+            if not self._open_database():
+                # Nothing can run without the database; keep the error up until close.
+                while self._commands.get() is not None:
+                    pass
+                return
+            next_status = time.monotonic()
+            while True:
+                timeout = max(next_status - time.monotonic(), 0.0)
+                try:
+                    command = self._commands.get(timeout=timeout)
+                except queue.Empty:
+                    command = False
+                if command is None:
+                    return
+                if command:
+                    started = time.perf_counter()
+                    try:
+                        command()
+                    except Exception as exc:  # noqa: BLE001 - reported to the UI
+                        self._emit(ERROR, str(exc))
+                    metrics.observe("controller_command_seconds", time.perf_counter() - started)
+                if time.monotonic() >= next_status:
+                    self._publish_status()
+                    next_status = time.monotonic() + self.status_interval_seconds
+        finally:
+            self._shutdown()
+
+    def _open_database(self) -> bool:
+        try:
+            self._connection = db.initialize_db(self.db_path)
+        except Exception as exc:  # noqa: BLE001 - reported to the UI
+            self._emit(ERROR, f"Cannot open {self.db_path}: {exc}")
+            return False
+        self._repository = PlaybackRepository(self._connection)
+        return True
+
+    def _ensure_engine(self) -> StreamingAudioEngine:
+        if self._engine is None:
+            self._engine = self.engine_factory()
+            self._engine.on_end = lambda: self._submit(self._save_now)
+        return self._engine
+
+    def _open_book(self, audiobook_id: int, title: str) -> None:
+        self._close_session()
+        engine = self._ensure_engine()
+        timeline = BookTimeline(list_audio_files(self._connection, audiobook_id))
+        state = self._repository.get_state(audiobook_id)
+        position = (
+            timeline.global_position(state.audio_file_id, state.position_seconds)
+            if state and state.audio_file_id in timeline
+            else 0.0
+        )
+        engine.load_book(timeline, position)
+        self._session = PlaybackSession(self._repository, audiobook_id, timeline)
+        self._session.start_autosave(self._current_state, self.autosave_interval_seconds)
+        self._title = title or f"Audiobook {audiobook_id}"
+        self._duration = timeline.total_duration
+
+    def _open_file(self, path: Path) -> None:
+        self._close_session()
+        engine = self._ensure_engine()
+        engine.load(path)
+        self._title = path.name
+        try:
+            self._duration = probe_duration(path)
+        except (OSError, RuntimeError, subprocess.TimeoutExpired):
+            # Without ffprobe the position still shows; the progress bar stays empty.
+            self._duration = 0.0
+
+    def _current_state(self) -> PlaybackState:
+        # Called on the autosave thread; the engine guards its position with a lock.
+        return self._session.state_at_global_position(self._engine.position_seconds)
+
+    def _save_now(self) -> None:
+        if self._session is not None and self._engine is not None:
+            self._session.save_state(self._current_state())
+
+    def _play(self) -> None:
+        if self._engine is not None:
+            self._engine.play()
+
+    def _pause(self) -> None:
+        if self._engine is not None:
+            self._engine.pause()
+            self._save_now()
+
+    def _stop(self) -> None:
+        if self._engine is not None:
+            self._engine.pause()
+            self._save_now()
+            self._engine.stop()
+
+    def _seek(self, position_seconds: float) -> None:
+        if self._engine is None:
+            return
+        self._engine.seek(position_seconds)
+        if self._session is not None:
+            self._session.queue_state(self._session.state_at_global_position(position_seconds))
+
+    def _apply_speed(self) -> None:
+        with self._speed_lock:
+            speed, self._pending_speed = self._pending_speed, None
+        if speed is not None:
+            self._ensure_engine().set_speed(speed)
+
+    def _publish_status(self) -> None:
+        engine = self._engine
+        if engine is None or engine.path is None:
+            return
+        position = engine.position_seconds
+        transcript = ""
+        if self._session is not None:
+            transcript = self._transcript_at(self._session.state_at_global_position(position))
+        self._emit(
+            STATUS,
+            PlayerStatus(
+                state=engine.state,
+                position_seconds=position,
+                duration_seconds=self._duration,
+                speed=engine.speed,
+                audiobook_id=self._session.audiobook_id if self._session else None,
+                title=self._title,
+                transcript=transcript,
+            ),
+        )
+
+    def _transcript_at(self, state: PlaybackState) -> str:
+        if self._transcripts is None:
+            self._transcripts = TranscriptWindowCache(self._connection)
+        segment = self._transcripts.update(state.audio_file_id, state.position_seconds)
+        return segment.text if segment else ""
+
+    def _close_session(self) -> None:
+        if self._session is None:
+            return
+        if self._engine is not None:
+            self._engine.pause()
+        self._save_now()
+        self._session.stop_autosave()
+        self._session = None
+        if self._transcripts is not None:
+            self._transcripts.close()
+            self._transcripts = None
+
+    def _shutdown(self) -> None:
+        try:
+            self._close_session()
+            if self._engine is not None:
+                self._engine.close()
+                self._engine = None
+            if self._connection is not None:
+                self._connection.close()
+        finally:
+            self._emit(CLOSED)
+
+
+@dataclass
+class FrameStats:
+    frames: int = 0
+    callbacks: int = 0
+    # Ticks that fired more than the budget after they were due.
+    late_frames: int = 0
+    # Callbacks that ran longer than the budget.
+    slow_callbacks: int = 0
+    max_lag_seconds: float = 0.0
+    max_callback_seconds: float = 0.0
+    total_callback_seconds: float = 0.0
+
+    @property
+    def mean_callback_seconds(self) -> float:
+        return self.total_callback_seconds / self.callbacks if self.callbacks else 0.0
+
+
+class FrameMonitor:
+    """Tracks UI-thread responsiveness against a per-frame budget (16 ms for 60 Hz).
+
+    ``frame`` is called at the start of every timer tick with the tick's period;
+    its lateness shows any stall of the UI thread, including ones outside our
+    callbacks. ``callback`` wraps functions run on the UI thread to time them.
+    Both also feed the ``gui_frame_lag_seconds`` and ``gui_callback_seconds``
+    histograms when metrics are enabled.
+    """
+
+    def __init__(self, budget_seconds: float = FRAME_BUDGET_SECONDS) -> None:
+        self.budget_seconds = budget_seconds
+        self.stats = FrameStats()
+        self._due: float | None = None
+
+    def frame(self, period_seconds: float) -> None:
+        now = time.perf_counter()
+        if self._due is not None:
+            lag = max(now - self._due, 0.0)
+            self.stats.frames += 1
+            self.stats.max_lag_seconds = max(self.stats.max_lag_seconds, lag)
+            if lag > self.budget_seconds:
+                self.stats.late_frames += 1
+            metrics.observe("gui_frame_lag_seconds", lag)
+        self._due = now + period_seconds
+
+    def callback(self, function: Callable[..., object]) -> Callable[..., object]:
+        def timed(*args: object) -> object:
+            started = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                self.record_callback(time.perf_counter() - started)
+
+        return timed
+
+    def record_callback(self, seconds: float) -> None:
+        self.stats.callbacks += 1
+        self.stats.total_callback_seconds += seconds
+        self.stats.max_callback_seconds = max(self.stats.max_callback_seconds, seconds)
+        if seconds > self.budget_seconds:
+            self.stats.slow_callbacks += 1
+        metrics.observe("gui_callback_seconds", seconds)
@@ -0,0 +1,274 @@
+"""Local daemon that keeps the player warm and answers CLI commands over a Unix socket.
+
+Protocol: the client sends one JSON object per line and gets one JSON object back
+per line, in order, on the same connection.
+
+    {"id": 1, "argv": ["resume", "3"], "cwd": "/home/me"}
+    {"id": 1, "exit_code": 0, "stdout": "Resume audiobook 3 ...\\n", "stderr": ""}
+
+``argv`` is exactly what would follow ``main.py`` on the command line; relative
+paths in it are resolved against ``cwd``. ``{"op": "ping"}`` and
+``{"op": "shutdown"}`` are control requests answered with ``{"ok": true}``.
+
+Latency target: a read command such as ``resume`` or ``global-position`` answers
+within ``LATENCY_TARGET_P50_MS`` at the median and ``LATENCY_TARGET_P99_MS`` at the
+99th percentile, measured as a round trip on an open connection.
+``benchmarks/bench_daemon.py`` measures this against a cold invocation.
+
+This module only imports the standard library so that routing a command through
+the daemon stays cheap.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from io import StringIO
+from pathlib import Path
+from typing import Callable, TextIO
+
+DEFAULT_DB_PATH = "data/player.sqlite3"
+LATENCY_TARGET_P50_MS = 1.0
+LATENCY_TARGET_P99_MS = 5.0
+# Commands that must run in the calling process.
+LOCAL_COMMANDS = frozenset({"serve", "batch"})
+# Long-running commands also run locally: on the daemon they would hold its single
+# command thread, blocking even pause and stop, and their progress output would
+# only arrive at the end. Each maps to the flags that hand the work to the daemon.
+BULK_COMMANDS = {
+    "scan": frozenset(),
+    "relink": frozenset(),
+    "hash-files": frozenset({"--background", "--status"}),
+    "transcribe": frozenset(),
+    "export": frozenset(),
+    "import": frozenset(),
+    "cache-audio": frozenset(),
+    "analyze-audio": frozenset(),
+}
+# sockaddr_un.sun_path is 104 bytes on macOS and 108 on Linux.
+_MAX_SOCKET_PATH = 100
+
+
+@dataclass(frozen=True)
+class DaemonResponse:
+    exit_code: int
+    stdout: str
+    stderr: str
+
+
+def daemon_supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+def socket_path_for(db_path: str | Path) -> Path:
+    """The socket of the daemon serving ``db_path``, next to the database if it fits."""
+    path = Path(db_path).resolve()
+    candidate = path.with_name(path.name + ".sock")
+    if len(os.fsencode(candidate)) <= _MAX_SOCKET_PATH:
+        return candidate
+    digest = hashlib.sha1(os.fsencode(path)).hexdigest()[:16]
+    return Path(tempfile.gettempdir(), f"audiobook-player-{digest}.sock")
+
+
+class DaemonClient:
+    """One connection to a running daemon, reusable for any number of requests."""
+
+    def __init__(self, socket_path: str | Path, timeout: float | None = None) -> None:
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(os.fspath(socket_path))
+        except OSError:
+            self._socket.close()
+            raise
+        self._reader = self._socket.makefile("rb")
+        self._next_id = 0
+
+    def _call(self, message: dict) -> dict:
+        self._next_id += 1
+        message["id"] = self._next_id
+        self._socket.sendall(json.dumps(message).encode() + b"\n")
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Daemon closed the connection")
+        return json.loads(line)
+
+    def run(self, argv: list[str], cwd: str | None = None) -> DaemonResponse:
+        reply = self._call({"argv": list(argv), "cwd": cwd or os.getcwd()})
+        return DaemonResponse(reply["exit_code"], reply["stdout"], reply["stderr"])
+
+    def ping(self) -> bool:
+        return bool(self._call({"op": "ping"}).get("ok"))
+
+    def shutdown(self) -> None:
+        try:
+            self._call({"op": "shutdown"})
+        except (ConnectionError, OSError):
+            pass
+
+    def close(self) -> None:
+        self._reader.close()
+        self._socket.close()
+
+    def __enter__(self) -> DaemonClient:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+def route_to_daemon(argv: list[str]) -> DaemonResponse | None:
+    """Run ``argv`` on the daemon for its database, or return None to run it locally.
+
+    Commands run locally when no daemon is listening, when ``--no-daemon`` is
+    given, for help output, for commands in ``LOCAL_COMMANDS`` and for
+    ``BULK_COMMANDS`` without one of their daemon flags.
+    """
+    if not daemon_supported() or "-h" in argv or "--help" in argv:
+        return None
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--no-daemon", action="store_true")
+    known, rest = parser.parse_known_args(argv)
+    if known.no_daemon or not rest or rest[0] in LOCAL_COMMANDS:
+        return None
+    if rest[0] in BULK_COMMANDS and not BULK_COMMANDS[rest[0]].intersection(rest):
+        return None
+    try:
+        with DaemonClient(socket_path_for(known.db), timeout=None) as client:
+            return client.run(argv)
+    except OSError:
+        return None
+
+
+class DaemonServer:
+    """Serves commands for one database until shut down.
+
+    Connections are accepted on background threads, but every command runs on the
+    thread that called ``serve``, one at a time. That thread owns the warm SQLite
+    connection and whatever else ``execute`` keeps in memory. ``execute`` gets the
+    argv, the client's working directory, against which it resolves relative paths,
+    and the streams for the reply's stdout and stderr. The daemon's own working
+    directory and ``sys.stdout`` never change, since player threads share them.
+    """
+
+    def __init__(
+        self,
+        socket_path: str | Path,
+        execute: Callable[[list[str], str, TextIO, TextIO], int],
+    ) -> None:
+        self.socket_path = Path(socket_path)
+        self.execute = execute
+        self._jobs: queue.Queue[tuple[dict, Future] | None] = queue.Queue()
+        self._server: socketserver.ThreadingUnixStreamServer | None = None
+
+    def serve(self, ready: Callable[[], None] | None = None) -> None:
+        self._claim_socket()
+        jobs = self._jobs
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                for line in self.rfile:
+                    try:
+                        message = json.loads(line)
+                    except json.JSONDecodeError as exc:
+                        reply = {"exit_code": 2, "stdout": "", "stderr": f"Bad request: {exc}\n"}
+                    else:
+                        future: Future = Future()
+                        jobs.put((message, future))
+                        reply = future.result()
+                        reply["id"] = message.get("id")
+                    self.wfile.write(json.dumps(reply).encode() + b"\n")
+                    self.wfile.flush()
+
+        self._server = socketserver.ThreadingUnixStreamServer(os.fspath(self.socket_path), Handler)
+        self._server.daemon_threads = True
+        acceptor = threading.Thread(
+            target=self._server.serve_forever, name="daemon-accept", daemon=True
+        )
+        acceptor.start()
+        if ready:
+            ready()
+        try:
+            while (job := self._jobs.get()) is not None:
+                message, future = job
+                future.set_result(self._handle(message))
+        finally:
+            self._server.shutdown()
+            self._server.server_close()
+            try:
+                self.socket_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stop(self) -> None:
+        self._jobs.put(None)
+
+    def _handle(self, message: dict) -> dict:
+        op = message.get("op")
+        if op == "ping":
+            return {"ok": True}
+        if op == "shutdown":
+            self.stop()
+            return {"ok": True}
+        argv = message.get("argv")
+        if not isinstance(argv, list):
+            return {"exit_code": 2, "stdout": "", "stderr": "Request has no argv list\n"}
+        cwd = str(message.get("cwd") or os.getcwd())
+        response = capture_command(
+            lambda args, out, err: self.execute(args, cwd, out, err), [str(arg) for arg in argv]
+        )
+        return {
+            "exit_code": response.exit_code,
+            "stdout": response.stdout,
+            "stderr": response.stderr,
+        }
+
+    def _claim_socket(self) -> None:
+        if not self.socket_path.exists():
+            return
+        try:
+            DaemonClient(self.socket_path, timeout=1.0).close()
+        except OSError:
+            # Left behind by a daemon that did not shut down cleanly.
+            self.socket_path.unlink()
+            return
+        raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+
+
+def capture_command(
+    execute: Callable[[list[str], TextIO, TextIO], int], argv: list[str]
+) -> DaemonResponse:
+    """Run one command, capturing its output and turning failures into exit codes.
+
+    ``execute`` writes to the two buffers it is given. ``sys.stdout`` and
+    ``sys.stderr`` are left alone, so output from other threads never lands in a
+    reply.
+    """
+    stdout, stderr = StringIO(), StringIO()
+    try:
+        exit_code = execute(argv, stdout, stderr)
+    except SystemExit as exc:
+        exit_code = exc.code if isinstance(exc.code, int) else 1
+        if isinstance(exc.code, str):
+            stderr.write(exc.code + "\n")
+    except Exception as exc:  # noqa: BLE001 - reported to the caller
+        exit_code = 1
+        stderr.write(f"Error: {exc}\n")
+    return DaemonResponse(exit_code, stdout.getvalue(), stderr.getvalue())
+
+
+def print_response(response: DaemonResponse) -> None:
+    sys.stdout.write(response.stdout)
+    sys.stderr.write(response.stderr)
+    if response.exit_code:
+        raise SystemExit(response.exit_code)
@@ -2,8 +2,13 @@
 from __future__ import annotations
 
 import sqlite3
+from itertools import islice
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Iterator
+
+from player import metrics
+
+DEFAULT_CHUNK_SIZE = 1000
 
 
 SCHEMA_STATEMENTS: tuple[str, ...] = (
@@ -49,23 +54,246 @@ SCHEMA_STATEMENTS: tuple[str, ...] = (
         FOREIGN KEY (audio_file_id) REFERENCES audio_files (id)
     )
     """.strip(),
+    """
+    CREATE TABLE IF NOT EXISTS scanned_folders (
+        path TEXT PRIMARY KEY,
+        audiobook_id INTEGER NOT NULL,
+        FOREIGN KEY (audiobook_id) REFERENCES audiobooks (id)
+    )
+    """.strip(),
+    """
+    CREATE TABLE IF NOT EXISTS scanned_files (
+        path TEXT PRIMARY KEY,
+        audio_file_id INTEGER NOT NULL,
+        size_bytes INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        FOREIGN KEY (audio_file_id) REFERENCES audio_files (id)
+    )
+    """.strip(),
+)
+
+INDEX_STATEMENTS: tuple[str, ...] = (
+    # list_audiobooks orders by creation time.
+    "CREATE INDEX IF NOT EXISTS idx_audiobooks_created ON audiobooks (created_at, title)",
+    # list_audio_files is answered from this index alone.
+    """
+    CREATE INDEX IF NOT EXISTS idx_audio_files_book_order
+    ON audio_files (audiobook_id, order_index, path, duration_seconds, file_hash)
+    """.strip(),
+    # Range lookups by time; segment text is only read for matching rows.
+    """
+    CREATE INDEX IF NOT EXISTS idx_transcript_segments_file_start
+    ON transcript_segments (audio_file_id, start_seconds, end_seconds)
+    """.strip(),
+)
+
+# Also recreated by transcript.deferred_search_index after a bulk insert.
+TRANSCRIPT_FTS_INSERT_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS transcript_segments_fts_insert
+    AFTER INSERT ON transcript_segments BEGIN
+        INSERT INTO transcript_segments_fts (rowid, text) VALUES (new.id, new.text);
+    END
+""".strip()
+
+TRANSCRIPT_SEARCH_STATEMENTS: tuple[str, ...] = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS transcript_segments_fts USING fts5 (
+        text,
+        content='transcript_segments',
+        content_rowid='id'
+    )
+    """.strip(),
+    TRANSCRIPT_FTS_INSERT_TRIGGER,
+    """
+    CREATE TRIGGER IF NOT EXISTS transcript_segments_fts_delete
+    AFTER DELETE ON transcript_segments BEGIN
+        INSERT INTO transcript_segments_fts (transcript_segments_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """.strip(),
+    """
+    CREATE TRIGGER IF NOT EXISTS transcript_segments_fts_update
+    AFTER UPDATE OF text ON transcript_segments BEGIN
+        INSERT INTO transcript_segments_fts (transcript_segments_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO transcript_segments_fts (rowid, text) VALUES (new.id, new.text);
+    END
+    """.strip(),
+    # Index segments stored before this migration.
+    "INSERT INTO transcript_segments_fts (transcript_segments_fts) VALUES ('rebuild')",
+)
+
+TRANSCRIPTION_JOB_STATEMENTS: tuple[str, ...] = (
+    """
+    CREATE TABLE IF NOT EXISTS transcription_chunks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        audio_file_id INTEGER NOT NULL,
+        start_seconds REAL NOT NULL,
+        end_seconds REAL NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        updated_at TEXT NOT NULL DEFAULT (datetime('now')),
+        UNIQUE (audio_file_id, start_seconds),
+        FOREIGN KEY (audio_file_id) REFERENCES audio_files (id)
+    )
+    """.strip(),
+    # The scheduler only ever looks for pending chunks.
+    """
+    CREATE INDEX IF NOT EXISTS idx_transcription_chunks_status
+    ON transcription_chunks (status, audio_file_id, start_seconds)
+    """.strip(),
+)
+
+WORD_TIMING_STATEMENTS: tuple[str, ...] = (
+    # One packed blob of word timings per segment (player.word_timings).
+    "ALTER TABLE transcript_segments ADD COLUMN word_timings BLOB",
+)
+
+AUDIO_ANALYSIS_STATEMENTS: tuple[str, ...] = (
+    # Waveform pyramid and silence map per file content (player.waveform).
+    """
+    CREATE TABLE IF NOT EXISTS audio_analysis (
+        file_hash TEXT PRIMARY KEY,
+        format_version INTEGER NOT NULL,
+        sample_rate INTEGER NOT NULL,
+        bin_frames INTEGER NOT NULL,
+        frames INTEGER NOT NULL,
+        silence_threshold_db REAL NOT NULL,
+        min_silence_seconds REAL NOT NULL,
+        levels BLOB NOT NULL,
+        silences BLOB NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (datetime('now'))
+    )
+    """.strip(),
+)
+
+FINGERPRINT_STATEMENTS: tuple[str, ...] = (
+    "ALTER TABLE audio_files ADD COLUMN fingerprint TEXT",
+    # relink looks missing files' replacements up by fingerprint.
+    "CREATE INDEX IF NOT EXISTS idx_audio_files_fingerprint ON audio_files (fingerprint)",
+    # upgrade_hashes walks the files still waiting for a full hash.
+    """
+    CREATE INDEX IF NOT EXISTS idx_audio_files_unhashed
+    ON audio_files (id, path) WHERE file_hash IS NULL
+    """.strip(),
+)
+
+LISTENING_HISTORY_STATEMENTS: tuple[str, ...] = (
+    # One row per stretch of continuous listening (player.history).
+    """
+    CREATE TABLE IF NOT EXISTS listening_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        audiobook_id INTEGER NOT NULL,
+        started_at TEXT NOT NULL,
+        ended_at TEXT NOT NULL,
+        start_audio_file_id INTEGER NOT NULL,
+        start_position_seconds REAL NOT NULL,
+        end_audio_file_id INTEGER NOT NULL,
+        end_position_seconds REAL NOT NULL,
+        listened_seconds REAL NOT NULL,
+        FOREIGN KEY (audiobook_id) REFERENCES audiobooks (id),
+        FOREIGN KEY (start_audio_file_id) REFERENCES audio_files (id),
+        FOREIGN KEY (end_audio_file_id) REFERENCES audio_files (id)
+    )
+    """.strip(),
+    # Recent sessions and listening totals per book are answered from this index.
+    """
+    CREATE INDEX IF NOT EXISTS idx_listening_sessions_book_ended
+    ON listening_sessions (audiobook_id, ended_at, listened_seconds)
+    """.strip(),
+    # Compaction and retention cut by age.
+    """
+    CREATE INDEX IF NOT EXISTS idx_listening_sessions_ended
+    ON listening_sessions (ended_at)
+    """.strip(),
+    # Sessions older than the retention window, rolled up per book and day.
+    """
+    CREATE TABLE IF NOT EXISTS listening_days (
+        audiobook_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        listened_seconds REAL NOT NULL,
+        sessions INTEGER NOT NULL,
+        PRIMARY KEY (audiobook_id, day),
+        FOREIGN KEY (audiobook_id) REFERENCES audiobooks (id)
+    ) WITHOUT ROWID
+    """.strip(),
+    "CREATE INDEX IF NOT EXISTS idx_listening_days_day ON listening_days (day)",
 )
 
+# Migration N brings a database from user_version N - 1 to N. Append new migrations;
+# never edit one that has shipped.
+MIGRATIONS: tuple[tuple[str, ...], ...] = (
+    SCHEMA_STATEMENTS,
+    INDEX_STATEMENTS,
+    TRANSCRIPT_SEARCH_STATEMENTS,
+    TRANSCRIPTION_JOB_STATEMENTS,
+    WORD_TIMING_STATEMENTS,
+    AUDIO_ANALYSIS_STATEMENTS,
+    FINGERPRINT_STATEMENTS,
+    LISTENING_HISTORY_STATEMENTS,
+)
+
+PRAGMA_PROFILE: dict[str, str | int] = {
+    # WAL only needs a sync at checkpoints to stay consistent after a power loss.
+    "synchronous": "NORMAL",
+    # Negative values are KiB: a 16 MiB page cache.
+    "cache_size": -16000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
 
-def connect(db_path: str | Path) -> sqlite3.Connection:
+def connect(
+    db_path: str | Path, pragmas: dict[str, str | int] | None = None
+) -> sqlite3.Connection:
     path = Path(db_path)
     path.parent.mkdir(parents=True, exist_ok=True)
-    connection = sqlite3.connect(path)
+    # Instrumented connections are only handed out while metrics are enabled.
+    factory = metrics.InstrumentedConnection if metrics.enabled() else sqlite3.Connection
+    connection = sqlite3.connect(path, factory=factory)
     connection.row_factory = sqlite3.Row
     connection.execute("PRAGMA journal_mode=WAL;")
     connection.execute("PRAGMA foreign_keys=ON;")
+    for name, value in (PRAGMA_PROFILE if pragmas is None else pragmas).items():
+        connection.execute(f"PRAGMA {name}={value};")
     return connection
 
 
+def database_path(connection: sqlite3.Connection) -> str | None:
+    """Return the file backing the main database, or None for in-memory databases."""
+    for row in connection.execute("PRAGMA database_list"):
+        if row[1] == "main":
+            return row[2] or None
+    return None
+
+
+def schema_version(connection: sqlite3.Connection) -> int:
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
 def initialize(connection: sqlite3.Connection) -> None:
-    for statement in SCHEMA_STATEMENTS:
-        connection.execute(statement)
-    connection.commit()
+    """Apply any migrations newer than the database's ``user_version``.
+
+    A current database costs a single PRAGMA read. Each migration runs in its own
+    transaction together with the version bump, so an interrupted upgrade resumes
+    from the last migration that committed.
+    """
+    version = schema_version(connection)
+    if version >= len(MIGRATIONS):
+        return
+    if connection.in_transaction:
+        connection.commit()
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        connection.execute("BEGIN")
+        try:
+            for statement in statements:
+                connection.execute(statement)
+            connection.execute(f"PRAGMA user_version={number}")
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
 
 
 def initialize_db(db_path: str | Path) -> sqlite3.Connection:
@@ -77,3 +305,51 @@ def initialize_db(db_path: str | Path) -> sqlite3.Connection:
 def execute_many(connection: sqlite3.Connection, query: str, rows: Iterable[tuple]) -> None:
     connection.executemany(query, rows)
     connection.commit()
+
+
+def insert_rows(
+    connection: sqlite3.Connection,
+    query: str,
+    rows: Iterable[tuple],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[list[int]]:
+    """Run ``query`` over ``rows`` in ``executemany`` chunks, yielding each chunk's new ids.
+
+    Rows are pulled from the iterable ``chunk_size`` at a time, so arbitrarily long
+    inputs never sit in memory at once. Transaction handling is left to the caller.
+    """
+    if chunk_size <= 0:
+        raise ValueError("Chunk size must be positive")
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, chunk_size)):
+        connection.executemany(query, chunk)
+        # The write lock is held for the whole statement, so the rowids it
+        # assigned are consecutive and end at last_insert_rowid().
+        last_id = connection.execute("SELECT last_insert_rowid()").fetchone()[0]
+        yield list(range(last_id - len(chunk) + 1, last_id + 1))
+
+
+def bulk_insert(
+    connection: sqlite3.Connection,
+    query: str,
+    rows: Iterable[tuple],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    commit_per_chunk: bool = False,
+) -> list[int]:
+    """Stream ``rows`` into ``query`` and return the new row ids.
+
+    By default everything is written in a single transaction that is rolled back on
+    error; ``commit_per_chunk`` commits after every chunk instead, bounding the amount
+    of work lost to a failure midway.
+    """
+    ids: list[int] = []
+    try:
+        for chunk_ids in insert_rows(connection, query, rows, chunk_size):
+            ids.extend(chunk_ids)
+            if commit_per_chunk:
+                connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+    return ids
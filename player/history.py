@@ -0,0 +1,343 @@
+"""Listening history: playback ticks downsampled into sessions, with retention.
+
+``playback_state`` only keeps the latest position per book. The autosave writer
+also feeds every position it sees to a ``HistoryRecorder``, which folds them
+into sessions: one row per stretch of continuous listening. A row holds where
+and when the stretch started and ended and how much of the book it covered. A
+seek, or a break longer than ``gap_seconds``, ends the session. Hours of
+playback therefore cost a handful of rows instead of one per tick, and the end
+of the previous session is the position to return to after an accidental seek.
+
+Rows are only appended. The open session's row is extended in place until the
+session ends; after that it does not change until ``compact_history`` rolls it
+into per-day totals in ``listening_days`` once it is older than the retention
+window. Totals read both tables, so they survive compaction. Both tables are
+indexed by book and time, so the queries here read index ranges whose size
+depends on the retention window rather than on how many years of history
+exist.
+"""
+from __future__ import annotations
+
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from player.models import ListeningSession, ListeningTotals, PlaybackState
+
+if TYPE_CHECKING:
+    from player.playback import BookTimeline
+
+DEFAULT_SESSION_GAP_SECONDS = 300.0
+# Shorter sessions, such as stops while scrubbing, are not kept.
+DEFAULT_MIN_LISTENED_SECONDS = 5.0
+DEFAULT_KEEP_SESSIONS_DAYS = 90
+# A forward move between two ticks larger than this rate allows is a seek, not
+# playback. The slack covers skipped silences and ticks delayed by a busy thread.
+MAX_PLAYBACK_SPEED = 4.0
+JUMP_SLACK_SECONDS = 5.0
+# Small backward moves are position jitter, not a seek.
+BACKWARD_TOLERANCE_SECONDS = 0.5
+
+INSERT_SESSION = """
+INSERT INTO listening_sessions (
+    audiobook_id, started_at, ended_at,
+    start_audio_file_id, start_position_seconds,
+    end_audio_file_id, end_position_seconds,
+    listened_seconds
+)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+""".strip()
+
+UPDATE_SESSION = """
+UPDATE listening_sessions
+SET ended_at = ?, end_audio_file_id = ?, end_position_seconds = ?, listened_seconds = ?
+WHERE id = ?
+""".strip()
+
+
+def timestamp(seconds: float) -> str:
+    """UTC time in SQLite's datetime format, with milliseconds so sessions order cleanly."""
+    whole = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(seconds))
+    return f"{whole}.{int(seconds % 1 * 1000):03d}"
+
+
+@dataclass
+class _Session:
+    started_at: float
+    ended_at: float
+    start: PlaybackState
+    end: PlaybackState
+    end_global: float
+    listened_seconds: float = 0.0
+    row_id: int | None = None
+    dirty: bool = True
+    # The first session of a recorder is where the book was opened; always kept.
+    keep: bool = False
+
+
+class HistoryRecorder:
+    """Folds one book's position ticks into listening sessions.
+
+    ``observe`` is called for every tick and only updates memory. ``write`` runs
+    the inserts and updates on the caller's connection without committing. The
+    caller then reports the outcome with ``written`` or ``failed``, so that a
+    rolled-back insert is retried rather than later updated by a stale id. The
+    autosave writer calls all of these on its own thread.
+    """
+
+    def __init__(
+        self,
+        audiobook_id: int,
+        timeline: BookTimeline,
+        gap_seconds: float = DEFAULT_SESSION_GAP_SECONDS,
+        min_listened_seconds: float = DEFAULT_MIN_LISTENED_SECONDS,
+    ) -> None:
+        self.audiobook_id = audiobook_id
+        self.timeline = timeline
+        self.gap_seconds = gap_seconds
+        self.min_listened_seconds = min_listened_seconds
+        self._current: _Session | None = None
+        self._finished: list[_Session] = []
+        self._writing: list[_Session] = []
+        self._inserted: list[_Session] = []
+
+    def observe(self, state: PlaybackState, now: float | None = None) -> None:
+        if state.audiobook_id != self.audiobook_id or state.audio_file_id not in self.timeline:
+            return
+        now = time.time() if now is None else now
+        position = self.timeline.global_position(state.audio_file_id, state.position_seconds)
+        current = self._current
+        if current is None:
+            self._current = _Session(now, now, state, state, position, keep=True)
+            return
+        delta = position - current.end_global
+        if delta == 0:
+            # Paused or stopped: the session's end stays where playback stopped.
+            return
+        elapsed = now - current.ended_at
+        furthest = elapsed * MAX_PLAYBACK_SPEED + JUMP_SLACK_SECONDS
+        if elapsed <= self.gap_seconds and -BACKWARD_TOLERANCE_SECONDS <= delta <= furthest:
+            self._extend(current, state, position, delta, now)
+            return
+        self._close()
+        if -BACKWARD_TOLERANCE_SECONDS <= delta <= JUMP_SLACK_SECONDS:
+            # Playback resumed after a break: the new session starts where the last ended.
+            resumed = _Session(now, now, current.end, current.end, current.end_global)
+            self._extend(resumed, state, position, delta, now)
+            self._current = resumed
+        else:
+            self._current = _Session(now, now, state, state, position)
+
+    def _extend(
+        self, session: _Session, state: PlaybackState, position: float, delta: float, now: float
+    ) -> None:
+        session.listened_seconds += max(delta, 0.0)
+        session.ended_at = now
+        session.end = state
+        session.end_global = position
+        session.dirty = True
+
+    def _kept(self, session: _Session) -> bool:
+        return session.keep or session.listened_seconds >= self.min_listened_seconds
+
+    def _close(self) -> None:
+        session, self._current = self._current, None
+        if session is not None and self._kept(session) and session.dirty:
+            self._finished.append(session)
+
+    @property
+    def has_changes(self) -> bool:
+        current = self._current
+        return bool(self._finished) or (
+            current is not None and current.dirty and self._kept(current)
+        )
+
+    def write(self, connection: sqlite3.Connection) -> None:
+        self._writing = list(self._finished)
+        current = self._current
+        if current is not None and current.dirty and self._kept(current):
+            self._writing.append(current)
+        for session in self._writing:
+            if session.row_id is None:
+                session.row_id = connection.execute(
+                    INSERT_SESSION,
+                    (
+                        self.audiobook_id,
+                        timestamp(session.started_at),
+                        timestamp(session.ended_at),
+                        session.start.audio_file_id,
+                        session.start.position_seconds,
+                        session.end.audio_file_id,
+                        session.end.position_seconds,
+                        session.listened_seconds,
+                    ),
+                ).lastrowid
+                self._inserted.append(session)
+            else:
+                connection.execute(
+                    UPDATE_SESSION,
+                    (
+                        timestamp(session.ended_at),
+                        session.end.audio_file_id,
+                        session.end.position_seconds,
+                        session.listened_seconds,
+                        session.row_id,
+                    ),
+                )
+
+    def written(self) -> None:
+        for session in self._writing:
+            session.dirty = False
+        self._finished = [session for session in self._finished if session.dirty]
+        self._writing = []
+        self._inserted = []
+
+    def failed(self) -> None:
+        for session in self._inserted:
+            session.row_id = None
+        self._writing = []
+        self._inserted = []
+
+
+def _session(row: sqlite3.Row) -> ListeningSession:
+    return ListeningSession(
+        id=row["id"],
+        audiobook_id=row["audiobook_id"],
+        started_at=row["started_at"],
+        ended_at=row["ended_at"],
+        start_audio_file_id=row["start_audio_file_id"],
+        start_position_seconds=row["start_position_seconds"],
+        end_audio_file_id=row["end_audio_file_id"],
+        end_position_seconds=row["end_position_seconds"],
+        listened_seconds=row["listened_seconds"],
+    )
+
+
+def recent_sessions(
+    connection: sqlite3.Connection, audiobook_id: int, limit: int = 10
+) -> list[ListeningSession]:
+    """A book's sessions, most recently ended first; the first is the current one."""
+    rows = connection.execute(
+        """
+        SELECT id, audiobook_id, started_at, ended_at,
+               start_audio_file_id, start_position_seconds,
+               end_audio_file_id, end_position_seconds, listened_seconds
+        FROM listening_sessions
+        WHERE audiobook_id = ?
+        ORDER BY ended_at DESC, id DESC
+        LIMIT ?
+        """,
+        (audiobook_id, limit),
+    )
+    return [_session(row) for row in rows]
+
+
+def listening_totals(
+    connection: sqlite3.Connection,
+    audiobook_id: int | None = None,
+    since: str | None = None,
+) -> list[ListeningTotals]:
+    """Time listened per book, most listened first, optionally since a UTC datetime.
+
+    Compacted days count whole: with ``since`` inside a compacted day, that day's
+    total is included.
+    """
+    session_filters, day_filters, parameters = ["1"], ["1"], []
+    if audiobook_id is not None:
+        session_filters.append("audiobook_id = ?")
+        day_filters.append("audiobook_id = ?")
+    if since is not None:
+        session_filters.append("ended_at >= ?")
+        day_filters.append("day >= date(?)")
+    for _ in (session_filters, day_filters):
+        if audiobook_id is not None:
+            parameters.append(audiobook_id)
+        if since is not None:
+            parameters.append(since)
+    rows = connection.execute(
+        f"""
+        SELECT audiobook_id,
+               TOTAL(listened_seconds) AS listened_seconds,
+               SUM(sessions) AS sessions,
+               MAX(last_at) AS last_listened_at
+        FROM (
+            SELECT audiobook_id, listened_seconds, 1 AS sessions, ended_at AS last_at
+            FROM listening_sessions
+            WHERE {" AND ".join(session_filters)}
+            UNION ALL
+            SELECT audiobook_id, listened_seconds, sessions, day AS last_at
+            FROM listening_days
+            WHERE {" AND ".join(day_filters)}
+        )
+        GROUP BY audiobook_id
+        ORDER BY listened_seconds DESC
+        """,
+        parameters,
+    )
+    return [
+        ListeningTotals(
+            audiobook_id=row["audiobook_id"],
+            listened_seconds=row["listened_seconds"],
+            sessions=row["sessions"],
+            last_listened_at=row["last_listened_at"],
+        )
+        for row in rows
+    ]
+
+
+@dataclass
+class CompactionResult:
+    sessions_compacted: int = 0
+    days_deleted: int = 0
+    # Sessions that ended before this UTC datetime were compacted.
+    cutoff: str = ""
+
+
+def compact_history(
+    connection: sqlite3.Connection,
+    keep_sessions_days: int = DEFAULT_KEEP_SESSIONS_DAYS,
+    keep_days: int | None = None,
+) -> CompactionResult:
+    """Roll sessions older than ``keep_sessions_days`` into per-day totals.
+
+    With ``keep_days``, day totals older than that are deleted as well; by default
+    they are kept forever, at one row per book and day listened. Runs in one
+    transaction.
+    """
+    if keep_sessions_days < 0 or (keep_days is not None and keep_days < 0):
+        raise ValueError("Retention periods must not be negative")
+    result = CompactionResult()
+    try:
+        cutoff = connection.execute(
+            "SELECT datetime('now', ?)", (f"-{keep_sessions_days} days",)
+        ).fetchone()[0]
+        result.cutoff = cutoff
+        connection.execute(
+            """
+            INSERT INTO listening_days (audiobook_id, day, listened_seconds, sessions)
+            SELECT audiobook_id, date(ended_at), TOTAL(listened_seconds), COUNT(*)
+            FROM listening_sessions
+            WHERE ended_at < ?
+            GROUP BY audiobook_id, date(ended_at)
+            ON CONFLICT (audiobook_id, day) DO UPDATE SET
+                listened_seconds = listened_seconds + excluded.listened_seconds,
+                sessions = sessions + excluded.sessions
+            """,
+            (cutoff,),
+        )
+        result.sessions_compacted = connection.execute(
+            "DELETE FROM listening_sessions WHERE ended_at < ?", (cutoff,)
+        ).rowcount
+        if keep_days is not None:
+            day_cutoff = connection.execute(
+                "SELECT date('now', ?)", (f"-{keep_days} days",)
+            ).fetchone()[0]
+            result.days_deleted = connection.execute(
+                "DELETE FROM listening_days WHERE day < ?", (day_cutoff,)
+            ).rowcount
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+    return result
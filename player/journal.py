@@ -0,0 +1,243 @@
+"""Append-only binary journal of playback positions for crash recovery."""
+from __future__ import annotations
+
+import os
+import sqlite3
+import struct
+import time
+import zlib
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator
+
+from player.models import PlaybackState
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory lock, so run one writer per database.
+    fcntl = None
+
+if TYPE_CHECKING:
+    from player.playback import PlaybackRepository
+
+JOURNAL_MAGIC = b"PJNL"
+JOURNAL_VERSION = 2
+# Version 1 records had the same layout but a monotonic clock instead of wall time;
+# they are still read, with their time treated as unknown.
+_UNTIMED_VERSION = 1
+# audiobook_id, audio_file_id, position_seconds, wall_time_ns
+_PAYLOAD = struct.Struct("<qqdq")
+_CHECKSUM = struct.Struct("<I")
+_HEADER = struct.Struct("<4sHH")
+RECORD_SIZE = _PAYLOAD.size + _CHECKSUM.size
+HEADER_SIZE = _HEADER.size
+
+# Like the archive import, a replayed state only replaces a row that is older.
+# ``updated_at`` has whole seconds, so a record from the same second as a commit
+# loses: at most a second of progress, rather than a seek made after the crash.
+REPLAY_STATE = """
+INSERT INTO playback_state (audiobook_id, audio_file_id, position_seconds, updated_at)
+VALUES (?, ?, ?, ?)
+ON CONFLICT(audiobook_id) DO UPDATE SET
+    audio_file_id = excluded.audio_file_id,
+    position_seconds = excluded.position_seconds,
+    updated_at = excluded.updated_at
+WHERE excluded.updated_at > playback_state.updated_at
+""".strip()
+
+
+@dataclass(frozen=True)
+class JournalRecord:
+    audiobook_id: int
+    audio_file_id: int
+    position_seconds: float
+    # Wall clock time of the record; 0 when unknown.
+    wall_time_ns: int
+
+    @property
+    def updated_at(self) -> str:
+        """The record time in ``playback_state.updated_at`` format (UTC, whole seconds)."""
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.wall_time_ns // 10**9))
+
+    def to_state(self) -> PlaybackState:
+        return PlaybackState(
+            audiobook_id=self.audiobook_id,
+            audio_file_id=self.audio_file_id,
+            position_seconds=self.position_seconds,
+        )
+
+
+def journal_path_for(db_path: str | Path) -> Path:
+    path = Path(db_path)
+    return path.with_name(path.name + ".positions")
+
+
+def encode_record(record: JournalRecord) -> bytes:
+    payload = _PAYLOAD.pack(
+        record.audiobook_id, record.audio_file_id, record.position_seconds, record.wall_time_ns
+    )
+    return payload + _CHECKSUM.pack(zlib.crc32(payload))
+
+
+def decode_record(data: bytes) -> JournalRecord | None:
+    """Decode one fixed-size record, returning None when its checksum does not match."""
+    payload = data[: _PAYLOAD.size]
+    (checksum,) = _CHECKSUM.unpack_from(data, _PAYLOAD.size)
+    if zlib.crc32(payload) != checksum:
+        return None
+    return JournalRecord(*_PAYLOAD.unpack(payload))
+
+
+class PositionJournal:
+    """Fixed-size position records appended to a file with one unbuffered write each.
+
+    Appends are not fsynced by default: a record costs one ``write`` syscall, which is
+    cheap enough for several ticks a second and survives a process crash. A power
+    loss can tear the last record; readers detect that through the per-record CRC32
+    and the file length and skip it.
+
+    The open journal holds an exclusive ``flock``, so only one writer owns it; opening
+    a journal that another writer holds raises ``BlockingIOError``.
+    """
+
+    def __init__(self, path: str | Path, fsync: bool = False) -> None:
+        self.path = Path(path)
+        self.fsync = fsync
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        flags = os.O_RDWR | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+        self._fd = os.open(self.path, flags, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(self._fd)
+                self._fd = -1
+                raise BlockingIOError(f"{self.path} is held by another autosave writer") from None
+        size = os.fstat(self._fd).st_size
+        self._version = JOURNAL_VERSION
+        if size < HEADER_SIZE:
+            os.ftruncate(self._fd, 0)
+            os.write(self._fd, _HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, RECORD_SIZE))
+        else:
+            with open(self.path, "rb") as handle:
+                self._version = _HEADER.unpack(handle.read(HEADER_SIZE))[1]
+        if size > HEADER_SIZE and (size - HEADER_SIZE) % RECORD_SIZE:
+            # Cut a torn trailing record so new appends stay record-aligned.
+            os.ftruncate(self._fd, size - (size - HEADER_SIZE) % RECORD_SIZE)
+
+    @property
+    def size_bytes(self) -> int:
+        return os.fstat(self._fd).st_size
+
+    def append(self, state: PlaybackState) -> None:
+        record = JournalRecord(
+            audiobook_id=state.audiobook_id,
+            audio_file_id=state.audio_file_id,
+            position_seconds=state.position_seconds,
+            wall_time_ns=time.time_ns(),
+        )
+        os.write(self._fd, encode_record(record))
+        if self.fsync:
+            os.fsync(self._fd)
+
+    def records(self) -> Iterator[JournalRecord]:
+        return iter_records(self.path)
+
+    def truncate(self) -> None:
+        """Drop every record; call only once their states are committed to SQLite.
+
+        The header is rewritten as well, which upgrades an older journal version.
+        """
+        if self.size_bytes > HEADER_SIZE or self._version != JOURNAL_VERSION:
+            os.ftruncate(self._fd, 0)
+            os.write(self._fd, _HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, RECORD_SIZE))
+            self._version = JOURNAL_VERSION
+
+    def replay(self, repository: PlaybackRepository) -> int:
+        """Write the latest state per audiobook into ``playback_state``, then truncate.
+
+        Returns the number of audiobooks restored. A state is skipped when the stored
+        row was updated at or after the record's time, such as by a seek or save
+        committed after the crash, and when its book or file has been deleted since.
+        The journal is emptied only after the states are committed, so a crash during
+        recovery leaves it intact for next time.
+        """
+        connection = repository.connection
+        restored = 0
+        for record in latest_records(self.path).values():
+            try:
+                cursor = connection.execute(
+                    REPLAY_STATE,
+                    (
+                        record.audiobook_id,
+                        record.audio_file_id,
+                        record.position_seconds,
+                        record.updated_at,
+                    ),
+                )
+                connection.commit()
+            except sqlite3.IntegrityError:
+                connection.rollback()
+                continue
+            restored += cursor.rowcount
+        self.truncate()
+        return restored
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def iter_records(path: str | Path) -> Iterator[JournalRecord]:
+    """Yield every intact record, skipping corrupt ones and a torn trailing record."""
+    try:
+        handle = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with handle:
+        header = handle.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            return
+        magic, version, record_size = _HEADER.unpack(header)
+        if (
+            magic != JOURNAL_MAGIC
+            or version not in (_UNTIMED_VERSION, JOURNAL_VERSION)
+            or record_size != RECORD_SIZE
+        ):
+            raise ValueError(f"{path} is not a version {JOURNAL_VERSION} position journal")
+        while len(data := handle.read(RECORD_SIZE)) == RECORD_SIZE:
+            record = decode_record(data)
+            if record is not None:
+                yield record if version == JOURNAL_VERSION else replace(record, wall_time_ns=0)
+
+
+def latest_records(path: str | Path) -> dict[int, JournalRecord]:
+    """Return the last intact record per audiobook; later records win."""
+    return {record.audiobook_id: record for record in iter_records(path)}
+
+
+def latest_states(path: str | Path) -> dict[int, PlaybackState]:
+    """Return the last intact state per audiobook; later records win."""
+    return {
+        audiobook_id: record.to_state() for audiobook_id, record in latest_records(path).items()
+    }
+
+
+def replay_journal(repository: PlaybackRepository, path: str | Path) -> int:
+    """Recover the states a crashed writer left in the journal at ``path``.
+
+    Returns the number of audiobooks restored. Does nothing while a live writer holds
+    the journal: its records are newer than SQLite only until its next commit, and
+    that writer truncates the journal itself.
+    """
+    if not os.path.exists(path):
+        return 0
+    try:
+        journal = PositionJournal(path)
+    except BlockingIOError:
+        return 0
+    try:
+        return journal.replay(repository)
+    finally:
+        journal.close()
@@ -2,9 +2,26 @@
 from __future__ import annotations
 
 import sqlite3
-from typing import Iterable, Sequence
+from dataclasses import replace
+from typing import Iterable, Iterator, Sequence
 
-from player.models import AudioFile, Audiobook
+from player import db
+from player.models import AudioFile, Audiobook, BookOverview, LibraryTotals
+
+INSERT_AUDIO_FILE = """
+INSERT INTO audio_files (
+    audiobook_id, path, duration_seconds, order_index, file_hash, fingerprint
+)
+VALUES (?, ?, ?, ?, ?, ?)
+""".strip()
+
+# ORDER BY clauses for library_overview, over the columns of the page it selects.
+OVERVIEW_SORTS: dict[str, str] = {
+    # Most recently played first, then books never played, newest first.
+    "recent": "updated_at IS NULL, updated_at DESC, created_at DESC, id DESC",
+    "title": "title COLLATE NOCASE, id",
+    "added": "created_at, id",
+}
 
 
 def create_audiobook(connection: sqlite3.Connection, title: str) -> Audiobook:
@@ -25,13 +42,11 @@ def add_audio_file(
     duration_seconds: float,
     order_index: int,
     file_hash: str | None = None,
+    fingerprint: str | None = None,
 ) -> AudioFile:
     cursor = connection.execute(
-        """
-        INSERT INTO audio_files (audiobook_id, path, duration_seconds, order_index, file_hash)
-        VALUES (?, ?, ?, ?, ?)
-        """,
-        (audiobook_id, path, duration_seconds, order_index, file_hash),
+        INSERT_AUDIO_FILE,
+        (audiobook_id, path, duration_seconds, order_index, file_hash, fingerprint),
     )
     connection.commit()
     return AudioFile(
@@ -48,13 +63,26 @@ def add_audio_files(
     connection: sqlite3.Connection,
     audiobook_id: int,
     files: Iterable[tuple[str, float, int, str | None]],
+    chunk_size: int = db.DEFAULT_CHUNK_SIZE,
 ) -> list[AudioFile]:
     created: list[AudioFile] = []
-    for path, duration, order_index, file_hash in files:
-        created.append(
-            add_audio_file(connection, audiobook_id, path, duration, order_index, file_hash)
-        )
-    return created
+
+    def rows() -> Iterator[tuple]:
+        for path, duration, order_index, file_hash in files:
+            created.append(
+                AudioFile(
+                    id=0,
+                    audiobook_id=audiobook_id,
+                    path=path,
+                    duration_seconds=duration,
+                    order_index=order_index,
+                    file_hash=file_hash,
+                )
+            )
+            yield (audiobook_id, path, duration, order_index, file_hash, None)
+
+    ids = db.bulk_insert(connection, INSERT_AUDIO_FILE, rows(), chunk_size)
+    return [replace(audio_file, id=file_id) for audio_file, file_id in zip(created, ids)]
 
 
 def list_audio_files(connection: sqlite3.Connection, audiobook_id: int) -> Sequence[AudioFile]:
@@ -78,3 +106,123 @@ def list_audio_files(connection: sqlite3.Connection, audiobook_id: int) -> Seque
         )
         for row in rows
     ]
+
+
+def library_overview(
+    connection: sqlite3.Connection,
+    limit: int | None = 50,
+    offset: int = 0,
+    sort: str = "recent",
+) -> list[BookOverview]:
+    """One page of books with their file counts, durations and listening progress.
+
+    A single statement picks the page first and then aggregates each book's files
+    in one pass over the ``(audiobook_id, order_index, ...)`` covering index, so the
+    cost grows with the page size rather than the library size. The global position
+    matches ``compute_global_position``: a saved file that is not part of the book
+    counts as the end of the book.
+    """
+    try:
+        order = OVERVIEW_SORTS[sort]
+    except KeyError:
+        expected = ", ".join(OVERVIEW_SORTS)
+        raise ValueError(f"Unknown sort {sort!r}; expected one of {expected}") from None
+    rows = connection.execute(
+        f"""
+        WITH page AS (
+            SELECT * FROM (
+                SELECT
+                    b.id,
+                    b.title,
+                    b.created_at,
+                    s.audio_file_id,
+                    s.position_seconds,
+                    s.updated_at
+                FROM audiobooks AS b
+                LEFT JOIN playback_state AS s ON s.audiobook_id = b.id
+            )
+            ORDER BY {order}
+            LIMIT ? OFFSET ?
+        )
+        SELECT * FROM (
+            SELECT
+                page.id,
+                page.title,
+                page.created_at,
+                page.position_seconds,
+                page.updated_at,
+                cur.id AS current_file_id,
+                COUNT(f.id) AS file_count,
+                TOTAL(f.duration_seconds) AS total_duration,
+                TOTAL(
+                    CASE WHEN f.order_index < cur.order_index THEN f.duration_seconds END
+                ) AS current_offset
+            FROM page
+            LEFT JOIN audio_files AS cur
+                ON cur.id = page.audio_file_id AND cur.audiobook_id = page.id
+            LEFT JOIN audio_files AS f ON f.audiobook_id = page.id
+            GROUP BY page.id
+        )
+        ORDER BY {order}
+        """,
+        (-1 if limit is None else limit, offset),
+    ).fetchall()
+    overview: list[BookOverview] = []
+    for row in rows:
+        total = row["total_duration"]
+        if row["position_seconds"] is None:
+            position = 0.0
+        elif row["current_file_id"] is None:
+            position = total
+        else:
+            position = row["current_offset"] + row["position_seconds"]
+        overview.append(
+            BookOverview(
+                audiobook_id=row["id"],
+                title=row["title"],
+                file_count=row["file_count"],
+                total_duration_seconds=total,
+                global_position_seconds=position,
+                percent_complete=min(position / total, 1.0) * 100 if total > 0 else 0.0,
+                last_played_at=row["updated_at"],
+            )
+        )
+    return overview
+
+
+def library_totals(connection: sqlite3.Connection) -> LibraryTotals:
+    """Library-wide counts and listening time, in one statement."""
+    row = connection.execute(
+        """
+        SELECT
+            (SELECT COUNT(*) FROM audiobooks) AS books,
+            (SELECT COUNT(*) FROM audio_files) AS files,
+            (SELECT TOTAL(duration_seconds) FROM audio_files) AS total_duration,
+            COUNT(s.audiobook_id) AS books_started,
+            TOTAL(
+                CASE
+                    WHEN cur.id IS NULL THEN (
+                        SELECT TOTAL(f.duration_seconds)
+                        FROM audio_files AS f
+                        WHERE f.audiobook_id = s.audiobook_id
+                    )
+                    ELSE s.position_seconds + (
+                        SELECT TOTAL(f.duration_seconds)
+                        FROM audio_files AS f
+                        WHERE f.audiobook_id = s.audiobook_id
+                          AND f.order_index < cur.order_index
+                    )
+                END
+            ) AS listened
+        FROM playback_state AS s
+        LEFT JOIN audio_files AS cur
+            ON cur.id = s.audio_file_id AND cur.audiobook_id = s.audiobook_id
+        """
+    ).fetchone()
+    return LibraryTotals(
+        books=row["books"],
+        files=row["files"],
+        total_duration_seconds=row["total_duration"],
+        books_started=row["books_started"],
+        listened_seconds=row["listened"],
+    )
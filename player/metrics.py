@@ -0,0 +1,315 @@
+"""Lightweight counters and latency histograms, exported as JSON or Prometheus text.
+
+Metrics are off unless ``AUDIOBOOK_PLAYER_METRICS`` is set to a non-empty value
+other than ``0``, or ``enable()`` is called (``main.py serve --metrics`` does).
+While off, ``increment``, ``observe`` and ``timer`` return after one global check,
+and ``db.connect`` hands out plain connections, so SQL runs uninstrumented.
+
+What is recorded while on:
+
+- ``sql_statement_seconds{statement}``: ``execute``/``executemany`` on connections
+  from ``db.connect``, labelled by the whitespace-normalized statement. This
+  covers stepping to the first row; rows fetched afterwards are not timed.
+- ``sql_commit_seconds``: explicit ``commit()`` calls on those connections.
+- ``autosave_commit_seconds`` and ``autosave_lag_seconds``: how long the autosave
+  writer's commit takes, and how long a changed position waited before it was
+  committed.
+- ``process_spawn_seconds{program}``: ``Popen`` latency for ffplay/ffmpeg.
+- ``command_seconds{command}``: CLI commands, including those run by the daemon.
+- ``controller_command_seconds``, ``gui_callback_seconds`` and
+  ``gui_frame_lag_seconds``: work on the GUI's player thread, time spent in Tk
+  callbacks, and how late each GUI timer tick fired.
+
+This module only imports the standard library so that routing a command through
+the daemon stays cheap.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from pathlib import Path
+
+ENV_VAR = "AUDIOBOOK_PLAYER_METRICS"
+PROMETHEUS_PREFIX = "audiobook_player_"
+# Upper bounds in seconds, from 10 microseconds to 10 seconds.
+BUCKETS: tuple[float, ...] = (
+    1e-5, 2.5e-5, 5e-5,
+    1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0,
+)
+EXPORT_FORMATS = ("json", "prometheus")
+_MAX_STATEMENT_LABEL = 120
+
+Labels = tuple[tuple[str, str], ...]
+
+_enabled = os.environ.get(ENV_VAR, "") not in ("", "0")
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with count, sum, min and max."""
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS) -> None:
+        self.buckets = buckets
+        # One count per bucket plus an overflow bucket for values above the last bound.
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, fraction: float) -> float:
+        """Estimate a quantile by interpolating linearly inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / count
+                return min(max(estimate, self.min), self.max)
+            seen += count
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": [
+                [bound, count] for bound, count in zip((*self.buckets, "+Inf"), self.counts)
+            ],
+        }
+
+
+class Registry:
+    """Thread-safe store of counters and histograms keyed by name and labels."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._histograms: dict[tuple[str, Labels], Histogram] = {}
+
+    def increment(self, name: str, labels: Labels = (), amount: float = 1) -> None:
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {"name": name, "labels": dict(labels), **histogram.summary()}
+                for (name, labels), histogram in sorted(
+                    self._histograms.items(), key=lambda item: item[0]
+                )
+            ]
+        return {
+            "enabled": _enabled,
+            "created_at": time.time(),
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+
+REGISTRY = Registry()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on: bool = True) -> None:
+    """Turn recording on or off; connections opened earlier keep their current type."""
+    global _enabled
+    _enabled = on
+
+
+def _labels(labels: dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def increment(name: str, amount: float = 1, **labels: object) -> None:
+    if _enabled:
+        REGISTRY.increment(name, _labels(labels), amount)
+
+
+def observe(name: str, seconds: float, **labels: object) -> None:
+    if _enabled:
+        REGISTRY.observe(name, seconds, _labels(labels))
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name: str, labels: Labels) -> None:
+        self.name = name
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self) -> _Timer:
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        REGISTRY.observe(self.name, time.perf_counter() - self.started, self.labels)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> _NullTimer:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str, **labels: object) -> _Timer | _NullTimer:
+    """Context manager recording its duration into the ``name`` histogram."""
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name, _labels(labels))
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql: str) -> Labels:
+    text = " ".join(sql.split())
+    if len(text) > _MAX_STATEMENT_LABEL:
+        text = text[: _MAX_STATEMENT_LABEL - 3] + "..."
+    return (("statement", text),)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection factory that times statements and commits into ``REGISTRY``."""
+
+    def execute(self, sql: str, parameters=(), /) -> sqlite3.Cursor:
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            REGISTRY.observe(
+                "sql_statement_seconds", time.perf_counter() - started, statement_label(sql)
+            )
+
+    def executemany(self, sql: str, parameters, /) -> sqlite3.Cursor:
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            REGISTRY.observe(
+                "sql_statement_seconds", time.perf_counter() - started, statement_label(sql)
+            )
+
+    def commit(self) -> None:
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            REGISTRY.observe("sql_commit_seconds", time.perf_counter() - started)
+
+
+def to_json(snapshot: dict | None = None) -> str:
+    return json.dumps(snapshot or REGISTRY.snapshot(), indent=2) + "\n"
+
+
+def _prometheus_labels(labels: dict[str, str], extra: str = "") -> str:
+    parts = [
+        '{}="{}"'.format(
+            key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for key, value in labels.items()
+    ]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _prometheus_name(name: str) -> str:
+    return PROMETHEUS_PREFIX + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def to_prometheus(snapshot: dict | None = None) -> str:
+    """Render a snapshot in the Prometheus text exposition format."""
+    snapshot = snapshot or REGISTRY.snapshot()
+    lines: list[str] = []
+    declared: set[str] = set()
+    for counter in snapshot["counters"]:
+        name = _prometheus_name(counter["name"]) + "_total"
+        if name not in declared:
+            declared.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_prometheus_labels(counter['labels'])} {counter['value']:g}")
+    for histogram in snapshot["histograms"]:
+        name = _prometheus_name(histogram["name"])
+        if name not in declared:
+            declared.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        labels = histogram["labels"]
+        cumulative = 0
+        for bound, count in histogram["buckets"]:
+            cumulative += count
+            le = 'le="{}"'.format(bound if isinstance(bound, str) else f"{bound:g}")
+            lines.append(f"{name}_bucket{_prometheus_labels(labels, le)} {cumulative}")
+        lines.append(f"{name}_sum{_prometheus_labels(labels)} {histogram['sum']:.9g}")
+        lines.append(f"{name}_count{_prometheus_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def export(export_format: str = "json", snapshot: dict | None = None) -> str:
+    if export_format == "json":
+        return to_json(snapshot)
+    if export_format == "prometheus":
+        return to_prometheus(snapshot)
+    raise ValueError(f"Unknown metrics format {export_format!r}")
+
+
+def write_snapshot(path: str | Path, export_format: str = "json") -> None:
+    """Write the current snapshot atomically, so scrapers never read a partial file."""
+    target = Path(path)
+    partial = target.with_name(target.name + ".partial")
+    partial.write_text(export(export_format), encoding="utf-8")
+    partial.replace(target)
@@ -33,3 +33,69 @@ class TranscriptSegment:
     start_seconds: float
     end_seconds: float
     text: str
+    # Packed per-word timings, see player.word_timings.
+    word_timings: bytes | None = None
+
+
+@dataclass(frozen=True)
+class TranscriptWord:
+    text: str
+    start_seconds: float
+    end_seconds: float
+    char_start: int
+    char_end: int
+
+
+@dataclass(frozen=True)
+class TranscriptSearchHit:
+    audiobook_id: int
+    audio_file_id: int
+    start_seconds: float
+    end_seconds: float
+    text: str
+    snippet: str
+    rank: float
+    global_position_seconds: float
+
+
+@dataclass(frozen=True)
+class BookOverview:
+    audiobook_id: int
+    title: str
+    file_count: int
+    total_duration_seconds: float
+    global_position_seconds: float
+    percent_complete: float
+    # When the position was last saved; None for books never played.
+    last_played_at: str | None
+
+
+@dataclass(frozen=True)
+class LibraryTotals:
+    books: int
+    files: int
+    total_duration_seconds: float
+    books_started: int
+    listened_seconds: float
+
+
+@dataclass(frozen=True)
+class ListeningSession:
+    id: int
+    audiobook_id: int
+    started_at: str
+    ended_at: str
+    start_audio_file_id: int
+    start_position_seconds: float
+    end_audio_file_id: int
+    end_position_seconds: float
+    # Book content played through, which at higher speeds exceeds the wall time.
+    listened_seconds: float
+
+
+@dataclass(frozen=True)
+class ListeningTotals:
+    audiobook_id: int
+    listened_seconds: float
+    sessions: int
+    last_listened_at: str | None
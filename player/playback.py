@@ -1,13 +1,31 @@
 """Playback state and autosave handling."""
 from __future__ import annotations
 
+import atexit
 import sqlite3
 import threading
+import time
+from bisect import bisect_left
 from dataclasses import dataclass
-from typing import Iterable
+from itertools import accumulate
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
 
+from player import db, metrics
+from player.history import HistoryRecorder
+from player.journal import PositionJournal, journal_path_for
 from player.models import AudioFile, PlaybackState
 
+UPSERT_STATE = """
+INSERT INTO playback_state (audiobook_id, audio_file_id, position_seconds)
+VALUES (?, ?, ?)
+ON CONFLICT(audiobook_id)
+DO UPDATE SET
+    audio_file_id = excluded.audio_file_id,
+    position_seconds = excluded.position_seconds,
+    updated_at = datetime('now')
+""".strip()
+
 
 @dataclass
 class PlaybackPosition:
@@ -38,76 +56,396 @@ class PlaybackRepository:
 
     def upsert_state(self, state: PlaybackState) -> None:
         self.connection.execute(
-            """
-            INSERT INTO playback_state (audiobook_id, audio_file_id, position_seconds)
-            VALUES (?, ?, ?)
-            ON CONFLICT(audiobook_id)
-            DO UPDATE SET
-                audio_file_id = excluded.audio_file_id,
-                position_seconds = excluded.position_seconds,
-                updated_at = datetime('now')
-            """,
+            UPSERT_STATE,
             (state.audiobook_id, state.audio_file_id, state.position_seconds),
         )
         self.connection.commit()
 
+    def upsert_states(self, states: Iterable[PlaybackState]) -> None:
+        self.connection.executemany(
+            UPSERT_STATE,
+            [(state.audiobook_id, state.audio_file_id, state.position_seconds) for state in states],
+        )
+        self.connection.commit()
+
+
+class BookTimeline:
+    """Prefix-sum index over the ordered files of one audiobook.
+
+    Build it once per book (for example from ``list_audio_files``) and reuse it
+    for every global/local conversion; lookups are O(log n) in the number of files.
+    """
+
+    def __init__(self, files: Iterable[AudioFile]) -> None:
+        self.files: tuple[AudioFile, ...] = tuple(files)
+        self._starts: list[float] = [0.0]
+        self._starts.extend(accumulate(audio_file.duration_seconds for audio_file in self.files))
+        self._ends: list[float] = self._starts[1:]
+        self._index_by_id: dict[int, int] = {
+            audio_file.id: idx for idx, audio_file in enumerate(self.files)
+        }
+
+    def __iter__(self) -> Iterator[AudioFile]:
+        return iter(self.files)
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __contains__(self, audio_file_id: object) -> bool:
+        return audio_file_id in self._index_by_id
+
+    @property
+    def total_duration(self) -> float:
+        return self._starts[-1]
+
+    def index_of(self, audio_file_id: int) -> int:
+        try:
+            return self._index_by_id[audio_file_id]
+        except KeyError:
+            raise ValueError("Current file not found in audiobook.") from None
+
+    def file_offset(self, audio_file_id: int) -> float:
+        return self._starts[self.index_of(audio_file_id)]
+
+    def global_position(self, audio_file_id: int, position_seconds: float) -> float:
+        return self.file_offset(audio_file_id) + position_seconds
+
+    def resolve(self, global_position: float, lo: int = 0) -> PlaybackPosition:
+        if not self.files:
+            raise ValueError("No audio files available for playback.")
+        target = max(global_position, 0.0)
+        index = bisect_left(self._ends, target, lo)
+        if index >= len(self.files):
+            last_file = self.files[-1]
+            return PlaybackPosition(
+                audio_file=last_file, position_seconds=last_file.duration_seconds
+            )
+        return PlaybackPosition(
+            audio_file=self.files[index],
+            position_seconds=target - self._starts[index],
+        )
+
+    def advance(
+        self,
+        current_file_id: int,
+        position_seconds: float,
+        delta_seconds: float,
+    ) -> PlaybackPosition:
+        """Move by ``delta_seconds`` (negative to rewind), crossing file boundaries."""
+        current_index = self.index_of(current_file_id)
+        target = self._starts[current_index] + position_seconds + delta_seconds
+        # Stay on the current file when landing exactly on its start boundary.
+        lo = current_index if target >= self._starts[current_index] else 0
+        return self.resolve(target, lo)
+
 
 def compute_global_position(files: Iterable[AudioFile], current_file_id: int, position: float) -> float:
-    total = 0.0
-    for audio_file in files:
-        if audio_file.id == current_file_id:
-            total += position
-            break
-        total += audio_file.duration_seconds
-    return total
+    timeline = files if isinstance(files, BookTimeline) else BookTimeline(files)
+    if current_file_id not in timeline:
+        return timeline.total_duration
+    return timeline.global_position(current_file_id, position)
 
 
 def resolve_position_from_global(
     files: Iterable[AudioFile],
     global_position: float,
 ) -> PlaybackPosition:
-    remaining = max(global_position, 0.0)
-    last_file: AudioFile | None = None
-    for audio_file in files:
-        last_file = audio_file
-        if remaining <= audio_file.duration_seconds:
-            return PlaybackPosition(audio_file=audio_file, position_seconds=remaining)
-        remaining -= audio_file.duration_seconds
-    if last_file is None:
-        raise ValueError("No audio files available for playback.")
-    return PlaybackPosition(audio_file=last_file, position_seconds=last_file.duration_seconds)
+    timeline = files if isinstance(files, BookTimeline) else BookTimeline(files)
+    return timeline.resolve(global_position)
+
+
+@dataclass
+class AutosaveStats:
+    writes: int = 0
+    skipped: int = 0
+    errors: int = 0
+    journal_appends: int = 0
+    last_latency_seconds: float = 0.0
+    max_latency_seconds: float = 0.0
+    total_latency_seconds: float = 0.0
+
+    @property
+    def mean_latency_seconds(self) -> float:
+        return self.total_latency_seconds / self.writes if self.writes else 0.0
+
+
+class AutosaveWriter:
+    """Write-behind saver for playback state that owns a single writer thread.
+
+    The thread opens its own connection to ``db_path``, so no connection is shared
+    across threads. States passed to ``submit`` are coalesced per audiobook and
+    written on the next tick; a tick whose states match what was last written skips
+    the database entirely. ``flush`` forces an immediate write and waits for it.
+
+    With a ``journal_path`` the supplier is polled every ``journal_interval_seconds``
+    and changed positions are appended to a ``PositionJournal`` in between SQLite
+    commits. The journal is replayed when the writer starts and emptied whenever
+    SQLite has caught up with it.
+
+    With a ``history`` recorder every state seen is also folded into listening
+    sessions, which are committed together with the positions.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        interval_seconds: float = 2.5,
+        state_supplier: Callable[[], PlaybackState | None] | None = None,
+        journal_path: str | Path | None = None,
+        journal_interval_seconds: float = 0.25,
+        history: HistoryRecorder | None = None,
+    ) -> None:
+        self.db_path = db_path
+        self.interval_seconds = interval_seconds
+        self.state_supplier = state_supplier
+        self.journal_path = journal_path
+        self.journal_interval_seconds = journal_interval_seconds
+        self.history = history
+        self.stats = AutosaveStats()
+        self._condition = threading.Condition()
+        self._pending: dict[int, PlaybackState] = {}
+        self._unsaved: dict[int, PlaybackState] = {}
+        self._written: dict[int, PlaybackState] = {}
+        self._journaled: dict[int, PlaybackState] = {}
+        # When the oldest uncommitted change arrived, for the autosave lag metric.
+        self._changed_since: float | None = None
+        self._submitted_at: float | None = None
+        self._requested = 0
+        self._completed = 0
+        self._closing = False
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name="autosave-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, state: PlaybackState) -> None:
+        with self._condition:
+            self._pending[state.audiobook_id] = state
+            if self._submitted_at is None:
+                self._submitted_at = time.monotonic()
+
+    def flush(self, timeout: float | None = 5.0) -> bool:
+        """Write pending state now; returns False if the write did not finish in time."""
+        with self._condition:
+            if not self._thread or not self._thread.is_alive():
+                return False
+            self._requested += 1
+            generation = self._requested
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: self._completed >= generation, timeout)
+
+    def close(self, timeout: float | None = 5.0) -> None:
+        atexit.unregister(self.close)
+        thread = self._thread
+        if not thread:
+            return
+        with self._condition:
+            self._closing = True
+            self._requested += 1
+            self._condition.notify_all()
+        thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        connection = db.connect(self.db_path)
+        repository = PlaybackRepository(connection)
+        position_journal: PositionJournal | None = None
+        if self.journal_path is not None:
+            try:
+                position_journal = PositionJournal(self.journal_path)
+            except BlockingIOError:
+                # Another writer on this database journals already; this one still
+                # commits every interval.
+                position_journal = None
+            else:
+                position_journal.replay(repository)
+        tick_seconds = self.journal_interval_seconds if position_journal else self.interval_seconds
+        next_commit = time.monotonic() + self.interval_seconds
+        try:
+            while True:
+                with self._condition:
+                    if not self._closing and self._requested == self._completed:
+                        self._condition.wait(tick_seconds)
+                    generation = self._requested
+                    closing = self._closing
+                    pending, self._pending = self._pending, {}
+                    submitted_at, self._submitted_at = self._submitted_at, None
+                state = self._poll_supplier()
+                if state:
+                    # Polled after every state in ``pending`` was submitted, so it is the
+                    # newest; a submitted seek target is only kept for other books.
+                    pending[state.audiobook_id] = state
+                if self.history:
+                    for pending_state in pending.values():
+                        self.history.observe(pending_state)
+                if position_journal:
+                    self._append_journal(position_journal, pending)
+                self._unsaved.update(pending)
+                now = time.monotonic()
+                if self._changed_since is None and metrics.enabled():
+                    if any(self._written.get(key) != new for key, new in pending.items()):
+                        self._changed_since = submitted_at or now
+                if generation != self._completed or now >= next_commit:
+                    next_commit = now + self.interval_seconds
+                    if self._write(repository) and position_journal:
+                        # Every journaled state is committed now; keep the journal to
+                        # the states since the last commit so a replay is never stale.
+                        position_journal.truncate()
+                with self._condition:
+                    self._completed = generation
+                    self._condition.notify_all()
+                if closing:
+                    return
+        finally:
+            if position_journal:
+                position_journal.close()
+            connection.close()
+
+    def _poll_supplier(self) -> PlaybackState | None:
+        if not self.state_supplier:
+            return None
+        try:
+            return self.state_supplier()
+        except Exception:  # noqa: BLE001 - a failing supplier must not stop autosave
+            self.stats.errors += 1
+            return None
+
+    def _append_journal(
+        self, position_journal: PositionJournal, pending: dict[int, PlaybackState]
+    ) -> None:
+        for state in pending.values():
+            if self._journaled.get(state.audiobook_id) != state:
+                position_journal.append(state)
+                self._journaled[state.audiobook_id] = state
+                self.stats.journal_appends += 1
+
+    def _write(self, repository: PlaybackRepository) -> bool:
+        """Commit unsaved states; returns True once SQLite holds every state seen."""
+        changed = [
+            state
+            for state in self._unsaved.values()
+            if self._written.get(state.audiobook_id) != state
+        ]
+        history_changed = self.history is not None and self.history.has_changes
+        if not changed and not history_changed:
+            if self._unsaved:
+                self.stats.skipped += 1
+                metrics.increment("autosave_skipped")
+            self._unsaved.clear()
+            self._changed_since = None
+            return True
+        started = time.perf_counter()
+        try:
+            if history_changed:
+                self.history.write(repository.connection)
+            if changed:
+                # Commits the history rows in the same transaction.
+                repository.upsert_states(changed)
+            else:
+                repository.connection.commit()
+        except sqlite3.Error:
+            # Keep the states unsaved so the next tick retries them.
+            self.stats.errors += 1
+            metrics.increment("autosave_errors")
+            repository.connection.rollback()
+            if history_changed:
+                self.history.failed()
+            return False
+        if history_changed:
+            self.history.written()
+        latency = time.perf_counter() - started
+        for state in changed:
+            self._written[state.audiobook_id] = state
+        self._unsaved.clear()
+        self.stats.writes += 1
+        self.stats.last_latency_seconds = latency
+        self.stats.max_latency_seconds = max(self.stats.max_latency_seconds, latency)
+        self.stats.total_latency_seconds += latency
+        metrics.observe("autosave_commit_seconds", latency)
+        if self._changed_since is not None:
+            metrics.observe("autosave_lag_seconds", time.monotonic() - self._changed_since)
+            self._changed_since = None
+        return True
 
 
 class PlaybackSession:
-    def __init__(self, repository: PlaybackRepository, audiobook_id: int) -> None:
+    def __init__(
+        self,
+        repository: PlaybackRepository,
+        audiobook_id: int,
+        timeline: BookTimeline | None = None,
+    ) -> None:
         self.repository = repository
         self.audiobook_id = audiobook_id
-        self._autosave_thread: threading.Thread | None = None
-        self._autosave_stop = threading.Event()
+        self.timeline = timeline
+        self._writer: AutosaveWriter | None = None
+
+    @property
+    def autosave_stats(self) -> AutosaveStats | None:
+        return self._writer.stats if self._writer else None
 
-    def start_autosave(self, state_supplier, interval_seconds: float = 2.5) -> None:
-        if self._autosave_thread and self._autosave_thread.is_alive():
+    def start_autosave(
+        self,
+        state_supplier,
+        interval_seconds: float = 2.5,
+        journal: bool = True,
+        journal_interval_seconds: float = 0.25,
+        history: bool = True,
+    ) -> None:
+        if self._writer:
             return
-        self._autosave_stop.clear()
-        self._autosave_thread = threading.Thread(
-            target=self._run_autosave, args=(state_supplier, interval_seconds), daemon=True
+        db_path = db.database_path(self.repository.connection)
+        if db_path is None:
+            raise ValueError("Autosave requires a file-backed database.")
+        self._writer = AutosaveWriter(
+            db_path,
+            interval_seconds,
+            state_supplier,
+            journal_path=journal_path_for(db_path) if journal else None,
+            journal_interval_seconds=journal_interval_seconds,
+            history=(
+                HistoryRecorder(self.audiobook_id, self.timeline)
+                if history and self.timeline is not None
+                else None
+            ),
         )
-        self._autosave_thread.start()
+        self._writer.start()
 
     def stop_autosave(self) -> None:
-        self._autosave_stop.set()
-        if self._autosave_thread:
-            self._autosave_thread.join(timeout=1.0)
+        if self._writer:
+            self._writer.close()
+            self._writer = None
 
-    def _run_autosave(self, state_supplier, interval_seconds: float) -> None:
-        while not self._autosave_stop.is_set():
-            state = state_supplier()
-            if state:
-                self.repository.upsert_state(state)
-            self._autosave_stop.wait(interval_seconds)
+    def queue_state(self, state: PlaybackState) -> None:
+        """Record a state change (such as a seek) to be written on the next autosave tick."""
+        if self._writer:
+            self._writer.submit(state)
+        else:
+            self.repository.upsert_state(state)
 
     def save_state(self, state: PlaybackState) -> None:
-        self.repository.upsert_state(state)
+        """Persist a state immediately, for pause, stop and exit events."""
+        if self._writer:
+            self._writer.submit(state)
+            self._writer.flush()
+        else:
+            self.repository.upsert_state(state)
+
+    def state_at_global_position(self, global_position: float) -> PlaybackState:
+        """Map a book-wide position onto a storable state using the session timeline."""
+        if self.timeline is None:
+            raise ValueError("Playback session has no timeline.")
+        resolved = self.timeline.resolve(global_position)
+        return PlaybackState(
+            audiobook_id=self.audiobook_id,
+            audio_file_id=resolved.audio_file.id,
+            position_seconds=resolved.position_seconds,
+        )
 
 
 def advance_position(
@@ -118,22 +456,5 @@ def advance_position(
 ) -> PlaybackPosition:
     if delta_seconds < 0:
         raise ValueError("Delta seconds must be non-negative")
-    files_list = list(files)
-    current_index = next(
-        (idx for idx, audio_file in enumerate(files_list) if audio_file.id == current_file_id),
-        None,
-    )
-    if current_index is None:
-        raise ValueError("Current file not found in audiobook.")
-
-    remaining = position_seconds + delta_seconds
-    index = current_index
-    while index < len(files_list):
-        current_file = files_list[index]
-        if remaining <= current_file.duration_seconds:
-            return PlaybackPosition(audio_file=current_file, position_seconds=remaining)
-        remaining -= current_file.duration_seconds
-        index += 1
-
-    last_file = files_list[-1]
-    return PlaybackPosition(audio_file=last_file, position_seconds=last_file.duration_seconds)
+    timeline = files if isinstance(files, BookTimeline) else BookTimeline(files)
+    return timeline.advance(current_file_id, position_seconds, delta_seconds)
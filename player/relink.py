@@ -0,0 +1,380 @@
+"""Relinking moved audio files by fingerprint, and upgrading fingerprints to full hashes.
+
+Scans store a cheap ``fingerprint`` for every file (``scanner.fingerprint_file``)
+but leave ``file_hash`` empty unless asked for it. ``relink_missing`` finds
+library files whose path no longer exists and looks for them under the given
+directories in one walk, opening only files whose size matches a missing one.
+``upgrade_hashes`` computes the full SHA-256 hashes later, in batches, and
+``HashUpgrader`` runs it on a background thread with its own connection.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable
+
+from player import db
+from player.scanner import (
+    AUDIO_EXTENSIONS,
+    UPSERT_SCANNED_FILE,
+    ScannedFile,
+    fingerprint_file,
+    fingerprint_size,
+    hash_file,
+    iter_audio_files,
+)
+
+DEFAULT_HASH_BATCH_SIZE = 32
+
+# Relinked files whose book came from a scan register their new folder, so later
+# scans of it add new files to the same book.
+INSERT_RELINKED_FOLDER = """
+INSERT INTO scanned_folders (path, audiobook_id)
+SELECT ?, ? WHERE EXISTS (SELECT 1 FROM scanned_folders WHERE audiobook_id = ?)
+ON CONFLICT(path) DO NOTHING
+""".strip()
+
+
+@dataclass(frozen=True)
+class MissingFile:
+    audio_file_id: int
+    audiobook_id: int
+    path: str
+    size_bytes: int
+    # What a replacement must match: the fingerprint, or "sha256:<hash>" without one.
+    key: str
+
+
+@dataclass
+class RelinkResult:
+    missing: int = 0
+    # Files under the search roots that were opened because their size matched.
+    candidates: int = 0
+    relinked: list[tuple[int, str, str]] = field(default_factory=list)
+    ambiguous: list[str] = field(default_factory=list)
+    unmatched: list[str] = field(default_factory=list)
+
+
+@dataclass
+class HashUpgradeResult:
+    hashed: int = 0
+    missing: int = 0
+    errors: list[tuple[str, str]] = field(default_factory=list)
+
+
+def find_missing(connection: sqlite3.Connection) -> tuple[list[MissingFile], list[str], set[str]]:
+    """Split library files into missing ones that can be matched and ones that cannot.
+
+    Also returns every path in the library, so candidates already linked to a row
+    are never taken for a missing one.
+    """
+    missing: list[MissingFile] = []
+    unmatchable: list[str] = []
+    known_paths: set[str] = set()
+    rows = connection.execute(
+        """
+        SELECT f.id, f.audiobook_id, f.path, f.fingerprint, f.file_hash,
+               MAX(s.size_bytes) AS size_bytes
+        FROM audio_files AS f
+        LEFT JOIN scanned_files AS s ON s.audio_file_id = f.id
+        GROUP BY f.id
+        """
+    )
+    for row in rows:
+        path = row["path"]
+        known_paths.add(path)
+        if os.path.exists(path):
+            continue
+        fingerprint = row["fingerprint"]
+        size = fingerprint_size(fingerprint) if fingerprint else row["size_bytes"]
+        if fingerprint:
+            key = fingerprint
+        elif row["file_hash"]:
+            key = f"sha256:{row['file_hash']}"
+        else:
+            key = None
+        if size is None or key is None:
+            unmatchable.append(path)
+            continue
+        missing.append(MissingFile(row["id"], row["audiobook_id"], path, size, key))
+    return missing, unmatchable, known_paths
+
+
+def _candidate_keys(scanned: ScannedFile, full_hash: bool) -> tuple[str, str | None]:
+    fingerprint = fingerprint_file(scanned.path)
+    return fingerprint, f"sha256:{hash_file(scanned.path)}" if full_hash else None
+
+
+def _shared_tail(first: str, second: str) -> int:
+    """How many trailing path components (file name, then folders) two paths share."""
+    shared = 0
+    for left, right in zip(reversed(Path(first).parts), reversed(Path(second).parts)):
+        if left != right:
+            break
+        shared += 1
+    return shared
+
+
+def _pair(
+    wanted: list[MissingFile], found: list[ScannedFile], used: set[str]
+) -> tuple[list[tuple[MissingFile, ScannedFile]], list[MissingFile]]:
+    found = [scanned for scanned in found if scanned.path not in used]
+    if len(wanted) == 1 and len(found) == 1:
+        return [(wanted[0], found[0])], []
+    # Identical copies: the one keeping most of the old path's tail wins, if unique.
+    pairs, left = [], []
+    for missing_file in wanted:
+        scored = [
+            (_shared_tail(missing_file.path, scanned.path), scanned)
+            for scanned in found
+            if scanned.path not in used
+        ]
+        best = max((score for score, _ in scored), default=0)
+        winners = [scanned for score, scanned in scored if score == best]
+        if best and len(winners) == 1:
+            pairs.append((missing_file, winners[0]))
+            used.add(winners[0].path)
+        else:
+            left.append(missing_file)
+    return pairs, left
+
+
+def relink_missing(
+    connection: sqlite3.Connection,
+    roots: Iterable[str | Path],
+    extensions: Iterable[str] = AUDIO_EXTENSIONS,
+    workers: int | None = None,
+    dry_run: bool = False,
+) -> RelinkResult:
+    """Point missing library files at their moved copies found under ``roots``.
+
+    The roots are walked once. Only files whose size equals a missing file's size
+    are fingerprinted, and only those standing in for a file that has a full hash
+    but no fingerprint are hashed in full. A missing file is relinked when exactly
+    one unclaimed candidate matches it or, among identical copies, when one keeps
+    more of its old path (name, then parent folders) than the others.
+    All matches are written in a single transaction.
+    """
+    missing, unmatchable, known_paths = find_missing(connection)
+    result = RelinkResult(missing=len(missing) + len(unmatchable), unmatched=unmatchable)
+    if not missing:
+        return result
+
+    by_size: dict[int, list[MissingFile]] = {}
+    for missing_file in missing:
+        by_size.setdefault(missing_file.size_bytes, []).append(missing_file)
+    hashed_sizes = {
+        size
+        for size, files in by_size.items()
+        if any(missing_file.key.startswith("sha256:") for missing_file in files)
+    }
+    candidates: dict[str, ScannedFile] = {}
+    for root in roots:
+        for scanned in iter_audio_files(root, extensions):
+            if scanned.size_bytes in by_size and scanned.path not in known_paths:
+                candidates[scanned.path] = scanned
+    result.candidates = len(candidates)
+
+    if workers is None:
+        workers = min(32, (os.cpu_count() or 1) * 4)
+    found: dict[str, list[ScannedFile]] = {}
+    fingerprints: dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        keyed = {
+            path: pool.submit(_candidate_keys, scanned, scanned.size_bytes in hashed_sizes)
+            for path, scanned in candidates.items()
+        }
+        for path, future in keyed.items():
+            try:
+                fingerprint, full_key = future.result()
+            except OSError:
+                continue
+            fingerprints[path] = fingerprint
+            for key in (fingerprint, full_key):
+                if key:
+                    found.setdefault(key, []).append(candidates[path])
+
+    wanted: dict[str, list[MissingFile]] = {}
+    for missing_file in missing:
+        wanted.setdefault(missing_file.key, []).append(missing_file)
+    used: set[str] = set()
+    pairs: list[tuple[MissingFile, ScannedFile]] = []
+    for key, files in wanted.items():
+        if key not in found:
+            result.unmatched.extend(missing_file.path for missing_file in files)
+            continue
+        matched, left = _pair(files, found[key], used)
+        used.update(scanned.path for _, scanned in matched)
+        pairs.extend(matched)
+        result.ambiguous.extend(missing_file.path for missing_file in left)
+    result.relinked = [
+        (missing_file.audio_file_id, missing_file.path, scanned.path)
+        for missing_file, scanned in pairs
+    ]
+    if dry_run or not pairs:
+        return result
+
+    try:
+        connection.executemany(
+            "UPDATE audio_files SET path = ?, fingerprint = COALESCE(fingerprint, ?) WHERE id = ?",
+            [
+                (scanned.path, fingerprints[scanned.path], missing_file.audio_file_id)
+                for missing_file, scanned in pairs
+            ],
+        )
+        connection.executemany(
+            "DELETE FROM scanned_files WHERE audio_file_id = ?",
+            [(missing_file.audio_file_id,) for missing_file, _ in pairs],
+        )
+        connection.executemany(
+            UPSERT_SCANNED_FILE,
+            [
+                (scanned.path, missing_file.audio_file_id, scanned.size_bytes, scanned.mtime_ns)
+                for missing_file, scanned in pairs
+            ],
+        )
+        connection.executemany(
+            INSERT_RELINKED_FOLDER,
+            {
+                (scanned.folder, missing_file.audiobook_id, missing_file.audiobook_id)
+                for missing_file, scanned in pairs
+            },
+        )
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+    return result
+
+
+def _hash_and_fingerprint(path: str) -> tuple[str, str]:
+    return hash_file(path), fingerprint_file(path)
+
+
+def upgrade_hashes(
+    connection: sqlite3.Connection,
+    limit: int | None = None,
+    workers: int | None = None,
+    batch_size: int = DEFAULT_HASH_BATCH_SIZE,
+    stop: threading.Event | None = None,
+    progress: Callable[[str], None] | None = None,
+) -> HashUpgradeResult:
+    """Compute full content hashes for files that only have a fingerprint.
+
+    Files are hashed ``batch_size`` at a time on a process pool and each batch is
+    committed on its own, so an interrupted upgrade keeps its finished work and
+    ``stop`` takes effect between batches. The fingerprint is refreshed alongside,
+    which also fills it in for files added before fingerprints existed.
+    """
+    result = HashUpgradeResult()
+    last_id = 0
+    remaining = limit
+    # Spawned for the same reason as the scanner's hash workers: the caller may have
+    # other threads running.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        while remaining is None or remaining > 0:
+            if stop is not None and stop.is_set():
+                break
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            rows = connection.execute(
+                """
+                SELECT id, path FROM audio_files
+                WHERE file_hash IS NULL AND id > ?
+                ORDER BY id
+                LIMIT ?
+                """,
+                (last_id, size),
+            ).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            if remaining is not None:
+                remaining -= len(rows)
+            futures = [(row, pool.submit(_hash_and_fingerprint, row["path"])) for row in rows]
+            updates = []
+            for row, future in futures:
+                try:
+                    file_hash, fingerprint = future.result()
+                except FileNotFoundError:
+                    result.missing += 1
+                    continue
+                except Exception as exc:  # noqa: BLE001 - reported per file
+                    result.errors.append((row["path"], str(exc)))
+                    continue
+                updates.append((file_hash, fingerprint, row["id"]))
+                if progress:
+                    progress(row["path"])
+            connection.executemany(
+                "UPDATE audio_files SET file_hash = ?, fingerprint = ? WHERE id = ?", updates
+            )
+            connection.commit()
+            result.hashed += len(updates)
+    return result
+
+
+class HashUpgrader:
+    """Runs ``upgrade_hashes`` on a background thread with its own connection.
+
+    One worker process by default, so playback and commands keep the other cores.
+    ``stop`` lets the current batch finish and commit before the thread exits.
+    """
+
+    def __init__(
+        self,
+        db_path: str | Path,
+        workers: int = 1,
+        limit: int | None = None,
+        batch_size: int = DEFAULT_HASH_BATCH_SIZE,
+    ) -> None:
+        self.db_path = db_path
+        self.workers = workers
+        self.limit = limit
+        self.batch_size = batch_size
+        self.result: HashUpgradeResult | None = None
+        self.error: str | None = None
+        self.hashed_so_far = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self.result = self.error = None
+        self.hashed_so_far = 0
+        self._thread = threading.Thread(target=self._run, name="hash-upgrader", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _count(self, _path: str) -> None:
+        self.hashed_so_far += 1
+
+    def _run(self) -> None:
+        connection = db.connect(self.db_path)
+        try:
+            self.result = upgrade_hashes(
+                connection,
+                limit=self.limit,
+                workers=self.workers,
+                batch_size=self.batch_size,
+                stop=self._stop,
+                progress=self._count,
+            )
+        except Exception as exc:  # noqa: BLE001 - surfaced through ``error``
+            self.error = str(exc)
+        finally:
+            connection.close()
@@ -0,0 +1,328 @@
+"""Incremental library scanner that groups audio files into audiobooks by folder."""
+from __future__ import annotations
+
+import hashlib
+import mmap
+import multiprocessing
+import os
+import re
+import sqlite3
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from player import db
+from player.audio_engine import probe_duration
+from player.library import INSERT_AUDIO_FILE
+
+AUDIO_EXTENSIONS: frozenset[str] = frozenset(
+    {".mp3", ".m4a", ".m4b", ".aac", ".wav", ".flac", ".ogg", ".oga", ".opus", ".wma"}
+)
+HASH_BLOCK_SIZE = 1024 * 1024
+# Bytes read from each of the head, middle and tail of a file for its fingerprint.
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+FINGERPRINT_VERSION = "fp1"
+
+UPSERT_SCANNED_FILE = """
+INSERT INTO scanned_files (path, audio_file_id, size_bytes, mtime_ns)
+VALUES (?, ?, ?, ?)
+ON CONFLICT(path) DO UPDATE SET
+    audio_file_id = excluded.audio_file_id,
+    size_bytes = excluded.size_bytes,
+    mtime_ns = excluded.mtime_ns
+""".strip()
+
+_DIGITS = re.compile(r"(\d+)")
+
+
+@dataclass(frozen=True)
+class ScannedFile:
+    path: str
+    folder: str
+    size_bytes: int
+    mtime_ns: int
+
+
+@dataclass
+class ScanResult:
+    books_created: int = 0
+    files_added: int = 0
+    files_updated: int = 0
+    files_unchanged: int = 0
+    errors: list[tuple[str, str]] = field(default_factory=list)
+
+
+def natural_sort_key(name: str) -> tuple:
+    """Sort "Chapter 2" before "Chapter 10"."""
+    return tuple(int(part) if part.isdigit() else part.casefold() for part in _DIGITS.split(name))
+
+
+def iter_audio_files(
+    root: str | Path, extensions: Iterable[str] = AUDIO_EXTENSIONS
+) -> Iterator[ScannedFile]:
+    """Walk ``root`` with ``os.scandir``, reusing the directory entries' cached stat data."""
+    wanted = {extension.lower() for extension in extensions}
+    pending = [os.path.abspath(root)]
+    while pending:
+        folder = pending.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                pending.append(entry.path)
+            elif os.path.splitext(entry.name)[1].lower() in wanted and entry.is_file():
+                stat = entry.stat()
+                yield ScannedFile(
+                    path=entry.path,
+                    folder=folder,
+                    size_bytes=stat.st_size,
+                    mtime_ns=stat.st_mtime_ns,
+                )
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        while block := handle.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def store_file_hash(connection: sqlite3.Connection, audio_file_id: int, path: str) -> str:
+    """Hash a library file the scan left unhashed and save it, so it is read only once."""
+    file_hash = hash_file(path)
+    connection.execute(
+        "UPDATE audio_files SET file_hash = ? WHERE id = ?", (file_hash, audio_file_id)
+    )
+    connection.commit()
+    return file_hash
+
+
+def fingerprint_file(path: str) -> str:
+    """Identify a file by its size and three blocks from its head, middle and tail.
+
+    The blocks are read through ``mmap``, so a fingerprint costs the same three
+    page-ins for a 20 MB chapter as for a 4 GB book. Files of up to three blocks are
+    hashed whole. The result looks like ``fp1:<size>:<digest>``; moved files keep
+    it, which is what ``relink`` matches on.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as handle:
+        size = os.fstat(handle.fileno()).st_size
+        if size <= 3 * FINGERPRINT_BLOCK_SIZE:
+            digest.update(handle.read())
+        else:
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                middle = (size - FINGERPRINT_BLOCK_SIZE) // 2
+                for start in (0, middle, size - FINGERPRINT_BLOCK_SIZE):
+                    digest.update(mapped[start : start + FINGERPRINT_BLOCK_SIZE])
+    return f"{FINGERPRINT_VERSION}:{size}:{digest.hexdigest()}"
+
+
+def fingerprint_size(fingerprint: str) -> int | None:
+    """The file size recorded in a fingerprint, or None if it is not one of ours."""
+    version, _, rest = fingerprint.partition(":")
+    size, _, _ = rest.partition(":")
+    if version != FINGERPRINT_VERSION or not size.isdigit():
+        return None
+    return int(size)
+
+
+def scan_library(
+    connection: sqlite3.Connection,
+    root: str | Path,
+    probe_workers: int | None = None,
+    hash_workers: int | None = None,
+    hash_files: bool = False,
+    extensions: Iterable[str] = AUDIO_EXTENSIONS,
+    progress: Callable[[ScannedFile], None] | None = None,
+) -> ScanResult:
+    """Scan ``root`` and sync every audio file found into the library.
+
+    Each folder containing audio becomes one audiobook whose files are ordered by a
+    natural sort of their names. Files whose size and mtime match the previous scan
+    are skipped without being opened. Durations are probed with ffprobe and files
+    fingerprinted on a bounded thread pool. Full content hashes read every byte, so
+    they are only computed here with ``hash_files``, on a process pool that overlaps
+    the probes; otherwise ``relink.upgrade_hashes`` fills them in later.
+    """
+    result = ScanResult()
+    known_files = {
+        row["path"]: (row["audio_file_id"], row["size_bytes"], row["mtime_ns"])
+        for row in connection.execute(
+            "SELECT path, audio_file_id, size_bytes, mtime_ns FROM scanned_files"
+        )
+    }
+    known_folders = {
+        row["path"]: row["audiobook_id"]
+        for row in connection.execute("SELECT path, audiobook_id FROM scanned_folders")
+    }
+
+    folders: dict[str, list[ScannedFile]] = {}
+    changed: list[ScannedFile] = []
+    for scanned in iter_audio_files(root, extensions):
+        folders.setdefault(scanned.folder, []).append(scanned)
+        known = known_files.get(scanned.path)
+        if known and known[1] == scanned.size_bytes and known[2] == scanned.mtime_ns:
+            result.files_unchanged += 1
+        else:
+            changed.append(scanned)
+    if not changed:
+        return result
+
+    if probe_workers is None:
+        probe_workers = min(32, (os.cpu_count() or 1) * 4)
+    durations: dict[str, float] = {}
+    fingerprints: dict[str, str] = {}
+    hashes: dict[str, str] = {}
+    # Hash workers are spawned rather than forked: forking while the probe threads
+    # are running can deadlock the child on a lock held by one of them.
+    hash_context = multiprocessing.get_context("spawn")
+    with ThreadPoolExecutor(max_workers=probe_workers) as probe_pool, (
+        ProcessPoolExecutor(max_workers=hash_workers, mp_context=hash_context)
+        if hash_files
+        else nullcontext()
+    ) as hash_pool:
+        probes = {
+            scanned.path: probe_pool.submit(probe_duration, scanned.path) for scanned in changed
+        }
+        prints = {
+            scanned.path: probe_pool.submit(fingerprint_file, scanned.path) for scanned in changed
+        }
+        digests: dict[str, Future] = (
+            {scanned.path: hash_pool.submit(hash_file, scanned.path) for scanned in changed}
+            if hash_files
+            else {}
+        )
+        for scanned in changed:
+            try:
+                durations[scanned.path] = probes[scanned.path].result()
+                fingerprints[scanned.path] = prints[scanned.path].result()
+                if hash_files:
+                    hashes[scanned.path] = digests[scanned.path].result()
+            except Exception as exc:  # noqa: BLE001 - reported per file
+                result.errors.append((scanned.path, str(exc)))
+            if progress:
+                progress(scanned)
+
+    try:
+        for folder, scanned_files in folders.items():
+            _sync_folder(
+                connection,
+                folder,
+                sorted(scanned_files, key=lambda item: natural_sort_key(Path(item.path).name)),
+                known_files,
+                known_folders,
+                durations,
+                fingerprints,
+                hashes,
+                result,
+            )
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+    return result
+
+
+def _sync_folder(
+    connection: sqlite3.Connection,
+    folder: str,
+    scanned_files: list[ScannedFile],
+    known_files: dict[str, tuple[int, int, int]],
+    known_folders: dict[str, int],
+    durations: dict[str, float],
+    fingerprints: dict[str, str],
+    hashes: dict[str, str],
+    result: ScanResult,
+) -> None:
+    new_files = [
+        scanned
+        for scanned in scanned_files
+        if scanned.path not in known_files and scanned.path in durations
+    ]
+    updated_files = [
+        scanned
+        for scanned in scanned_files
+        if scanned.path in known_files and scanned.path in durations
+    ]
+    if not new_files and not updated_files:
+        return
+
+    audiobook_id = known_folders.get(folder)
+    if audiobook_id is None:
+        audiobook_id = connection.execute(
+            "INSERT INTO audiobooks (title) VALUES (?)", (os.path.basename(folder) or folder,)
+        ).lastrowid
+        connection.execute(
+            "INSERT INTO scanned_folders (path, audiobook_id) VALUES (?, ?)",
+            (folder, audiobook_id),
+        )
+        known_folders[folder] = audiobook_id
+        result.books_created += 1
+
+    order = {scanned.path: index for index, scanned in enumerate(scanned_files)}
+    rows = (
+        (
+            audiobook_id,
+            scanned.path,
+            durations[scanned.path],
+            order[scanned.path],
+            hashes.get(scanned.path),
+            fingerprints[scanned.path],
+        )
+        for scanned in new_files
+    )
+    created_ids = [
+        file_id
+        for chunk_ids in db.insert_rows(connection, INSERT_AUDIO_FILE, rows)
+        for file_id in chunk_ids
+    ]
+    for scanned, file_id in zip(new_files, created_ids):
+        known_files[scanned.path] = (file_id, scanned.size_bytes, scanned.mtime_ns)
+    result.files_added += len(created_ids)
+
+    connection.executemany(
+        """
+        UPDATE audio_files
+        SET duration_seconds = ?,
+            -- The size or mtime changed, and a fingerprint only samples the content,
+            -- so an old hash is dropped unless this scan computed a new one.
+            file_hash = ?,
+            fingerprint = ?
+        WHERE id = ?
+        """,
+        [
+            (
+                durations[scanned.path],
+                hashes.get(scanned.path),
+                fingerprints[scanned.path],
+                known_files[scanned.path][0],
+            )
+            for scanned in updated_files
+        ],
+    )
+    result.files_updated += len(updated_files)
+
+    if new_files:
+        # Files added in the middle of a folder shift the order of those after them.
+        connection.executemany(
+            "UPDATE audio_files SET order_index = ? WHERE id = ?",
+            [
+                (order[scanned.path], known_files[scanned.path][0])
+                for scanned in scanned_files
+                if scanned.path in known_files
+            ],
+        )
+    connection.executemany(
+        UPSERT_SCANNED_FILE,
+        [
+            (scanned.path, known_files[scanned.path][0], scanned.size_bytes, scanned.mtime_ns)
+            for scanned in new_files + updated_files
+        ],
+    )
+
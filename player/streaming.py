@@ -0,0 +1,761 @@
+"""Streaming playback engine: ffmpeg decodes PCM into a ring buffer drained by an output thread."""
+from __future__ import annotations
+
+import queue
+import subprocess
+import threading
+import time
+import wave
+from bisect import bisect_right
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, Sequence
+
+from player.audio_cache import AudioCache, CachedPcm, PcmFormat
+from player.audio_engine import (
+    PlaybackCommand,
+    build_ffmpeg_decode_command,
+    build_ffplay_pcm_command,
+    spawn,
+)
+from player.models import AudioFile
+from player.playback import BookTimeline
+
+try:
+    from player.timestretch import WsolaStretcher
+except ImportError:  # NumPy is optional; speed changes then restart ffmpeg with atempo.
+    WsolaStretcher = None
+
+SAMPLE_WIDTH = 2  # signed 16-bit PCM
+
+STOPPED = "stopped"
+PAUSED = "paused"
+PLAYING = "playing"
+ENDED = "ended"
+
+
+class PcmRingBuffer:
+    """Bounded byte FIFO between one decoder thread and one output thread.
+
+    Every ``reset`` starts a new generation. Writes tagged with an older generation
+    are refused, so a decoder that is being replaced after a seek can never leak
+    stale audio into the buffer. Reads return whole frames only.
+    """
+
+    def __init__(self, capacity_bytes: int, align: int = 1) -> None:
+        if capacity_bytes < align:
+            raise ValueError("Ring buffer capacity must hold at least one frame")
+        self.capacity = capacity_bytes - capacity_bytes % align
+        self.align = align
+        self._data = bytearray(self.capacity)
+        self._read_at = 0
+        self._size = 0
+        self._generation = 0
+        self._finished = False
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def fill_bytes(self) -> int:
+        return self._size
+
+    def reset(self) -> int:
+        """Drop buffered audio and return the new generation for the next writer."""
+        with self._condition:
+            self._generation += 1
+            self._read_at = 0
+            self._size = 0
+            self._finished = False
+            self._condition.notify_all()
+            return self._generation
+
+    def write(self, data: bytes, generation: int) -> bool:
+        """Append ``data``, blocking while full; returns False once the writer is stale."""
+        view = memoryview(data)
+        with self._condition:
+            while view:
+                while self._size == self.capacity and generation == self._generation:
+                    if self._closed:
+                        return False
+                    self._condition.wait()
+                if generation != self._generation or self._closed:
+                    return False
+                write_at = (self._read_at + self._size) % self.capacity
+                count = min(len(view), self.capacity - self._size, self.capacity - write_at)
+                self._data[write_at : write_at + count] = view[:count]
+                self._size += count
+                view = view[count:]
+                self._condition.notify_all()
+        return True
+
+    def finish(self, generation: int) -> None:
+        """Mark the end of the stream for ``generation``."""
+        with self._condition:
+            if generation == self._generation:
+                self._finished = True
+                self._condition.notify_all()
+
+    def read(self, max_bytes: int, timeout: float | None = None) -> tuple[bytes | None, int]:
+        """Return up to ``max_bytes`` of whole frames and the generation they belong to.
+
+        The data is ``b""`` when nothing arrived within ``timeout`` and ``None`` once the
+        stream is finished and drained.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._size >= self.align or self._finished or self._closed, timeout
+            )
+            available = self._size - self._size % self.align
+            if available == 0:
+                drained = (self._finished and self._size < self.align) or self._closed
+                return (None if drained else b""), self._generation
+            count = min(available, max_bytes - max_bytes % self.align)
+            first = min(count, self.capacity - self._read_at)
+            chunk = bytes(self._data[self._read_at : self._read_at + first])
+            if first < count:
+                chunk += bytes(self._data[: count - first])
+            self._read_at = (self._read_at + count) % self.capacity
+            self._size -= count
+            self._condition.notify_all()
+            return chunk, self._generation
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class AudioSink:
+    """Destination for interleaved signed 16-bit PCM written by the output thread."""
+
+    def open(self, sample_rate: int, channels: int) -> None:
+        pass
+
+    def write(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class NullSink(AudioSink):
+    """Discards audio; with ``realtime`` it sleeps as long as the audio would play."""
+
+    def __init__(self, realtime: bool = False) -> None:
+        self.realtime = realtime
+        self.bytes_written = 0
+        self._bytes_per_second = 0
+
+    def open(self, sample_rate: int, channels: int) -> None:
+        self._bytes_per_second = sample_rate * channels * SAMPLE_WIDTH
+
+    def write(self, data: bytes) -> None:
+        self.bytes_written += len(data)
+        if self.realtime and self._bytes_per_second:
+            time.sleep(len(data) / self._bytes_per_second)
+
+
+class WavFileSink(AudioSink):
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._writer: wave.Wave_write | None = None
+
+    def open(self, sample_rate: int, channels: int) -> None:
+        self._writer = wave.open(str(self.path), "wb")
+        self._writer.setnchannels(channels)
+        self._writer.setsampwidth(SAMPLE_WIDTH)
+        self._writer.setframerate(sample_rate)
+
+    def write(self, data: bytes) -> None:
+        if self._writer:
+            self._writer.writeframesraw(data)
+
+    def close(self) -> None:
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+
+class FfplaySink(AudioSink):
+    """Plays PCM through one long-lived ffplay process reading from its stdin."""
+
+    def __init__(self) -> None:
+        self.process: subprocess.Popen | None = None
+
+    def open(self, sample_rate: int, channels: int) -> None:
+        command = build_ffplay_pcm_command(sample_rate, channels)
+        self.process = spawn(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+
+    def write(self, data: bytes) -> None:
+        if self.process and self.process.stdin:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+
+    def close(self) -> None:
+        if not self.process:
+            return
+        if self.process.stdin:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        self.process.terminate()
+        self.process = None
+
+
+@dataclass(frozen=True)
+class Handover:
+    """One splice from a finished file into the next one on the timeline."""
+
+    from_index: int
+    to_index: int
+    latency_seconds: float
+    prefetched: bool
+
+
+class DecoderStream:
+    """One ffmpeg decode process whose PCM is read ahead into a bounded queue.
+
+    Reading ahead lets the next file of a book start decoding while the current
+    one is still being consumed, without the pipe back-pressuring ffmpeg.
+    """
+
+    def __init__(self, args: list[str], chunk_bytes: int, max_chunks: int) -> None:
+        self.chunk_bytes = chunk_bytes
+        self._queue: queue.Queue[bytes | None] = queue.Queue(maxsize=max(1, max_chunks))
+        self._closed = threading.Event()
+        self.process = spawn(
+            PlaybackCommand(args),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._reader = threading.Thread(target=self._read, name="audio-decoder", daemon=True)
+        self._reader.start()
+
+    def _read(self) -> None:
+        try:
+            while not self._closed.is_set():
+                chunk = self.process.stdout.read1(self.chunk_bytes)
+                if not self._put(chunk or None) or not chunk:
+                    break
+        finally:
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.stdout.close()
+            self.process.wait()
+
+    def _put(self, item: bytes | None) -> bool:
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def chunks(self, cancelled: Callable[[], bool]) -> Iterator[bytes]:
+        """Yield decoded PCM until the stream ends or ``cancelled()`` turns true."""
+        while not cancelled():
+            try:
+                chunk = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if chunk is None:
+                return
+            yield chunk
+
+    def close(self) -> None:
+        self._closed.set()
+        if self.process.poll() is None:
+            self.process.kill()
+
+
+class CachedPcmStream:
+    """Serves PCM from a cache entry through the same interface as ``DecoderStream``."""
+
+    def __init__(self, cached: CachedPcm, start_seconds: float, chunk_bytes: int) -> None:
+        self.chunk_bytes = chunk_bytes
+        self._cached = cached
+        self._start_seconds = start_seconds
+
+    def chunks(self, cancelled: Callable[[], bool]) -> Iterator[bytes]:
+        view = self._cached.view(self._start_seconds)
+        try:
+            for offset in range(0, len(view), self.chunk_bytes):
+                if cancelled():
+                    return
+                yield bytes(view[offset : offset + self.chunk_bytes])
+        finally:
+            view.release()
+
+    def close(self) -> None:
+        self._cached.close()
+
+
+class StreamingAudioEngine:
+    """Persistent player that keeps its output running across seeks, speed changes and files.
+
+    A pump thread decodes the current file with ffmpeg from the requested offset
+    (``-ss`` before ``-i``) into a ``PcmRingBuffer``; an output thread drains the buffer
+    into the sink. Seeking or changing speed only replaces the pump. The position is
+    derived from the number of frames the sink has consumed, so it reflects what has
+    actually been played rather than what has been decoded.
+
+    ``load_book`` plays every file of a ``BookTimeline`` as one stream: the next file
+    starts decoding ``prefetch_seconds`` before the current one runs out and its PCM
+    is appended to the ring buffer directly after the last frame of the current one,
+    so there is no gap and no restart. Each splice is recorded in ``handovers``.
+
+    When NumPy is available, speed is applied by a ``WsolaStretcher`` on the output
+    thread, so ``set_speed`` takes effect on the next block without touching the
+    decoder. Otherwise the decoder is restarted with an ffmpeg ``atempo`` chain.
+
+    With an ``audio_cache``, book files whose PCM is already cached in the engine's
+    output format are read from the memory-mapped entry instead of ffmpeg, so seeks
+    into them start without spawning a decoder.
+
+    ``set_skip_silence`` takes precomputed silent intervals per file (see
+    ``player.waveform``). The pump drops those frames before they reach the ring
+    buffer and records a position marker after each cut, so the reported position
+    stays on the file's own timeline.
+    """
+
+    def __init__(
+        self,
+        sink: AudioSink,
+        sample_rate: int = 44100,
+        channels: int = 2,
+        buffer_seconds: float = 2.0,
+        block_seconds: float = 0.05,
+        prefetch_seconds: float = 5.0,
+        on_end: Callable[[], None] | None = None,
+        on_file_change: Callable[[AudioFile], None] | None = None,
+        time_stretch: bool = True,
+        audio_cache: AudioCache | None = None,
+    ) -> None:
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_bytes = channels * SAMPLE_WIDTH
+        self.block_bytes = max(1, int(sample_rate * block_seconds)) * self.frame_bytes
+        self.buffer_seconds = buffer_seconds
+        self.prefetch_seconds = prefetch_seconds
+        self.on_end = on_end
+        self.on_file_change = on_file_change
+        self.audio_cache = audio_cache
+        self.handovers: list[Handover] = []
+        self.underruns = 0
+        self._ring = PcmRingBuffer(
+            max(self.block_bytes, int(sample_rate * buffer_seconds) * self.frame_bytes),
+            align=self.frame_bytes,
+        )
+        self._condition = threading.Condition()
+        self._state = STOPPED
+        self._paths: tuple[Path, ...] = ()
+        self._hashes: tuple[str | None, ...] = ()
+        self._timeline: BookTimeline | None = None
+        self._speed = 1.0
+        self._stretcher = (
+            WsolaStretcher(sample_rate, channels) if time_stretch and WsolaStretcher else None
+        )
+        self._base_seconds = 0.0
+        # Decoded (pre-stretch) frames that have been played in this generation.
+        self._frames_played = 0.0
+        # (first stream frame, track index, local start seconds) per decoded file
+        self._markers: list[tuple[int, int, float]] = []
+        self._marker_frames: list[int] = []
+        self._played_index = 0
+        # Audio file id -> (starts, ends) of intervals to skip, in file seconds.
+        self._skips: dict[int, tuple[list[float], list[float]]] = {}
+        self._sink_open = False
+        self._closed = False
+        self._output_thread = threading.Thread(
+            target=self._output_loop, name="audio-output", daemon=True
+        )
+        self._output_thread.start()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @property
+    def path(self) -> Path | None:
+        with self._condition:
+            return self._paths[self._played_index] if self._paths else None
+
+    @property
+    def timeline(self) -> BookTimeline | None:
+        return self._timeline
+
+    @property
+    def current_file(self) -> AudioFile | None:
+        with self._condition:
+            return self._timeline.files[self._played_index] if self._timeline else None
+
+    @property
+    def speed(self) -> float:
+        return self._speed
+
+    @property
+    def decoder_speed(self) -> float:
+        """Speed ffmpeg decodes at; 1.0 when the in-process stretcher applies speed."""
+        return 1.0 if self._stretcher else self._speed
+
+    @property
+    def position_seconds(self) -> float:
+        """Position on the loaded timeline: book-wide for books, in-file otherwise."""
+        with self._condition:
+            return self._current_position()
+
+    @property
+    def file_position_seconds(self) -> float:
+        with self._condition:
+            return self._current_file_position()[1]
+
+    @property
+    def max_handover_latency_seconds(self) -> float:
+        return max((handover.latency_seconds for handover in self.handovers), default=0.0)
+
+    def load(self, path: str | Path, start_seconds: float = 0.0) -> None:
+        """Open a single file paused at ``start_seconds``; decoding starts immediately."""
+        with self._condition:
+            self._paths = (Path(path),)
+            self._hashes = (None,)
+            self._timeline = None
+            self._restart(start_seconds)
+            self._state = PAUSED
+
+    def load_book(self, timeline: BookTimeline, global_position: float = 0.0) -> None:
+        """Open every file of ``timeline`` as one gapless stream, paused at ``global_position``."""
+        if not len(timeline):
+            raise ValueError("No audio files available for playback.")
+        with self._condition:
+            self._paths = tuple(Path(audio_file.path) for audio_file in timeline.files)
+            self._hashes = tuple(audio_file.file_hash for audio_file in timeline.files)
+            self._timeline = timeline
+            self._restart(global_position)
+            self._state = PAUSED
+
+    def play(self) -> None:
+        with self._condition:
+            if not self._paths:
+                raise ValueError("No audio file loaded")
+            if self._state in (STOPPED, ENDED):
+                self._restart(0.0 if self._state == ENDED else self._current_position())
+            if not self._sink_open:
+                self.sink.open(self.sample_rate, self.channels)
+                self._sink_open = True
+            self._state = PLAYING
+            self._condition.notify_all()
+
+    def pause(self) -> None:
+        with self._condition:
+            if self._state == PLAYING:
+                self._state = PAUSED
+
+    def seek(self, position_seconds: float) -> None:
+        """Jump to a timeline position (book-wide when a book is loaded)."""
+        with self._condition:
+            if not self._paths:
+                raise ValueError("No audio file loaded")
+            self._restart(max(position_seconds, 0.0))
+            if self._state == ENDED:
+                self._state = PAUSED
+
+    def set_speed(self, speed: float) -> None:
+        if speed <= 0:
+            raise ValueError("Speed must be positive")
+        with self._condition:
+            if speed == self._speed:
+                return
+            if self._stretcher:
+                self._stretcher.speed = speed
+                self._speed = speed
+                return
+            position = self._current_position()
+            self._speed = speed
+            if self._paths and self._state != STOPPED:
+                self._restart(position)
+            else:
+                self._base_seconds = position
+                self._markers = []
+                self._marker_frames = []
+                self._frames_played = 0.0
+
+    def set_skip_silence(
+        self, intervals: dict[int, Sequence[tuple[float, float]]] | None
+    ) -> None:
+        """Skip the given intervals per audio file id from now on; None turns skipping off.
+
+        Audio that is already buffered still plays, so a change is heard within
+        ``buffer_seconds``.
+        """
+        skips = {}
+        for audio_file_id, spans in (intervals or {}).items():
+            ordered = sorted(spans)
+            skips[audio_file_id] = ([start for start, _ in ordered], [end for _, end in ordered])
+        self._skips = skips
+
+    def stop(self) -> None:
+        with self._condition:
+            self._base_seconds = self._current_position()
+            self._ring.reset()
+            self._markers = []
+            self._marker_frames = []
+            self._frames_played = 0.0
+            self._state = STOPPED
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._ring.close()
+        self._output_thread.join(timeout=2.0)
+        if self._sink_open:
+            self.sink.close()
+            self._sink_open = False
+
+    def _current_file_position(self) -> tuple[int, float]:
+        # Caller holds self._condition.
+        if not self._markers:
+            if self._timeline is not None and len(self._timeline):
+                resolved = self._timeline.resolve(self._base_seconds)
+                return self._timeline.index_of(resolved.audio_file.id), resolved.position_seconds
+            return 0, self._base_seconds
+        marker = self._markers[bisect_right(self._marker_frames, self._frames_played) - 1]
+        first_frame, index, local_start = marker
+        elapsed = (self._frames_played - first_frame) * self.decoder_speed / self.sample_rate
+        return index, local_start + elapsed
+
+    def _current_position(self) -> float:
+        # Caller holds self._condition.
+        if self._timeline is None:
+            return self._current_file_position()[1]
+        if not self._markers:
+            return self._base_seconds
+        index, local = self._current_file_position()
+        return self._timeline.global_position(self._timeline.files[index].id, local)
+
+    def _restart(self, position_seconds: float) -> None:
+        # Caller holds self._condition.
+        generation = self._ring.reset()
+        if self._timeline is not None:
+            resolved = self._timeline.resolve(position_seconds)
+            index = self._timeline.index_of(resolved.audio_file.id)
+            local = resolved.position_seconds
+        else:
+            index, local = 0, position_seconds
+        self._base_seconds = position_seconds
+        self._frames_played = 0.0
+        self._markers = [(0, index, local)]
+        self._marker_frames = [0]
+        self._played_index = index
+        threading.Thread(
+            target=self._pump,
+            args=(generation, index, local),
+            name="audio-pump",
+            daemon=True,
+        ).start()
+
+    def _open_stream(self, index: int, start_seconds: float) -> DecoderStream | CachedPcmStream:
+        file_hash = self._hashes[index]
+        if self.audio_cache and file_hash and self.decoder_speed == 1.0:
+            cached = self.audio_cache.get(file_hash, PcmFormat(self.sample_rate, self.channels))
+            if cached is not None:
+                return CachedPcmStream(cached, start_seconds, self.block_bytes)
+        command = build_ffmpeg_decode_command(
+            self._paths[index], start_seconds, self.decoder_speed, self.sample_rate, self.channels
+        )
+        bytes_per_second = self.sample_rate * self.frame_bytes
+        max_chunks = int(self.prefetch_seconds * bytes_per_second / self.block_bytes) + 1
+        return DecoderStream(command.args, self.block_bytes, max_chunks)
+
+    def _pump(self, generation: int, index: int, start_seconds: float) -> None:
+        def cancelled() -> bool:
+            return self._closed or generation != self._ring.generation
+
+        frames_per_second = self.sample_rate / self.decoder_speed
+        stream = self._open_stream(index, start_seconds)
+        upcoming: DecoderStream | CachedPcmStream | None = None
+        # Frames written to the ring buffer in this generation.
+        written_frames = 0
+        handover_started: float | None = None
+        handover: tuple[int, bool] | None = None
+        try:
+            while True:
+                # Whole frames of this file decoded so far.
+                file_frames = 0
+                # Decoded frame of this file that the next written frame continues from.
+                next_frame = 0
+                # Pipe reads need not end on a frame boundary; the tail of a frame
+                # waits here for the rest of it.
+                partial = b""
+                for chunk in stream.chunks(cancelled):
+                    if handover is not None and handover_started is not None:
+                        self.handovers.append(
+                            Handover(
+                                from_index=handover[0],
+                                to_index=index,
+                                latency_seconds=time.perf_counter() - handover_started,
+                                prefetched=handover[1],
+                            )
+                        )
+                        handover = handover_started = None
+                    if partial:
+                        chunk = partial + chunk
+                    whole = len(chunk) - len(chunk) % self.frame_bytes
+                    chunk, partial = chunk[:whole], chunk[whole:]
+                    chunk_frame = file_frames
+                    file_frames += whole // self.frame_bytes
+                    for first, last in self._kept_ranges(
+                        index, start_seconds, chunk_frame, whole // self.frame_bytes
+                    ):
+                        if chunk_frame + first != next_frame:
+                            # Frames were skipped: resume the position after the cut.
+                            local = (
+                                start_seconds
+                                + (chunk_frame + first) * self.decoder_speed / self.sample_rate
+                            )
+                            self._add_marker(generation, written_frames, index, local)
+                        piece = chunk[first * self.frame_bytes : last * self.frame_bytes]
+                        if not self._ring.write(piece, generation):
+                            return
+                        written_frames += last - first
+                        next_frame = chunk_frame + last
+                    if upcoming is None and self._should_prefetch(
+                        index, start_seconds + file_frames / frames_per_second
+                    ):
+                        upcoming = self._open_stream(index + 1, 0.0)
+                if cancelled():
+                    return
+                if index + 1 >= len(self._paths):
+                    self._ring.finish(generation)
+                    return
+                handover_started = time.perf_counter()
+                handover = (index, upcoming is not None)
+                stream.close()
+                stream = upcoming or self._open_stream(index + 1, 0.0)
+                upcoming = None
+                index += 1
+                start_seconds = 0.0
+                self._add_marker(generation, written_frames, index)
+        finally:
+            stream.close()
+            if upcoming:
+                upcoming.close()
+
+    def _kept_ranges(
+        self, index: int, start_seconds: float, chunk_frame: int, frames: int
+    ) -> list[tuple[int, int]]:
+        """Frame ranges of a decoded chunk that are not inside a skipped interval."""
+        skips = self._skips.get(self._timeline.files[index].id) if self._timeline else None
+        if not skips:
+            return [(0, frames)]
+        starts, ends = skips
+        frames_per_second = self.sample_rate / self.decoder_speed
+        chunk_start = start_seconds + chunk_frame / frames_per_second
+        chunk_end = chunk_start + frames / frames_per_second
+        kept: list[tuple[int, int]] = []
+        cursor = 0
+        position = max(bisect_right(starts, chunk_start) - 1, 0)
+        while position < len(starts) and starts[position] < chunk_end:
+            skip_first = round((starts[position] - chunk_start) * frames_per_second)
+            skip_last = round((ends[position] - chunk_start) * frames_per_second)
+            skip_first, skip_last = max(skip_first, cursor), min(skip_last, frames)
+            if skip_last > skip_first:
+                if skip_first > cursor:
+                    kept.append((cursor, skip_first))
+                cursor = skip_last
+            position += 1
+        if cursor < frames:
+            kept.append((cursor, frames))
+        return kept
+
+    def _should_prefetch(self, index: int, decoded_seconds: float) -> bool:
+        if self._timeline is None or index + 1 >= len(self._paths):
+            return False
+        duration = self._timeline.files[index].duration_seconds
+        return duration - decoded_seconds <= self.prefetch_seconds
+
+    def _add_marker(
+        self, generation: int, first_frame: int, index: int, local_start: float = 0.0
+    ) -> None:
+        with self._condition:
+            if generation == self._ring.generation:
+                self._markers.append((first_frame, index, local_start))
+                self._marker_frames.append(first_frame)
+
+    def _output_loop(self) -> None:
+        block: bytes | None = None
+        block_generation = -1
+        stretch_generation = -1
+        while True:
+            with self._condition:
+                while self._state != PLAYING and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+            if block is not None and block_generation != self._ring.generation:
+                block = None
+            if block is None:
+                data, generation = self._ring.read(self.block_bytes, timeout=0.1)
+                if data is None:
+                    if self._stretcher and stretch_generation == generation:
+                        self._play_block(None, generation)
+                        stretch_generation = -1
+                    self._finish_playback(generation)
+                    continue
+                if not data:
+                    self.underruns += 1
+                    continue
+                block, block_generation = data, generation
+            with self._condition:
+                if self._state != PLAYING or block_generation != self._ring.generation:
+                    continue
+            if self._stretcher:
+                if stretch_generation != block_generation:
+                    # A seek or restart: drop audio buffered from the old position.
+                    self._stretcher.reset()
+                    stretch_generation = block_generation
+            self._play_block(block, block_generation)
+            block = None
+
+    def _play_block(self, block: bytes | None, generation: int) -> None:
+        """Write one decoded block (``None`` flushes the stretcher) and advance the position."""
+        if self._stretcher:
+            consumed_before = self._stretcher.source_frames_emitted
+            if block is None:
+                output = self._stretcher.flush()
+            else:
+                output = self._stretcher.process(block)
+            consumed = self._stretcher.source_frames_emitted - consumed_before
+        else:
+            output = block or b""
+            consumed = len(output) / self.frame_bytes
+        if output:
+            self.sink.write(output)
+        changed_file: AudioFile | None = None
+        with self._condition:
+            if generation != self._ring.generation:
+                return
+            self._frames_played += consumed
+            index = self._current_file_position()[0]
+            if index != self._played_index:
+                self._played_index = index
+                if self._timeline is not None:
+                    changed_file = self._timeline.files[index]
+        if changed_file is not None and self.on_file_change:
+            self.on_file_change(changed_file)
+
+    def _finish_playback(self, generation: int) -> None:
+        with self._condition:
+            if generation != self._ring.generation or self._state != PLAYING:
+                return
+            self._state = ENDED
+        if self.on_end:
+            self.on_end()
@@ -0,0 +1,148 @@
+"""Streaming WSOLA time-stretching of interleaved 16-bit PCM with NumPy."""
+from __future__ import annotations
+
+import numpy as np
+
+MIN_SPEED = 0.25
+MAX_SPEED = 4.0
+
+
+class WsolaStretcher:
+    """Changes playback speed without changing pitch, one PCM block at a time.
+
+    Waveform-similarity overlap-add: output frames of ``frame_seconds`` are laid down
+    every half frame, and each is taken from near its nominal input position
+    (``speed`` half frames further on) at the offset, within ``tolerance_seconds``,
+    whose waveform best continues the previous frame. Correlation, windowing and
+    overlap-add are NumPy vector operations; only the walk over frames is a Python
+    loop, since each frame's choice depends on the one before it.
+
+    ``speed`` may be changed between calls to ``process`` and takes effect on the
+    next frame. ``source_frames_emitted`` counts how many input frames the output
+    produced so far stands for, which lets a player report its position exactly.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        channels: int,
+        speed: float = 1.0,
+        frame_seconds: float = 0.03,
+        tolerance_seconds: float = 0.008,
+    ) -> None:
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_length = max(4, int(sample_rate * frame_seconds)) // 2 * 2
+        self.hop = self.frame_length // 2
+        self.tolerance = max(1, int(sample_rate * tolerance_seconds))
+        # A periodic Hann window sums to exactly one at 50% overlap.
+        self._window = (
+            0.5 - 0.5 * np.cos(2 * np.pi * np.arange(self.frame_length) / self.frame_length)
+        ).astype(np.float32)[:, None]
+        self._first_window = self._window.copy()
+        self._first_window[: self.hop] = 1.0
+        self.speed = speed
+        self.reset()
+
+    @property
+    def speed(self) -> float:
+        return self._speed
+
+    @speed.setter
+    def speed(self, value: float) -> None:
+        if not MIN_SPEED <= value <= MAX_SPEED:
+            raise ValueError(f"Speed must be between {MIN_SPEED} and {MAX_SPEED}")
+        self._speed = value
+
+    def reset(self) -> None:
+        """Forget all buffered audio, for example after a seek."""
+        self._input = np.zeros((0, self.channels), dtype=np.float32)
+        self._input_start = 0
+        self._fed = 0
+        self._analysis_position = 0.0
+        self._previous: int | None = None
+        self._overlap = np.zeros((self.frame_length, self.channels), dtype=np.float32)
+        self.source_frames_emitted = 0.0
+
+    def process(self, pcm: bytes) -> bytes:
+        """Feed interleaved int16 PCM and return whatever stretched output is ready."""
+        if self._speed == 1.0 and self._previous is None and not len(self._input):
+            # Nothing buffered and no stretching needed: pass the block through.
+            frames = len(pcm) // (2 * self.channels)
+            self._fed += frames
+            self._input_start = self._fed
+            self._analysis_position = float(self._fed)
+            self.source_frames_emitted += frames
+            return pcm
+        block = np.frombuffer(pcm, dtype=np.int16).reshape(-1, self.channels)
+        self._input = np.concatenate((self._input, block.astype(np.float32)))
+        self._fed += len(block)
+        return self._render()
+
+    def flush(self) -> bytes:
+        """Return the remaining output at the end of a stream and reset."""
+        output = self._render()
+        if self._previous is None:
+            tail = self._input[max(int(self._analysis_position) - self._input_start, 0) :]
+        else:
+            # Complete the last frame's fade-out with the rising half of the window,
+            # then play out whatever input is left.
+            continuation = self._input[self._previous + self.hop - self._input_start :]
+            count = min(len(continuation), self.hop)
+            head = self._overlap[:count] + continuation[:count] * self._window[:count]
+            tail = np.concatenate((head, continuation[count:]))
+        output += _to_pcm(tail)
+        fed = self._fed
+        self.reset()
+        self._fed = self._input_start = fed
+        self._analysis_position = float(fed)
+        self.source_frames_emitted = float(fed)
+        return output
+
+    def _render(self) -> bytes:
+        length = self.frame_length
+        hop = self.hop
+        tolerance = self.tolerance
+        pieces: list[np.ndarray] = []
+        while True:
+            nominal = int(round(self._analysis_position))
+            if self._previous is None:
+                needed = nominal + length
+            else:
+                needed = max(nominal + tolerance, self._previous + hop) + length
+            if needed > self._fed:
+                break
+            offset = self._input_start
+            if self._previous is None:
+                selected = nominal
+                window = self._first_window
+            else:
+                low = max(nominal - tolerance, offset)
+                high = nominal + tolerance
+                reference_start = self._previous + hop - offset
+                reference = self._input[reference_start : reference_start + length].mean(axis=1)
+                region = self._input[low - offset : high + length - offset].mean(axis=1)
+                scores = np.correlate(region, reference, mode="valid")
+                selected = low + int(np.argmax(scores))
+                window = self._window
+            start = selected - offset
+            self._overlap += self._input[start : start + length] * window
+            pieces.append(self._overlap[:hop].copy())
+            self._overlap[:hop] = self._overlap[hop:]
+            self._overlap[hop:] = 0.0
+            advance = self._speed * hop
+            self._analysis_position += advance
+            self.source_frames_emitted += advance
+            self._previous = selected
+            # Drop input that no later frame can reach.
+            keep_from = min(int(self._analysis_position) - tolerance, selected + hop)
+            if keep_from > self._input_start:
+                self._input = self._input[keep_from - self._input_start :]
+                self._input_start = keep_from
+        if not pieces:
+            return b""
+        return _to_pcm(np.concatenate(pieces))
+
+
+def _to_pcm(samples: np.ndarray) -> bytes:
+    return np.clip(np.rint(samples), -32768, 32767).astype("<i2").tobytes()
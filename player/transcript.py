@@ -2,26 +2,92 @@
 from __future__ import annotations
 
 import sqlite3
-from typing import Sequence
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from itertools import accumulate
+from typing import Iterable, Iterator, Sequence
 
-from player.models import TranscriptSegment
+from player import db
+from player.library import list_audio_files
+from player.models import TranscriptSearchHit, TranscriptSegment, TranscriptWord
+from player.playback import BookTimeline
+from player.word_timings import WordTimings
+
+
+INSERT_SEGMENT = """
+INSERT INTO transcript_segments (
+    audio_file_id, start_seconds, end_seconds, text, word_timings
+)
+VALUES (?, ?, ?, ?, ?)
+""".strip()
+
+
+def segment_row(segment: TranscriptSegment) -> tuple:
+    """Parameters for ``INSERT_SEGMENT``."""
+    return (
+        segment.audio_file_id,
+        segment.start_seconds,
+        segment.end_seconds,
+        segment.text,
+        segment.word_timings,
+    )
 
 
 def add_segment(connection: sqlite3.Connection, segment: TranscriptSegment) -> None:
+    connection.execute(
+        INSERT_SEGMENT,
+        segment_row(segment),
+    )
+    connection.commit()
+
+
+def add_segments(
+    connection: sqlite3.Connection,
+    segments: Iterable[TranscriptSegment],
+    chunk_size: int = db.DEFAULT_CHUNK_SIZE,
+    commit_per_chunk: bool = False,
+) -> list[int]:
+    return db.bulk_insert(
+        connection,
+        INSERT_SEGMENT,
+        (segment_row(segment) for segment in segments),
+        chunk_size,
+        commit_per_chunk,
+    )
+
+
+@contextmanager
+def deferred_search_index(connection: sqlite3.Connection) -> Iterator[None]:
+    """Index segments inserted inside the block in one pass when it ends.
+
+    The per-row FTS trigger is several times slower than indexing the same rows
+    with a single ``INSERT ... SELECT``. The trigger is dropped for the block and
+    recreated afterwards, all inside the caller's transaction: if the block
+    raises, the caller must roll back, which also restores the trigger, and other
+    connections never see it missing. Segment ids only grow (AUTOINCREMENT), so
+    the new rows are exactly those above the largest id seen on entry.
+    """
+    if not connection.in_transaction:
+        connection.execute("BEGIN")
+    last_id = connection.execute(
+        "SELECT COALESCE(MAX(id), 0) FROM transcript_segments"
+    ).fetchone()[0]
+    connection.execute("DROP TRIGGER IF EXISTS transcript_segments_fts_insert")
+    yield
     connection.execute(
         """
-        INSERT INTO transcript_segments (audio_file_id, start_seconds, end_seconds, text)
-        VALUES (?, ?, ?, ?)
+        INSERT INTO transcript_segments_fts (rowid, text)
+        SELECT id, text FROM transcript_segments WHERE id > ?
         """,
-        (segment.audio_file_id, segment.start_seconds, segment.end_seconds, segment.text),
+        (last_id,),
     )
-    connection.commit()
+    connection.execute(db.TRANSCRIPT_FTS_INSERT_TRIGGER)
 
 
 def list_segments(connection: sqlite3.Connection, audio_file_id: int) -> Sequence[TranscriptSegment]:
     rows = connection.execute(
         """
-        SELECT audio_file_id, start_seconds, end_seconds, text
+        SELECT audio_file_id, start_seconds, end_seconds, text, word_timings
         FROM transcript_segments
         WHERE audio_file_id = ?
         ORDER BY start_seconds
@@ -34,6 +100,7 @@ def list_segments(connection: sqlite3.Connection, audio_file_id: int) -> Sequenc
             start_seconds=row["start_seconds"],
             end_seconds=row["end_seconds"],
             text=row["text"],
+            word_timings=row["word_timings"],
         )
         for row in rows
     ]
@@ -44,7 +111,7 @@ def find_segment_at_time(
 ) -> TranscriptSegment | None:
     row = connection.execute(
         """
-        SELECT audio_file_id, start_seconds, end_seconds, text
+        SELECT audio_file_id, start_seconds, end_seconds, text, word_timings
         FROM transcript_segments
         WHERE audio_file_id = ?
           AND start_seconds <= ?
@@ -61,4 +128,192 @@ def find_segment_at_time(
         start_seconds=row["start_seconds"],
         end_seconds=row["end_seconds"],
         text=row["text"],
+        word_timings=row["word_timings"],
     )
+
+
+def fts_query(text: str) -> str:
+    """Quote each word of free-form user input so FTS5 treats it literally."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in text.split())
+
+
+def search_transcripts(
+    connection: sqlite3.Connection,
+    query: str,
+    audiobook_id: int | None = None,
+    limit: int = 20,
+) -> list[TranscriptSearchHit]:
+    """Full-text search over transcript segments, best matches first.
+
+    Each hit carries a highlighted snippet and its position on the book's timeline,
+    so a caller can seek straight to it.
+    """
+    match = fts_query(query)
+    if not match:
+        return []
+    book_filter = "AND f.audiobook_id = ?" if audiobook_id is not None else ""
+    params: tuple = (match, audiobook_id, limit) if audiobook_id is not None else (match, limit)
+    rows = connection.execute(
+        f"""
+        SELECT
+            f.audiobook_id,
+            s.audio_file_id,
+            s.start_seconds,
+            s.end_seconds,
+            s.text,
+            snippet(transcript_segments_fts, 0, '[', ']', '...', 12) AS snippet,
+            bm25(transcript_segments_fts) AS rank
+        FROM transcript_segments_fts
+        JOIN transcript_segments AS s ON s.id = transcript_segments_fts.rowid
+        JOIN audio_files AS f ON f.id = s.audio_file_id
+        WHERE transcript_segments_fts MATCH ?
+          {book_filter}
+        ORDER BY rank
+        LIMIT ?
+        """,
+        params,
+    ).fetchall()
+    timelines: dict[int, BookTimeline] = {}
+    hits: list[TranscriptSearchHit] = []
+    for row in rows:
+        timeline = timelines.get(row["audiobook_id"])
+        if timeline is None:
+            timeline = BookTimeline(list_audio_files(connection, row["audiobook_id"]))
+            timelines[row["audiobook_id"]] = timeline
+        hits.append(
+            TranscriptSearchHit(
+                audiobook_id=row["audiobook_id"],
+                audio_file_id=row["audio_file_id"],
+                start_seconds=row["start_seconds"],
+                end_seconds=row["end_seconds"],
+                text=row["text"],
+                snippet=row["snippet"],
+                rank=row["rank"],
+                global_position_seconds=timeline.global_position(
+                    row["audio_file_id"], row["start_seconds"]
+                ),
+            )
+        )
+    return hits
+
+
+class TranscriptIndex:
+    """In-memory interval index over the transcript segments of one audio file.
+
+    Segments are sorted by start time. Alongside the start array we keep a running
+    maximum of end times, which is non-decreasing even when segments overlap, so the
+    earliest segment covering a position can be found with two bisects.
+
+    Word timings stay packed until a segment's words are first looked up.
+    """
+
+    def __init__(self, segments: Iterable[TranscriptSegment]) -> None:
+        self.segments: tuple[TranscriptSegment, ...] = tuple(
+            sorted(segments, key=lambda segment: segment.start_seconds)
+        )
+        self._starts: list[float] = [segment.start_seconds for segment in self.segments]
+        self._max_ends: list[float] = list(
+            accumulate((segment.end_seconds for segment in self.segments), max)
+        )
+        self._words: dict[int, WordTimings] = {}
+
+    @classmethod
+    def load(cls, connection: sqlite3.Connection, audio_file_id: int) -> TranscriptIndex:
+        return cls(list_segments(connection, audio_file_id))
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    def _bounds(self, position_seconds: float) -> tuple[int, int]:
+        # Candidates are segments [first, stop): started at or before the position,
+        # and at or after the first one whose running max end reaches it.
+        first = bisect_left(self._max_ends, position_seconds)
+        stop = bisect_right(self._starts, position_seconds)
+        return first, stop
+
+    def index_at(self, position_seconds: float) -> int | None:
+        first, stop = self._bounds(position_seconds)
+        return first if first < stop else None
+
+    def segment_at(self, position_seconds: float) -> TranscriptSegment | None:
+        index = self.index_at(position_seconds)
+        return None if index is None else self.segments[index]
+
+    def segments_at(self, position_seconds: float) -> list[TranscriptSegment]:
+        """Return every segment covering the position, ordered by start time."""
+        first, stop = self._bounds(position_seconds)
+        return [
+            segment
+            for segment in self.segments[first:stop]
+            if segment.end_seconds >= position_seconds
+        ]
+
+    def words(self, index: int) -> WordTimings | None:
+        """Word timings of the segment at ``index``, or None if it has none."""
+        timings = self._words.get(index)
+        if timings is None:
+            segment = self.segments[index]
+            if segment.word_timings is None:
+                return None
+            timings = WordTimings(segment.word_timings, segment.start_seconds, segment.text)
+            self._words[index] = timings
+        return timings
+
+    def word_at(self, position_seconds: float) -> tuple[TranscriptSegment, TranscriptWord] | None:
+        """Return the segment and word being spoken at ``position_seconds``."""
+        index = self.index_at(position_seconds)
+        if index is None:
+            return None
+        timings = self.words(index)
+        word = timings.word_at(position_seconds) if timings else None
+        return None if word is None else (self.segments[index], word)
+
+    def cursor(self, seek_threshold_seconds: float = 5.0) -> TranscriptCursor:
+        return TranscriptCursor(self, seek_threshold_seconds)
+
+
+class TranscriptCursor:
+    """Stateful lookup for a moving playhead.
+
+    Small forward steps walk the index in amortized O(1); moving backwards or
+    jumping further than ``seek_threshold_seconds`` falls back to bisect.
+    """
+
+    def __init__(self, index: TranscriptIndex, seek_threshold_seconds: float = 5.0) -> None:
+        self.index = index
+        self.seek_threshold_seconds = seek_threshold_seconds
+        self._position: float | None = None
+        self._first = 0
+        self._stop = 0
+
+    def seek(self, position_seconds: float) -> TranscriptSegment | None:
+        self._first, self._stop = self.index._bounds(position_seconds)
+        self._position = position_seconds
+        return self._current()
+
+    def update(self, position_seconds: float) -> TranscriptSegment | None:
+        previous = self._position
+        if (
+            previous is None
+            or position_seconds < previous
+            or position_seconds - previous > self.seek_threshold_seconds
+        ):
+            return self.seek(position_seconds)
+
+        starts = self.index._starts
+        max_ends = self.index._max_ends
+        count = len(starts)
+        first = self._first
+        stop = self._stop
+        while first < count and max_ends[first] < position_seconds:
+            first += 1
+        while stop < count and starts[stop] <= position_seconds:
+            stop += 1
+        self._first, self._stop = first, stop
+        self._position = position_seconds
+        return self._current()
+
+    def _current(self) -> TranscriptSegment | None:
+        if self._first < self._stop:
+            return self.index.segments[self._first]
+        return None
@@ -0,0 +1,188 @@
+"""Streaming readers for SRT, WebVTT and JSON transcript files."""
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable, Iterator, TextIO
+
+from player.models import TranscriptSegment
+from player.word_timings import pack_words
+
+TRANSCRIPT_FORMATS = ("srt", "vtt", "json")
+
+_TAG_PATTERN = re.compile(r"<[^>]+>")
+_READ_SIZE = 64 * 1024
+_JSON_SEPARATORS = " \t\r\n,[]"
+# What a number or a true/false/null literal cut off by the end of the buffer leaves.
+_PARTIAL_TOKEN = re.compile(r"[-+.\w]*\Z")
+
+
+def parse_timestamp(value: str) -> float:
+    """Parse ``HH:MM:SS,mmm`` (SRT) or ``[HH:]MM:SS.mmm`` (WebVTT) into seconds."""
+    parts = value.strip().replace(",", ".").split(":")
+    if not 1 <= len(parts) <= 3:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def iter_cue_segments(stream: TextIO, audio_file_id: int) -> Iterator[TranscriptSegment]:
+    """Yield one segment per SRT/WebVTT cue, reading the stream line by line.
+
+    Blocks without a ``-->`` timing line (the WEBVTT header, NOTE and STYLE blocks)
+    are skipped, as are SRT counters and WebVTT cue identifiers.
+    """
+    timing: tuple[float, float] | None = None
+    text_lines: list[str] = []
+    for raw_line in stream:
+        line = raw_line.strip()
+        if not line:
+            if timing is not None:
+                yield _cue_segment(audio_file_id, timing, text_lines)
+            timing = None
+            text_lines = []
+            continue
+        if timing is None:
+            if "-->" in line:
+                start, _, rest = line.partition("-->")
+                end = rest.split()[0] if rest.split() else ""
+                timing = (parse_timestamp(start), parse_timestamp(end))
+            continue
+        text_lines.append(_TAG_PATTERN.sub("", line))
+    if timing is not None:
+        yield _cue_segment(audio_file_id, timing, text_lines)
+
+
+def _cue_segment(
+    audio_file_id: int, timing: tuple[float, float], text_lines: list[str]
+) -> TranscriptSegment:
+    return TranscriptSegment(
+        audio_file_id=audio_file_id,
+        start_seconds=timing[0],
+        end_seconds=timing[1],
+        text=" ".join(text_lines),
+    )
+
+
+def iter_json_segments(
+    stream: TextIO,
+    audio_file_id: int,
+    on_unaligned: Callable[[TranscriptSegment, str], None] | None = None,
+) -> Iterator[TranscriptSegment]:
+    """Yield segments from a JSON array of segment objects or from JSON lines.
+
+    Objects are decoded one at a time from a sliding buffer, so only the current
+    object is held in memory. Each object needs ``start``/``end``/``text`` keys
+    (``start_seconds``/``end_seconds`` are accepted too). A top-level object with a
+    ``segments`` list, as written by Whisper, is also accepted; it is decoded whole.
+    A ``words`` list of ``{"word", "start", "end"}`` objects is stored as word timings.
+    When its words cannot be found in the segment text, as happens when a model
+    tokenizes differently, the segment is kept without word timings and passed to
+    ``on_unaligned`` with the reason.
+    """
+    for item in _iter_json_values(stream):
+        if isinstance(item, dict) and isinstance(item.get("segments"), list):
+            for segment in item["segments"]:
+                yield _json_segment(audio_file_id, segment, on_unaligned)
+        else:
+            yield _json_segment(audio_file_id, item, on_unaligned)
+
+
+def _json_segment(
+    audio_file_id: int,
+    item: object,
+    on_unaligned: Callable[[TranscriptSegment, str], None] | None = None,
+) -> TranscriptSegment:
+    if not isinstance(item, dict):
+        raise ValueError(f"Expected a transcript segment object, got {type(item).__name__}")
+    start = item.get("start", item.get("start_seconds"))
+    end = item.get("end", item.get("end_seconds"))
+    if start is None or end is None:
+        raise ValueError("Transcript segment is missing start or end time")
+    text = str(item.get("text", "")).strip()
+    words = item.get("words")
+    segment = TranscriptSegment(
+        audio_file_id=audio_file_id,
+        start_seconds=float(start),
+        end_seconds=float(end),
+        text=text,
+    )
+    if not isinstance(words, list) or not words:
+        return segment
+    try:
+        word_timings = pack_words(
+            text,
+            float(start),
+            (
+                (str(word.get("word", word.get("text", ""))), word["start"], word["end"])
+                for word in words
+            ),
+        )
+    except ValueError as exc:
+        if on_unaligned:
+            on_unaligned(segment, str(exc))
+        return segment
+    return replace(segment, word_timings=word_timings)
+
+
+def _iter_json_values(stream: TextIO) -> Iterator[object]:
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+    while True:
+        # Skip whitespace plus the brackets and commas of a top-level array.
+        while position < len(buffer) and buffer[position] in _JSON_SEPARATORS:
+            position += 1
+        if position >= len(buffer):
+            if eof:
+                return
+            buffer = stream.read(_READ_SIZE)
+            position = 0
+            eof = not buffer
+            continue
+        try:
+            value, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as exc:
+            # Only a value cut off by the end of the buffer waits for more input; a
+            # syntax error is raised now rather than after buffering the rest of the file.
+            if eof or not _needs_more_input(exc):
+                raise
+            chunk = stream.read(_READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield value
+
+
+def _needs_more_input(exc: json.JSONDecodeError) -> bool:
+    if exc.msg.startswith("Unterminated string"):
+        return True
+    return _PARTIAL_TOKEN.match(exc.doc, exc.pos) is not None
+
+
+def detect_format(path: str | Path) -> str:
+    suffix = Path(path).suffix.lower().lstrip(".")
+    if suffix in ("json", "jsonl"):
+        return "json"
+    if suffix in TRANSCRIPT_FORMATS:
+        return suffix
+    raise ValueError(f"Cannot infer transcript format from {path}; pass it explicitly")
+
+
+def iter_transcript_file(
+    stream: TextIO,
+    audio_file_id: int,
+    transcript_format: str,
+    on_unaligned: Callable[[TranscriptSegment, str], None] | None = None,
+) -> Iterator[TranscriptSegment]:
+    if transcript_format in ("srt", "vtt"):
+        return iter_cue_segments(stream, audio_file_id)
+    if transcript_format == "json":
+        return iter_json_segments(stream, audio_file_id, on_unaligned)
+    raise ValueError(f"Unsupported transcript format: {transcript_format}")
@@ -0,0 +1,288 @@
+"""Lazy, windowed access to large transcripts through a bounded LRU cache."""
+from __future__ import annotations
+
+import math
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+from player import db
+from player.models import TranscriptSegment, TranscriptWord
+from player.transcript import TranscriptCursor, TranscriptIndex
+
+DEFAULT_WINDOW_SECONDS = 120.0
+DEFAULT_MAX_WINDOWS = 16
+DEFAULT_PAGE_SIZE = 500
+
+
+def iter_segment_pages(
+    connection: sqlite3.Connection,
+    audio_file_id: int,
+    start_seconds: float,
+    end_seconds: float,
+    page_size: int = DEFAULT_PAGE_SIZE,
+) -> Iterator[list[TranscriptSegment]]:
+    """Yield segments starting in ``[start_seconds, end_seconds)`` a page at a time.
+
+    Pages continue from the last ``(start_seconds, id)`` seen rather than using an
+    OFFSET, so every page is a fresh range scan of the start-time index.
+    """
+    if page_size <= 0:
+        raise ValueError("Page size must be positive")
+    # Row ids start at 1, so the first page still includes a segment that starts
+    # exactly at ``start_seconds``.
+    after: tuple[float, int] = (start_seconds, 0)
+    while True:
+        rows = connection.execute(
+            """
+            SELECT id, audio_file_id, start_seconds, end_seconds, text, word_timings
+            FROM transcript_segments
+            WHERE audio_file_id = ?
+              AND (start_seconds, id) > (?, ?)
+              AND start_seconds < ?
+            ORDER BY start_seconds, id
+            LIMIT ?
+            """,
+            (audio_file_id, after[0], after[1], end_seconds, page_size),
+        ).fetchall()
+        if not rows:
+            return
+        yield [
+            TranscriptSegment(
+                audio_file_id=row["audio_file_id"],
+                start_seconds=row["start_seconds"],
+                end_seconds=row["end_seconds"],
+                text=row["text"],
+                word_timings=row["word_timings"],
+            )
+            for row in rows
+        ]
+        if len(rows) < page_size:
+            return
+        after = (rows[-1]["start_seconds"], rows[-1]["id"])
+
+
+def load_window(
+    connection: sqlite3.Connection,
+    audio_file_id: int,
+    start_seconds: float,
+    end_seconds: float,
+    page_size: int = DEFAULT_PAGE_SIZE,
+) -> TranscriptIndex:
+    return TranscriptIndex(
+        segment
+        for page in iter_segment_pages(
+            connection, audio_file_id, start_seconds, end_seconds, page_size
+        )
+        for segment in page
+    )
+
+
+@dataclass
+class WindowCacheStats:
+    hits: int = 0
+    misses: int = 0
+    prefetched: int = 0
+    evicted: int = 0
+
+
+class TranscriptWindowCache:
+    """Transcript lookups that only keep a few fixed-length windows in memory.
+
+    Window ``k`` of a file holds the segments starting in ``[k, k + 1)`` times
+    ``window_seconds``, indexed as a ``TranscriptIndex``. At most ``max_windows``
+    windows are cached, least recently used first out, so memory stays flat however
+    long the book is. Lookups also consult earlier windows when a file has segments
+    long enough to reach across a window boundary.
+
+    ``update`` is meant to be called with the playhead: it follows the current
+    window with a ``TranscriptCursor`` and asks a background thread, which has its
+    own connection, to load the next window before playback reaches it. Call
+    ``invalidate`` after writing segments for a file, since cached windows are not
+    refreshed on their own.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        window_seconds: float = DEFAULT_WINDOW_SECONDS,
+        max_windows: int = DEFAULT_MAX_WINDOWS,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        prefetch: bool = True,
+    ) -> None:
+        if window_seconds <= 0:
+            raise ValueError("Window length must be positive")
+        if max_windows < 2:
+            raise ValueError("The cache must hold at least two windows")
+        self.connection = connection
+        self.window_seconds = window_seconds
+        self.max_windows = max_windows
+        self.page_size = page_size
+        self.stats = WindowCacheStats()
+        self._windows: OrderedDict[tuple[int, int], TranscriptIndex] = OrderedDict()
+        self._lookback: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._requests: queue.Queue[tuple[int, int] | None] = queue.Queue()
+        self._pending: set[tuple[int, int]] = set()
+        self._prefetcher: threading.Thread | None = None
+        self._cursor: TranscriptCursor | None = None
+        path = db.database_path(connection)
+        if prefetch and path is not None:
+            self._prefetcher = threading.Thread(
+                target=self._prefetch_loop,
+                args=(path,),
+                name="transcript-prefetch",
+                daemon=True,
+            )
+            self._prefetcher.start()
+
+    def window_index(self, position_seconds: float) -> int:
+        return max(int(position_seconds // self.window_seconds), 0)
+
+    def window(self, audio_file_id: int, index: int) -> TranscriptIndex:
+        key = (audio_file_id, index)
+        with self._lock:
+            cached = self._windows.get(key)
+            if cached is not None:
+                self._windows.move_to_end(key)
+                self.stats.hits += 1
+                return cached
+            self.stats.misses += 1
+        loaded = self._load(self.connection, key)
+        self._store(key, loaded)
+        return loaded
+
+    def segments_between(
+        self, audio_file_id: int, start_seconds: float, end_seconds: float
+    ) -> list[TranscriptSegment]:
+        """Segments overlapping ``[start_seconds, end_seconds]``, ordered by start time."""
+        first = self.window_index(start_seconds) - self._lookback_windows(audio_file_id)
+        last = self.window_index(end_seconds)
+        return [
+            segment
+            for index in range(max(first, 0), last + 1)
+            for segment in self.window(audio_file_id, index).segments
+            if segment.end_seconds >= start_seconds and segment.start_seconds <= end_seconds
+        ]
+
+    def segment_at(self, audio_file_id: int, position_seconds: float) -> TranscriptSegment | None:
+        """The earliest-starting segment covering the position, as ``TranscriptIndex`` does."""
+        found = self._locate(audio_file_id, position_seconds)
+        return None if found is None else found[0].segments[found[1]]
+
+    def word_at(
+        self, audio_file_id: int, position_seconds: float
+    ) -> tuple[TranscriptSegment, TranscriptWord] | None:
+        found = self._locate(audio_file_id, position_seconds)
+        if found is None:
+            return None
+        window, index = found
+        timings = window.words(index)
+        word = timings.word_at(position_seconds) if timings else None
+        return None if word is None else (window.segments[index], word)
+
+    def update(self, audio_file_id: int, position_seconds: float) -> TranscriptSegment | None:
+        """Look up the playhead and prefetch the window after it."""
+        current = self.window_index(position_seconds)
+        self.prefetch(audio_file_id, current + 1)
+        first = max(current - self._lookback_windows(audio_file_id), 0)
+        for index in range(first, current):
+            window = self.window(audio_file_id, index)
+            found = window.index_at(position_seconds)
+            if found is not None:
+                return window.segments[found]
+        window = self.window(audio_file_id, current)
+        # A new window object, whether the next one or a reload after eviction,
+        # starts a new cursor; the cursor's first step is then a bisect.
+        if self._cursor is None or self._cursor.index is not window:
+            self._cursor = window.cursor()
+        return self._cursor.update(position_seconds)
+
+    def prefetch(self, audio_file_id: int, index: int) -> None:
+        if self._prefetcher is None:
+            return
+        key = (audio_file_id, index)
+        with self._lock:
+            if key in self._windows or key in self._pending:
+                return
+            self._pending.add(key)
+        self._requests.put(key)
+
+    def invalidate(self, audio_file_id: int | None = None) -> None:
+        with self._lock:
+            for key in list(self._windows):
+                if audio_file_id is None or key[0] == audio_file_id:
+                    del self._windows[key]
+            if audio_file_id is None:
+                self._lookback.clear()
+            else:
+                self._lookback.pop(audio_file_id, None)
+            self._cursor = None
+
+    def close(self) -> None:
+        if self._prefetcher is not None:
+            self._requests.put(None)
+            self._prefetcher.join(timeout=2.0)
+            self._prefetcher = None
+
+    def _locate(
+        self, audio_file_id: int, position_seconds: float
+    ) -> tuple[TranscriptIndex, int] | None:
+        current = self.window_index(position_seconds)
+        first = max(current - self._lookback_windows(audio_file_id), 0)
+        # Earlier windows hold earlier starts, so the first hit is the earliest start.
+        for index in range(first, current + 1):
+            window = self.window(audio_file_id, index)
+            found = window.index_at(position_seconds)
+            if found is not None:
+                return window, found
+        return None
+
+    def _lookback_windows(self, audio_file_id: int) -> int:
+        lookback = self._lookback.get(audio_file_id)
+        if lookback is None:
+            row = self.connection.execute(
+                """
+                SELECT MAX(end_seconds - start_seconds) AS span
+                FROM transcript_segments
+                WHERE audio_file_id = ?
+                """,
+                (audio_file_id,),
+            ).fetchone()
+            lookback = math.ceil((row["span"] or 0.0) / self.window_seconds)
+            self._lookback[audio_file_id] = lookback
+        return lookback
+
+    def _load(self, connection: sqlite3.Connection, key: tuple[int, int]) -> TranscriptIndex:
+        audio_file_id, index = key
+        start = index * self.window_seconds
+        return load_window(
+            connection, audio_file_id, start, start + self.window_seconds, self.page_size
+        )
+
+    def _store(self, key: tuple[int, int], window: TranscriptIndex) -> None:
+        with self._lock:
+            self._windows[key] = window
+            self._windows.move_to_end(key)
+            while len(self._windows) > self.max_windows:
+                self._windows.popitem(last=False)
+                self.stats.evicted += 1
+
+    def _prefetch_loop(self, path: str | Path) -> None:
+        connection = db.connect(path)
+        try:
+            while (key := self._requests.get()) is not None:
+                try:
+                    self._store(key, self._load(connection, key))
+                    self.stats.prefetched += 1
+                except sqlite3.Error:
+                    pass
+                finally:
+                    with self._lock:
+                        self._pending.discard(key)
+        finally:
+            connection.close()
@@ -0,0 +1,496 @@
+"""Background transcription: audio files are split into chunks run on a process pool."""
+from __future__ import annotations
+
+import hashlib
+import importlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from player import db
+from player.audio_cache import TRANSCRIPTION_FORMAT, AudioCache, CachedPcm
+from player.library import list_audio_files
+from player.models import AudioFile, TranscriptSegment
+from player.transcript import INSERT_SEGMENT, segment_row
+from player.word_timings import pack_word_timings
+
+DEFAULT_CHUNK_SECONDS = 30.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+NEXT_CHUNKS = """
+SELECT
+    c.id,
+    c.audio_file_id,
+    c.start_seconds,
+    c.end_seconds,
+    c.attempts,
+    f.path,
+    f.file_hash,
+    COALESCE(
+        (f.order_index, c.end_seconds) > (pf.order_index, p.position_seconds), 1
+    ) AS ahead
+FROM transcription_chunks c
+JOIN audio_files f ON f.id = c.audio_file_id
+LEFT JOIN playback_state p ON p.audiobook_id = f.audiobook_id
+LEFT JOIN audio_files pf ON pf.id = p.audio_file_id
+WHERE c.status = 'pending'
+ORDER BY
+    p.updated_at IS NULL,
+    p.updated_at DESC,
+    f.audiobook_id,
+    ahead DESC,
+    CASE WHEN ahead THEN f.order_index ELSE -f.order_index END,
+    CASE WHEN ahead THEN c.start_seconds ELSE -c.start_seconds END
+LIMIT ?
+""".strip()
+
+
+@dataclass(frozen=True)
+class TranscriptionRequest:
+    chunk_id: int
+    audio_file_id: int
+    audio_path: str
+    start_seconds: float
+    end_seconds: float
+    attempt: int = 1
+    # 16 kHz mono PCM of the whole file in the audio cache, when one is configured.
+    pcm_path: str | None = None
+
+    def open_pcm(self) -> CachedPcm:
+        if self.pcm_path is None:
+            raise ValueError("No cached PCM is available for this request")
+        return CachedPcm(self.pcm_path, TRANSCRIPTION_FORMAT)
+
+
+@dataclass
+class TranscriptionStats:
+    chunks_done: int = 0
+    chunks_retried: int = 0
+    chunks_failed: int = 0
+    segments_written: int = 0
+    elapsed_seconds: float = 0.0
+
+
+@dataclass
+class EnqueueResult:
+    chunks_queued: int = 0
+    # Files left alone because they already have queued chunks or transcript segments.
+    files_skipped: int = 0
+    # Files whose segments and chunks were deleted so they are transcribed again.
+    files_replaced: int = 0
+
+
+class TranscriptionBackend:
+    """Turns one chunk of audio into transcript segments.
+
+    A backend is pickled into every worker process, where ``load`` runs once before
+    the first chunk; expensive setup such as loading a model belongs there rather
+    than in ``__init__``. ``transcribe`` returns segments timed from the start of the
+    file, not of the chunk. Backends that never read the audio set ``uses_audio`` to
+    False, and the scheduler then skips decoding into the PCM cache.
+    """
+
+    uses_audio = True
+
+    def load(self) -> None:
+        pass
+
+    def transcribe(self, request: TranscriptionRequest) -> list[TranscriptSegment]:
+        raise NotImplementedError
+
+
+class FakeBackend(TranscriptionBackend):
+    """Deterministic offline backend for exercising the scheduler.
+
+    Each chunk becomes fixed-length segments of pseudo-words derived from a hash of
+    the file id and segment start, so repeated runs produce identical transcripts.
+    Words are spread evenly over their segment and stored with word timings.
+    """
+
+    WORDS = (
+        "the", "a", "chapter", "said", "river", "night", "house", "light", "voice",
+        "letter", "morning", "road", "window", "silence", "door", "garden",
+    )
+
+    uses_audio = False
+
+    def __init__(
+        self,
+        segment_seconds: float = 5.0,
+        words_per_segment: int = 8,
+        delay_seconds: float = 0.0,
+    ) -> None:
+        if segment_seconds <= 0:
+            raise ValueError("Segment length must be positive")
+        if words_per_segment < 1:
+            raise ValueError("A segment needs at least one word")
+        self.segment_seconds = segment_seconds
+        self.words_per_segment = words_per_segment
+        self.delay_seconds = delay_seconds
+
+    def transcribe(self, request: TranscriptionRequest) -> list[TranscriptSegment]:
+        if self.delay_seconds:
+            time.sleep(self.delay_seconds)
+        segments = []
+        start = request.start_seconds
+        while start < request.end_seconds:
+            end = min(start + self.segment_seconds, request.end_seconds)
+            digest = hashlib.sha256(f"{request.audio_file_id}:{start:.3f}".encode()).digest()
+            words = [
+                self.WORDS[digest[index % len(digest)] % len(self.WORDS)]
+                for index in range(self.words_per_segment)
+            ]
+            step = (end - start) / len(words)
+            timings = []
+            char_start = 0
+            for index, word in enumerate(words):
+                char_end = char_start + len(word)
+                timings.append(
+                    (start + index * step, start + (index + 1) * step, char_start, char_end)
+                )
+                char_start = char_end + 1
+            segments.append(
+                TranscriptSegment(
+                    audio_file_id=request.audio_file_id,
+                    start_seconds=start,
+                    end_seconds=end,
+                    text=" ".join(words),
+                    word_timings=pack_word_timings(start, timings),
+                )
+            )
+            start = end
+        return segments
+
+
+def load_backend(spec: str) -> TranscriptionBackend:
+    """Resolve ``"fake"`` or a ``"package.module:ClassName"`` spec to a backend instance."""
+    if spec == "fake":
+        return FakeBackend()
+    module_name, _, class_name = spec.partition(":")
+    if not module_name or not class_name:
+        raise ValueError(f"Backend must be 'fake' or 'module:ClassName', got {spec!r}")
+    backend = getattr(importlib.import_module(module_name), class_name)()
+    if not isinstance(backend, TranscriptionBackend):
+        raise ValueError(f"{spec} is not a TranscriptionBackend")
+    return backend
+
+
+def chunk_bounds(duration_seconds: float, chunk_seconds: float) -> list[tuple[float, float]]:
+    if chunk_seconds <= 0:
+        raise ValueError("Chunk length must be positive")
+    count = int(duration_seconds // chunk_seconds) + (duration_seconds % chunk_seconds > 0)
+    return [
+        (index * chunk_seconds, min((index + 1) * chunk_seconds, duration_seconds))
+        for index in range(count)
+    ]
+
+
+def enqueue_files(
+    connection: sqlite3.Connection,
+    files: Iterable[AudioFile],
+    chunk_seconds: float = DEFAULT_CHUNK_SECONDS,
+    replace: bool = False,
+) -> EnqueueResult:
+    """Queue the chunks of every file in ``files`` that has no transcript yet.
+
+    A file with queued chunks or transcript segments is skipped: chunks of another
+    length would overlap the existing ones and duplicate segments. With ``replace``
+    its segments and chunks are deleted instead, in the same transaction that
+    queues it again.
+    """
+    result = EnqueueResult()
+    try:
+        for audio_file in files:
+            transcribed = connection.execute(
+                """
+                SELECT EXISTS (SELECT 1 FROM transcription_chunks WHERE audio_file_id = ?)
+                    OR EXISTS (SELECT 1 FROM transcript_segments WHERE audio_file_id = ?)
+                """,
+                (audio_file.id, audio_file.id),
+            ).fetchone()[0]
+            if transcribed:
+                if not replace:
+                    result.files_skipped += 1
+                    continue
+                for table in ("transcript_segments", "transcription_chunks"):
+                    connection.execute(
+                        f"DELETE FROM {table} WHERE audio_file_id = ?", (audio_file.id,)
+                    )
+                result.files_replaced += 1
+            bounds = chunk_bounds(audio_file.duration_seconds, chunk_seconds)
+            connection.executemany(
+                """
+                INSERT INTO transcription_chunks (audio_file_id, start_seconds, end_seconds)
+                VALUES (?, ?, ?)
+                """,
+                ((audio_file.id, start, end) for start, end in bounds),
+            )
+            result.chunks_queued += len(bounds)
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+    return result
+
+
+def enqueue_audiobook(
+    connection: sqlite3.Connection,
+    audiobook_id: int,
+    chunk_seconds: float = DEFAULT_CHUNK_SECONDS,
+    replace: bool = False,
+) -> EnqueueResult:
+    return enqueue_files(
+        connection, list_audio_files(connection, audiobook_id), chunk_seconds, replace
+    )
+
+
+def recover_interrupted(connection: sqlite3.Connection) -> int:
+    """Return chunks left running by a crashed scheduler to the queue."""
+    cursor = connection.execute(
+        "UPDATE transcription_chunks SET status = ? WHERE status = ?", (PENDING, RUNNING)
+    )
+    connection.commit()
+    return cursor.rowcount
+
+
+def transcription_progress(
+    connection: sqlite3.Connection, audiobook_id: int | None = None
+) -> dict[str, int]:
+    rows = connection.execute(
+        """
+        SELECT c.status, COUNT(*) AS chunks
+        FROM transcription_chunks c
+        JOIN audio_files f ON f.id = c.audio_file_id
+        WHERE ? IS NULL OR f.audiobook_id = ?
+        GROUP BY c.status
+        """,
+        (audiobook_id, audiobook_id),
+    )
+    return {row["status"]: row["chunks"] for row in rows}
+
+
+_worker_backend: TranscriptionBackend | None = None
+
+
+def _init_worker(backend: TranscriptionBackend) -> None:
+    global _worker_backend
+    backend.load()
+    _worker_backend = backend
+
+
+def _transcribe(request: TranscriptionRequest) -> list[TranscriptSegment]:
+    return _worker_backend.transcribe(request)
+
+
+class TranscriptionScheduler:
+    """Runs queued chunks on a process pool, nearest to each book's playhead first.
+
+    The queue lives in ``transcription_chunks``: a chunk is marked running when it is
+    handed to a worker and done in the same transaction that stores its segments,
+    so a crash loses at most the chunks in flight, which ``run`` requeues on start.
+    The pool is kept ``backlog_per_worker`` chunks deep per worker and refilled from
+    a fresh priority query after every completion, so a moving playhead is followed
+    within a chunk or two. Failed chunks are retried up to ``max_attempts`` times.
+    Run at most one scheduler per database.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        backend: TranscriptionBackend,
+        workers: int | None = None,
+        audio_cache: AudioCache | None = None,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        backlog_per_worker: int = 2,
+    ) -> None:
+        self.connection = connection
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.audio_cache = audio_cache
+        self.max_attempts = max_attempts
+        self.backlog_per_worker = backlog_per_worker
+        self._pcm_paths: dict[int, str] = {}
+        self._pcm_errors: dict[int, str] = {}
+
+    def run(
+        self,
+        stop: threading.Event | None = None,
+        progress: Callable[[TranscriptionRequest, int], None] | None = None,
+    ) -> TranscriptionStats:
+        """Transcribe queued chunks until the queue is empty or ``stop`` is set.
+
+        ``progress`` is called with each finished request and its segment count.
+        """
+        stats = TranscriptionStats()
+        started = time.perf_counter()
+        recover_interrupted(self.connection)
+        in_flight: dict[Future, TranscriptionRequest] = {}
+        # Spawned rather than forked, for the same reason as the scanner's hash pool.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.backend,),
+        ) as pool:
+            while True:
+                stopping = stop is not None and stop.is_set()
+                if stopping:
+                    self._cancel_queued(in_flight)
+                else:
+                    queued = self._fill(pool, in_flight, stats)
+                    if not in_flight and queued:
+                        # Every chunk just taken failed before reaching a worker; the
+                        # queue may still hold more.
+                        continue
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+                if done:
+                    completed = [(in_flight.pop(future), future) for future in done]
+                    self._record(completed, stats)
+                    if progress:
+                        for request, future in completed:
+                            if future.exception() is None:
+                                progress(request, len(future.result()))
+        stats.elapsed_seconds = time.perf_counter() - started
+        return stats
+
+    def _fill(
+        self,
+        pool: ProcessPoolExecutor,
+        in_flight: dict[Future, TranscriptionRequest],
+        stats: TranscriptionStats,
+    ) -> bool:
+        """Hand queued chunks to the pool; returns whether any were taken from the queue."""
+        capacity = self.workers * self.backlog_per_worker - len(in_flight)
+        if capacity <= 0:
+            return True
+        rows = self.connection.execute(NEXT_CHUNKS, (capacity,)).fetchall()
+        if not rows:
+            return False
+        # A file whose decode failed in an earlier batch is tried again.
+        self._pcm_errors.clear()
+        self.connection.executemany(
+            """
+            UPDATE transcription_chunks
+            SET status = ?, attempts = attempts + 1, updated_at = datetime('now')
+            WHERE id = ?
+            """,
+            [(RUNNING, row["id"]) for row in rows],
+        )
+        self.connection.commit()
+        for row in rows:
+            try:
+                pcm_path = self._pcm_path(row)
+            except Exception as exc:  # noqa: BLE001 - recorded against the chunk
+                status = self._failure_status(row["attempts"] + 1, stats)
+                self._set_status(row["id"], status, str(exc) or type(exc).__name__)
+                continue
+            request = TranscriptionRequest(
+                chunk_id=row["id"],
+                audio_file_id=row["audio_file_id"],
+                audio_path=row["path"],
+                start_seconds=row["start_seconds"],
+                end_seconds=row["end_seconds"],
+                attempt=row["attempts"] + 1,
+                pcm_path=pcm_path,
+            )
+            in_flight[pool.submit(_transcribe, request)] = request
+        return True
+
+    def _pcm_path(self, row: sqlite3.Row) -> str | None:
+        if self.audio_cache is None or not self.backend.uses_audio:
+            return None
+        audio_file_id = row["audio_file_id"]
+        if audio_file_id in self._pcm_errors:
+            raise RuntimeError(self._pcm_errors[audio_file_id])
+        if audio_file_id not in self._pcm_paths:
+            try:
+                file_hash = row["file_hash"]
+                if file_hash is None:
+                    from player.scanner import store_file_hash
+
+                    file_hash = store_file_hash(self.connection, audio_file_id, row["path"])
+                with self.audio_cache.ensure(row["path"], file_hash, TRANSCRIPTION_FORMAT) as pcm:
+                    self._pcm_paths[audio_file_id] = str(pcm.path)
+            except Exception as exc:
+                self._pcm_errors[audio_file_id] = str(exc)
+                raise
+        return self._pcm_paths[audio_file_id]
+
+    def _record(
+        self, completed: list[tuple[TranscriptionRequest, Future]], stats: TranscriptionStats
+    ) -> None:
+        """Store the segments of every finished chunk and update the queue in one commit."""
+        segments: list[TranscriptSegment] = []
+        updates: list[tuple[str, str | None, int]] = []
+        for request, future in completed:
+            error = future.exception()
+            if error is None:
+                segments.extend(future.result())
+                updates.append((DONE, None, request.chunk_id))
+                stats.chunks_done += 1
+            else:
+                status = self._failure_status(request.attempt, stats)
+                updates.append((status, str(error) or type(error).__name__, request.chunk_id))
+        rows = (segment_row(segment) for segment in segments)
+        try:
+            for ids in db.insert_rows(self.connection, INSERT_SEGMENT, rows):
+                stats.segments_written += len(ids)
+            self.connection.executemany(
+                """
+                UPDATE transcription_chunks
+                SET status = ?, error = ?, updated_at = datetime('now')
+                WHERE id = ?
+                """,
+                updates,
+            )
+        except BaseException:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+
+    def _failure_status(self, attempt: int, stats: TranscriptionStats) -> str:
+        """Queue a failed chunk for another attempt, or fail it once attempts run out."""
+        if attempt >= self.max_attempts:
+            stats.chunks_failed += 1
+            return FAILED
+        stats.chunks_retried += 1
+        return PENDING
+
+    def _cancel_queued(self, in_flight: dict[Future, TranscriptionRequest]) -> None:
+        """Hand chunks that have not started back to the queue without using an attempt."""
+        cancelled = [future for future in in_flight if future.cancel()]
+        if not cancelled:
+            return
+        self.connection.executemany(
+            """
+            UPDATE transcription_chunks
+            SET status = ?, attempts = attempts - 1
+            WHERE id = ?
+            """,
+            [(PENDING, in_flight.pop(future).chunk_id) for future in cancelled],
+        )
+        self.connection.commit()
+
+    def _set_status(self, chunk_id: int, status: str, error: str | None = None) -> None:
+        self.connection.execute(
+            """
+            UPDATE transcription_chunks
+            SET status = ?, error = ?, updated_at = datetime('now')
+            WHERE id = ?
+            """,
+            (status, error, chunk_id),
+        )
+        self.connection.commit()
@@ -0,0 +1,424 @@
+"""Precomputed waveform pyramids and silence maps per audio file, keyed by content hash.
+
+One analysis pass over a file's 16 kHz mono PCM (from the ``AudioCache``) yields:
+
+- A peak/RMS pyramid. Level 0 has one bin per ``BIN_FRAMES`` frames (64 ms) and
+  every further level halves the resolution, so any zoom level is drawn from at
+  most about two bins per pixel.
+- A silence map: intervals whose 16 ms windows all stay below a threshold for at
+  least ``min_silence_seconds``. Seeks can snap to these pauses, and playback can
+  skip them without looking at the audio again.
+
+Both are stored in ``audio_analysis``. Levels are uint8 on a square-root scale
+(``(q / 255) ** 2`` is the amplitude as a fraction of full scale), concatenated and
+zlib-compressed: under 4 KiB a minute before compression. Silences are int32
+milliseconds laid out as a column of starts followed by a column of ends.
+
+Analysis and ``render`` need NumPy; ``SilenceMap`` does not.
+"""
+from __future__ import annotations
+
+import math
+import sqlite3
+import sys
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Sequence
+
+from player.audio_cache import TRANSCRIPTION_FORMAT, AudioCache, CachedPcm
+from player.models import AudioFile
+
+FORMAT_VERSION = 1
+WINDOW_FRAMES = 256
+# Level 0 bins are four silence windows wide.
+BIN_FRAMES = 4 * WINDOW_FRAMES
+DEFAULT_SILENCE_THRESHOLD_DB = -45.0
+DEFAULT_MIN_SILENCE_SECONDS = 0.25
+# Windows analysed per NumPy step: about 16 MiB of float32 at a time.
+_BLOCK_WINDOWS = 16384
+_FULL_SCALE = 32768.0
+
+INSERT_ANALYSIS = """
+INSERT INTO audio_analysis (
+    file_hash, format_version, sample_rate, bin_frames, frames,
+    silence_threshold_db, min_silence_seconds, levels, silences
+)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(file_hash) DO UPDATE SET
+    format_version = excluded.format_version,
+    sample_rate = excluded.sample_rate,
+    bin_frames = excluded.bin_frames,
+    frames = excluded.frames,
+    silence_threshold_db = excluded.silence_threshold_db,
+    min_silence_seconds = excluded.min_silence_seconds,
+    levels = excluded.levels,
+    silences = excluded.silences,
+    created_at = datetime('now')
+""".strip()
+
+
+def _numpy():
+    # Imported on first use, so loading stored silence maps never pays for NumPy.
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("NumPy is required for waveform analysis") from None
+    return numpy
+
+
+def level_lengths(frames: int, bin_frames: int = BIN_FRAMES) -> list[int]:
+    """Bin count of every pyramid level, finest first, down to a single bin."""
+    lengths = [max(1, math.ceil(frames / bin_frames))]
+    while lengths[-1] > 1:
+        lengths.append(math.ceil(lengths[-1] / 2))
+    return lengths
+
+
+def _quantize(values) -> bytes:
+    np = _numpy()
+    return np.rint(np.sqrt(np.clip(values, 0.0, 1.0)) * 255).astype(np.uint8).tobytes()
+
+
+def _dequantize(values):
+    return (values.astype(_numpy().float32) / 255) ** 2
+
+
+class SilenceMap:
+    """Sorted, non-overlapping silent intervals of one file, in seconds."""
+
+    def __init__(self, starts_ms: array, ends_ms: array) -> None:
+        self._starts_ms = starts_ms
+        self._ends_ms = ends_ms
+        self.starts = [value / 1000 for value in starts_ms]
+        self.ends = [value / 1000 for value in ends_ms]
+
+    @classmethod
+    def from_intervals(cls, intervals: Iterable[tuple[float, float]]) -> SilenceMap:
+        starts, ends = array("i"), array("i")
+        for start, end in intervals:
+            starts.append(round(start * 1000))
+            ends.append(round(end * 1000))
+        return cls(starts, ends)
+
+    @classmethod
+    def unpack(cls, blob: bytes) -> SilenceMap:
+        values = array("i")
+        values.frombytes(blob)
+        if sys.byteorder == "big":
+            values.byteswap()
+        count = len(values) // 2
+        return cls(values[:count], values[count:])
+
+    def pack(self) -> bytes:
+        values = self._starts_ms + self._ends_ms
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values.tobytes()
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def silence_at(self, position_seconds: float) -> tuple[float, float] | None:
+        index = bisect_right(self.starts, position_seconds) - 1
+        if index >= 0 and position_seconds < self.ends[index]:
+            return self.starts[index], self.ends[index]
+        return None
+
+    def snap_to_pause(
+        self,
+        position_seconds: float,
+        max_distance_seconds: float = 3.0,
+        min_pause_seconds: float = 0.3,
+        lead_seconds: float = 0.1,
+    ) -> float:
+        """Move a seek target into the nearest pause, just before speech resumes.
+
+        Only pauses of at least ``min_pause_seconds`` count, so seeks land between
+        sentences rather than between words. The target is returned unchanged when
+        no pause is within ``max_distance_seconds``.
+        """
+        best, best_distance = position_seconds, max_distance_seconds
+        index = bisect_left(self.ends, position_seconds)
+        # Walk outwards from the pause at or after the target in both directions.
+        for step in (1, -1):
+            candidate = index if step == 1 else index - 1
+            while 0 <= candidate < len(self.starts):
+                start, end = self.starts[candidate], self.ends[candidate]
+                gap = start - position_seconds if step == 1 else position_seconds - end
+                if gap > best_distance:
+                    break
+                if end - start >= min_pause_seconds:
+                    target = end - min(lead_seconds, (end - start) / 2)
+                    distance = abs(target - position_seconds)
+                    if distance < best_distance:
+                        best, best_distance = target, distance
+                candidate += step
+        return best
+
+    def skippable(
+        self, min_silence_seconds: float = 0.6, keep_seconds: float = 0.2
+    ) -> list[tuple[float, float]]:
+        """Intervals to drop when skipping silence, keeping a short pause at each edge."""
+        return [
+            (start + keep_seconds, end - keep_seconds)
+            for start, end in self
+            if end - start >= max(min_silence_seconds, 2 * keep_seconds)
+        ]
+
+
+class AudioAnalysis:
+    """Waveform pyramid and silence map for one file."""
+
+    def __init__(
+        self,
+        sample_rate: int,
+        frames: int,
+        levels: Sequence[tuple[bytes, bytes]],
+        silences: SilenceMap,
+        bin_frames: int = BIN_FRAMES,
+        silence_threshold_db: float = DEFAULT_SILENCE_THRESHOLD_DB,
+        min_silence_seconds: float = DEFAULT_MIN_SILENCE_SECONDS,
+    ) -> None:
+        self.sample_rate = sample_rate
+        self.frames = frames
+        self.bin_frames = bin_frames
+        # (peaks, rms) per level as quantized bytes; decoded per render call.
+        self.levels = tuple(levels)
+        self.silences = silences
+        self.silence_threshold_db = silence_threshold_db
+        self.min_silence_seconds = min_silence_seconds
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.frames / self.sample_rate
+
+    def bin_seconds(self, level: int) -> float:
+        return self.bin_frames * 2**level / self.sample_rate
+
+    def level_for(self, seconds_per_pixel: float) -> int:
+        """Coarsest level with at least one bin per pixel."""
+        if seconds_per_pixel <= self.bin_seconds(0):
+            return 0
+        level = int(math.log2(seconds_per_pixel / self.bin_seconds(0)))
+        return min(level, len(self.levels) - 1)
+
+    def render(self, start_seconds: float, end_seconds: float, pixels: int):
+        """Per-pixel ``(peaks, rms)`` float32 arrays for ``[start, end)``, as full-scale fractions.
+
+        Reads at most about two bins per pixel from the chosen level, so the cost is
+        O(pixels) at any zoom. Zooming in past level 0 repeats bins.
+        """
+        np = _numpy()
+        if pixels <= 0 or end_seconds <= start_seconds:
+            raise ValueError("Need a positive width and a non-empty time range")
+        level = self.level_for((end_seconds - start_seconds) / pixels)
+        peaks_blob, rms_blob = self.levels[level]
+        bins = len(peaks_blob)
+        bin_seconds = self.bin_seconds(level)
+        edges = np.floor(np.linspace(start_seconds, end_seconds, pixels + 1) / bin_seconds)
+        edges = np.clip(edges.astype(np.int64), 0, bins - 1)
+        # Pixel i covers bins [starts[i], stops[i]); at least one bin each, which
+        # repeats bins when zoomed in past level 0.
+        starts = edges[:-1]
+        stops = np.minimum(np.maximum(edges[1:], starts + 1), bins)
+        first, last = int(starts[0]), int(stops.max())
+        peaks = _dequantize(np.frombuffer(peaks_blob, np.uint8, last - first, first))
+        power = _dequantize(np.frombuffer(rms_blob, np.uint8, last - first, first)) ** 2
+        # reduceat sums up to the next start, or the single bin at a start when the
+        # next start is not greater; stop the last pixel at its own end.
+        offsets = starts - first
+        peaks, power = peaks[: stops[-1] - first], power[: stops[-1] - first]
+        pixel_peaks = np.maximum.reduceat(peaks, offsets)
+        pixel_rms = np.sqrt(np.add.reduceat(power, offsets) / (stops - starts))
+        return pixel_peaks, pixel_rms.astype(np.float32)
+
+
+def analyze_pcm(
+    samples,
+    sample_rate: int,
+    silence_threshold_db: float = DEFAULT_SILENCE_THRESHOLD_DB,
+    min_silence_seconds: float = DEFAULT_MIN_SILENCE_SECONDS,
+) -> AudioAnalysis:
+    """Analyse a ``(frames, channels)`` int16 array, ``WINDOW_FRAMES`` at a time.
+
+    Channels are folded by taking the loudest for peaks and the mean power for RMS.
+    The input is processed in blocks, so a memory-mapped multi-hour file never has
+    to be converted to floating point all at once.
+    """
+    np = _numpy()
+    frames = len(samples)
+    windows = math.ceil(frames / WINDOW_FRAMES)
+    window_peaks = np.zeros(windows, dtype=np.float32)
+    window_power = np.zeros(windows, dtype=np.float64)
+    block_frames = _BLOCK_WINDOWS * WINDOW_FRAMES
+    for first in range(0, frames, block_frames):
+        block = samples[first : first + block_frames].astype(np.float32) / _FULL_SCALE
+        count = math.ceil(len(block) / WINDOW_FRAMES)
+        padded = np.zeros((count * WINDOW_FRAMES, block.shape[1]), dtype=np.float32)
+        padded[: len(block)] = block
+        shaped = padded.reshape(count, WINDOW_FRAMES, -1)
+        index = first // WINDOW_FRAMES
+        window_peaks[index : index + count] = np.abs(shaped).max(axis=(1, 2))
+        window_power[index : index + count] = np.square(shaped).mean(axis=(1, 2))
+    # The final window's mean includes padding; rescale it to the frames it holds.
+    tail = frames - (windows - 1) * WINDOW_FRAMES
+    if windows and tail < WINDOW_FRAMES:
+        window_power[-1] *= WINDOW_FRAMES / tail
+
+    group = BIN_FRAMES // WINDOW_FRAMES
+    bins = math.ceil(windows / group) if windows else 1
+    peaks = np.zeros(bins * group, dtype=np.float32)
+    power = np.zeros(bins * group, dtype=np.float64)
+    peaks[:windows] = window_peaks
+    power[:windows] = window_power
+    peaks = peaks.reshape(bins, group).max(axis=1)
+    weights = np.zeros(bins * group)
+    weights[:windows] = 1
+    power = power.reshape(bins, group).sum(axis=1) / np.maximum(
+        weights.reshape(bins, group).sum(axis=1), 1
+    )
+
+    levels = []
+    while True:
+        levels.append((_quantize(peaks), _quantize(np.sqrt(power))))
+        if len(peaks) <= 1:
+            break
+        even = len(peaks) - len(peaks) % 2
+        pair_peaks = peaks[:even].reshape(-1, 2).max(axis=1)
+        pair_power = power[:even].reshape(-1, 2).mean(axis=1)
+        peaks = np.concatenate((pair_peaks, peaks[even:]))
+        power = np.concatenate((pair_power, power[even:]))
+
+    threshold = 10 ** (silence_threshold_db / 10)
+    silent = np.concatenate(([False], window_power < threshold, [False]))
+    changes = np.flatnonzero(np.diff(silent.astype(np.int8)))
+    run_starts, run_ends = changes[0::2], changes[1::2]
+    window_seconds = WINDOW_FRAMES / sample_rate
+    long_enough = (run_ends - run_starts) * window_seconds >= min_silence_seconds
+    duration = frames / sample_rate
+    silences = SilenceMap.from_intervals(
+        (start * window_seconds, min(end * window_seconds, duration))
+        for start, end in zip(run_starts[long_enough], run_ends[long_enough])
+    )
+    return AudioAnalysis(
+        sample_rate,
+        frames,
+        levels,
+        silences,
+        BIN_FRAMES,
+        silence_threshold_db,
+        min_silence_seconds,
+    )
+
+
+def analyze_cached(cached: CachedPcm, **options) -> AudioAnalysis:
+    return analyze_pcm(cached.samples(), cached.format.sample_rate, **options)
+
+
+def store_analysis(connection: sqlite3.Connection, file_hash: str, analysis: AudioAnalysis) -> None:
+    levels = zlib.compress(b"".join(peaks + rms for peaks, rms in analysis.levels))
+    connection.execute(
+        INSERT_ANALYSIS,
+        (
+            file_hash,
+            FORMAT_VERSION,
+            analysis.sample_rate,
+            analysis.bin_frames,
+            analysis.frames,
+            analysis.silence_threshold_db,
+            analysis.min_silence_seconds,
+            levels,
+            analysis.silences.pack(),
+        ),
+    )
+    connection.commit()
+
+
+def load_analysis(connection: sqlite3.Connection, file_hash: str) -> AudioAnalysis | None:
+    row = connection.execute(
+        """
+        SELECT sample_rate, bin_frames, frames, silence_threshold_db,
+               min_silence_seconds, levels, silences
+        FROM audio_analysis
+        WHERE file_hash = ? AND format_version = ?
+        """,
+        (file_hash, FORMAT_VERSION),
+    ).fetchone()
+    if row is None:
+        return None
+    data = zlib.decompress(row["levels"])
+    levels = []
+    offset = 0
+    for length in level_lengths(row["frames"], row["bin_frames"]):
+        levels.append((data[offset : offset + length], data[offset + length : offset + 2 * length]))
+        offset += 2 * length
+    return AudioAnalysis(
+        row["sample_rate"],
+        row["frames"],
+        levels,
+        SilenceMap.unpack(row["silences"]),
+        row["bin_frames"],
+        row["silence_threshold_db"],
+        row["min_silence_seconds"],
+    )
+
+
+def load_silence_maps(
+    connection: sqlite3.Connection, files: Iterable[AudioFile]
+) -> dict[int, SilenceMap]:
+    """Silence maps of every analysed file in ``files``, by audio file id, in one query.
+
+    Only the silence column is read, so this is cheap enough to run when a book is
+    loaded for playback.
+    """
+    ids_by_hash: dict[str, list[int]] = {}
+    for audio_file in files:
+        if audio_file.file_hash:
+            ids_by_hash.setdefault(audio_file.file_hash, []).append(audio_file.id)
+    if not ids_by_hash:
+        return {}
+    placeholders = ", ".join("?" * len(ids_by_hash))
+    rows = connection.execute(
+        f"""
+        SELECT file_hash, silences FROM audio_analysis
+        WHERE format_version = ? AND file_hash IN ({placeholders})
+        """,
+        (FORMAT_VERSION, *ids_by_hash),
+    ).fetchall()
+    maps: dict[int, SilenceMap] = {}
+    for row in rows:
+        silence_map = SilenceMap.unpack(row["silences"])
+        for audio_file_id in ids_by_hash[row["file_hash"]]:
+            maps[audio_file_id] = silence_map
+    return maps
+
+
+def analyze_file(
+    connection: sqlite3.Connection,
+    audio_cache: AudioCache,
+    audio_file: AudioFile,
+    force: bool = False,
+    **options,
+) -> AudioAnalysis:
+    """Return the stored analysis for ``audio_file``, computing and storing it if needed.
+
+    Files without a stored hash are hashed first and the hash is saved, since
+    analyses are keyed by content.
+    """
+    file_hash = audio_file.file_hash
+    if file_hash is None:
+        from player.scanner import store_file_hash
+
+        file_hash = store_file_hash(connection, audio_file.id, audio_file.path)
+    if not force:
+        stored = load_analysis(connection, file_hash)
+        if stored is not None:
+            return stored
+    with audio_cache.ensure(audio_file.path, file_hash, TRANSCRIPTION_FORMAT) as cached:
+        analysis = analyze_cached(cached, **options)
+    store_analysis(connection, file_hash, analysis)
+    return analysis
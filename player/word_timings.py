@@ -0,0 +1,125 @@
+"""Word timings packed into one blob per transcript segment and decoded on demand."""
+from __future__ import annotations
+
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from typing import Iterable, Iterator, Sequence
+
+from player.models import TranscriptWord
+
+FORMAT_VERSION = 1
+# version, word count
+_HEADER = struct.Struct("<BI")
+
+
+def pack_word_timings(
+    segment_start_seconds: float, timings: Sequence[tuple[float, float, int, int]]
+) -> bytes:
+    """Pack ``(start_seconds, end_seconds, char_start, char_end)`` per word.
+
+    Times are stored as int32 milliseconds from the segment start and character
+    offsets index into the segment text. Values are laid out column by column, so
+    decoding yields one contiguous array per field: 16 bytes a word.
+    """
+    count = len(timings)
+    values = array("i", bytes(16 * count))
+    for index, (start, end, char_start, char_end) in enumerate(timings):
+        values[index] = round((start - segment_start_seconds) * 1000)
+        values[count + index] = round((end - segment_start_seconds) * 1000)
+        values[2 * count + index] = char_start
+        values[3 * count + index] = char_end
+    if sys.byteorder == "big":
+        values.byteswap()
+    return _HEADER.pack(FORMAT_VERSION, count) + values.tobytes()
+
+
+def align_words(
+    text: str, words: Iterable[tuple[str, float, float]]
+) -> list[tuple[float, float, int, int]]:
+    """Locate each ``(word, start, end)`` in ``text``, scanning left to right."""
+    timings = []
+    cursor = 0
+    for word, start, end in words:
+        word = word.strip()
+        if not word:
+            continue
+        char_start = text.find(word, cursor)
+        if char_start < 0:
+            raise ValueError(f"Word {word!r} not found in segment text after offset {cursor}")
+        cursor = char_start + len(word)
+        timings.append((start, end, char_start, cursor))
+    return timings
+
+
+def pack_words(
+    text: str, segment_start_seconds: float, words: Iterable[tuple[str, float, float]]
+) -> bytes:
+    return pack_word_timings(segment_start_seconds, align_words(text, words))
+
+
+def word_count(blob: bytes) -> int:
+    version, count = _HEADER.unpack_from(blob)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported word timing format version {version}")
+    return count
+
+
+class WordTimings:
+    """Lookup over one segment's packed word timings.
+
+    The blob is only unpacked on the first lookup, so loading a transcript costs
+    nothing for segments that are never highlighted.
+    """
+
+    def __init__(self, blob: bytes, segment_start_seconds: float, text: str) -> None:
+        self._blob = blob
+        self._count = word_count(blob)
+        self.segment_start_seconds = segment_start_seconds
+        self.text = text
+        self._columns: tuple[array, array, array, array] | None = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[TranscriptWord]:
+        return (self.word(index) for index in range(self._count))
+
+    def _decode(self) -> tuple[array, array, array, array]:
+        if self._columns is None:
+            values = array("i")
+            values.frombytes(memoryview(self._blob)[_HEADER.size :])
+            if sys.byteorder == "big":
+                values.byteswap()
+            count = self._count
+            self._columns = (
+                values[:count],
+                values[count : 2 * count],
+                values[2 * count : 3 * count],
+                values[3 * count :],
+            )
+        return self._columns
+
+    def index_at(self, position_seconds: float) -> int | None:
+        """Index of the word being spoken at ``position_seconds``, or None between words."""
+        starts, ends, _, _ = self._decode()
+        offset_ms = (position_seconds - self.segment_start_seconds) * 1000
+        index = bisect_right(starts, offset_ms) - 1
+        if index < 0 or offset_ms > ends[index]:
+            return None
+        return index
+
+    def word(self, index: int) -> TranscriptWord:
+        starts, ends, char_starts, char_ends = self._decode()
+        return TranscriptWord(
+            text=self.text[char_starts[index] : char_ends[index]],
+            start_seconds=self.segment_start_seconds + starts[index] / 1000,
+            end_seconds=self.segment_start_seconds + ends[index] / 1000,
+            char_start=char_starts[index],
+            char_end=char_ends[index],
+        )
+
+    def word_at(self, position_seconds: float) -> TranscriptWord | None:
+        index = self.index_at(position_seconds)
+        return None if index is None else self.word(index)